@@ -53,8 +53,15 @@ class ActivityAdmin(admin.ModelAdmin):
     def save_related(self, request, form, formsets, change):
         super().save_related(request, form, formsets, change)
         # At this point, all the related objects (ActivityOffers) are saved
-        if not change:  # If the activity is being created
-            form.instance.create_periods()
+        # If the activity is being created, virtual slot activities have
+        # nothing to generate
+        if not change and not form.instance.virtual_slots:
+            report = form.instance.create_periods()
+            self.message_user(
+                request,
+                f"Generated {report['periods']} periods for {report['offers']} "
+                f"offers over {report['days']} days in {report['seconds']}s.",
+            )
 
 
 admin.site.register(Period)
@@ -1,4 +1,5 @@
-from django.db import models
+import time
+from django.db import models, transaction
 from users.models import Supplier
 from categories.models import Category
 from location.models import Location
@@ -14,6 +15,9 @@ class Activity(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     requests = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # also bumped when a child row (offers, faqs, catalog...) changes,
+    # the detail endpoint's ETag/Last-Modified are derived from it
+    updated_at = models.DateTimeField(auto_now=True)
     available_from = models.DateField()
     available_to = models.DateField()
     # map here is an html iframe from google maps
@@ -32,6 +36,12 @@ class Activity(models.Model):
 
     start_time = models.TimeField(help_text="Start time of the activity")
     end_time = models.TimeField(help_text="End time of the activity")
+    # slots are computed from the schedule above instead of stored, only
+    # the ones that change (booked, blocked, repriced) get a Period row.
+    # see activities.slots
+    virtual_slots = models.BooleanField(
+        default=False, help_text="Compute time slots from the schedule"
+    )
 
     # the model will be deleted if you delete the location where it is in.
     # is this right ?
@@ -44,36 +54,88 @@ class Activity(models.Model):
 
     class Meta:
         verbose_name_plural = "activities"
+        indexes = [models.Index(fields=["created_at", "id"])]
 
     def __str__(self):
         return self.title
 
-    def create_periods(self):
-        offers = self.offers.all()  # Use the related name to get the offers
-        for offer in offers:
+    def get_days_off(self):
+        # e.g. "Saturday, sunday" -> {"saturday", "sunday"}
+        return {day.strip().lower() for day in (self.days_off or "").split(",")}
+
+    def get_slot_times(self):
+        """
+        The (time_from, time_to) pairs of one day's slots.
+        """
+        period_duration = timedelta(minutes=self.period)
+        if not period_duration:
+            return []
+        # any date works, it only anchors the times
+        day = datetime(2000, 1, 1)
+        period_start = datetime.combine(day, self.start_time)
+        day_end = datetime.combine(day, self.end_time)
+        slots = []
+        while period_start + period_duration <= day_end:
+            period_end = period_start + period_duration
+            slots.append((period_start.time(), period_end.time()))
+            period_start = period_end
+        return slots
+
+    def create_periods(self, batch_size=1000):
+        """
+        Generates the periods of every offer for every day of the
+        availability range except the days off. Rows are built in memory
+        and written with chunked bulk inserts inside one transaction.
+        Returns what was generated and how long it took.
+        """
+        started = time.monotonic()
+        if self.virtual_slots:
+            # nothing to store, the slots are computed when asked for
+            return {"offers": 0, "days": 0, "periods": 0, "seconds": 0}
+        offers = list(self.offers.all())  # Use the related name to get the offers
+        slot_times = self.get_slot_times()
+        days_off = self.get_days_off()
+        days = 0
+        created = 0
+        periods = []
+        with transaction.atomic():
             current_date = self.available_from
-            delta = timedelta(days=1)
-            period_duration = timedelta(minutes=self.period)
-
-            activity_start_time = self.start_time
-            activity_end_time = self.end_time
-
             while current_date <= self.available_to:
-                period_start_time = datetime.combine(current_date, activity_start_time)
-                period_end_time = period_start_time + period_duration
-
-                while period_end_time.time() <= activity_end_time:
-                    Period.objects.create(
-                        day=current_date,
-                        time_from=period_start_time.time(),
-                        time_to=period_end_time.time(),
-                        stock=offer.stock,
-                        activity_offer=offer,
-                        price=offer.price,
-                    )
-                    period_start_time = period_end_time
-                    period_end_time = period_start_time + period_duration
-                current_date += delta
+                if current_date.strftime("%A").lower() not in days_off:
+                    days += 1
+                    for offer in offers:
+                        for time_from, time_to in slot_times:
+                            periods.append(
+                                Period(
+                                    day=current_date,
+                                    time_from=time_from,
+                                    time_to=time_to,
+                                    stock=offer.stock,
+                                    activity_offer=offer,
+                                    price=offer.price,
+                                )
+                            )
+                    if len(periods) >= batch_size:
+                        created += self._store_periods(periods, batch_size)
+                        periods = []
+                current_date += timedelta(days=1)
+            created += self._store_periods(periods, batch_size)
+        return {
+            "offers": len(offers),
+            "days": days,
+            "periods": created,
+            "seconds": round(time.monotonic() - started, 3),
+        }
+
+    @staticmethod
+    def _store_periods(periods, batch_size):
+        # bulk_create skips post_save, the opening stock movements are
+        # written here instead
+        from booking import ledger
+
+        Period.objects.bulk_create(periods, batch_size=batch_size)
+        ledger.record_created(Period, periods)
+        return len(periods)
 
 
 class ActivityOffer(models.Model):
@@ -98,6 +160,24 @@ class Period(models.Model):
         ActivityOffer, on_delete=models.CASCADE, related_name="periods"
     )
 
+    class Meta:
+        # per offer date range scans (day listings, calendar)
+        indexes = [models.Index(fields=["activity_offer", "day"])]
+        # one row per slot, virtual slot overrides are created on demand
+        # and rely on it to stay single under concurrent bookings
+        constraints = [
+            models.UniqueConstraint(
+                fields=["activity_offer", "day", "time_from"],
+                name="unique_period_slot",
+            )
+        ]
+
+    @property
+    def slot_key(self):
+        from .slots import slot_key
+
+        return slot_key(self.activity_offer_id, self.day, self.time_from)
+
 
 class Included(models.Model):
     include = models.CharField(max_length=350)
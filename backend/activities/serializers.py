@@ -1,8 +1,19 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 from .models import Activity, Period, Included, Excluded, Faq, Catalog, ActivityOffer
 from users.models import Supplier
 from categories.models import Category
 from location.serializers import LocationSerializer
+from api.eager import EagerLoadingMixin, SparseFieldsMixin
+from booking.inventory import AvailableField
+
+ACTIVITY_PREFETCH = [
+    "categories",
+    "included_set",
+    "excluded_set",
+    "faq_set",
+    "catalog_set",
+]
 
 
 class IncludedSerializer(serializers.ModelSerializer):
@@ -29,7 +40,7 @@ class CatalogSerializer(serializers.ModelSerializer):
         fields = ["id", "image"]
 
 
-class OffActivitySerializer(serializers.ModelSerializer):
+class OffActivitySerializer(EagerLoadingMixin, serializers.ModelSerializer):
     included_items = IncludedSerializer(
         many=True, read_only=True, source="included_set"
     )
@@ -44,6 +55,9 @@ class OffActivitySerializer(serializers.ModelSerializer):
     )
     location = LocationSerializer()
 
+    select_related_fields = ["location"]
+    prefetch_related_fields = ACTIVITY_PREFETCH
+
     class Meta:
         model = Activity
         fields = [
@@ -78,9 +92,11 @@ class OffActivitySerializer(serializers.ModelSerializer):
         read_only_fields = ["created_at"]
 
 
-class ActivityOfferSerializer(serializers.ModelSerializer):
+class ActivityOfferSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     activity = OffActivitySerializer()
 
+    nested_eager_loading = {"activity": OffActivitySerializer}
+
     class Meta:
         model = ActivityOffer
         fields = ["id", "title", "price", "stock", "activity"]
@@ -88,7 +104,7 @@ class ActivityOfferSerializer(serializers.ModelSerializer):
 
 # here the fields are hardwritten one by one so in case we
 # wanted to exclude something from the fields
-class ActivitySerializer(serializers.ModelSerializer):
+class ActivitySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     included_items = IncludedSerializer(
         many=True, read_only=True, source="included_set"
     )
@@ -104,10 +120,17 @@ class ActivitySerializer(serializers.ModelSerializer):
     location = LocationSerializer()
     offers = ActivityOfferSerializer(many=True, read_only=True)
 
+    select_related_fields = ["location"]
+    prefetch_related_fields = ACTIVITY_PREFETCH + [
+        Prefetch("offers", queryset=ActivityOffer.objects.order_by("id"))
+    ]
+    full_row_fields = ["offers"]
+
     class Meta:
         model = Activity
         fields = [
             "id",
+            "featured",
             "supplier",
             "title",
             "image",
@@ -139,9 +162,37 @@ class ActivitySerializer(serializers.ModelSerializer):
         read_only_fields = ["created_at"]
 
 
-class PeriodSerializer(serializers.ModelSerializer):
+class PeriodSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     activity_offer = ActivityOfferSerializer()
+    # virtual slots have no id until booked, they are booked by this key
+    slot = serializers.CharField(source="slot_key", read_only=True)
+    # stock minus the active checkout holds
+    available = AvailableField()
+
+    nested_eager_loading = {"activity_offer": ActivityOfferSerializer}
 
     class Meta:
         model = Period
         fields = "__all__"
+
+
+# the listing / homepage card, the ?fields= and ?expand= parameters switch
+# listings to ActivitySerializer narrowed to the requested fields
+class ActivityCardSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    location = LocationSerializer()
+
+    select_related_fields = ["location"]
+
+    class Meta:
+        model = Activity
+        fields = [
+            "id",
+            "title",
+            "image",
+            "price",
+            "location",
+            "featured",
+            "available_from",
+            "available_to",
+            "created_at",
+        ]
@@ -0,0 +1,216 @@
+from datetime import datetime, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Min, Sum
+
+from booking.inventory import block, held, with_available
+from .models import ActivityOffer, Period
+
+
+# Activities in virtual slot mode don't store a Period per slot: the slots
+# are computed from the activity's schedule (start_time, end_time, period,
+# days_off) and only the slots that differ from the offer's price and stock
+# (booked, blocked, repriced) are stored, as override Period rows.
+# Everything that lists or books slots goes through this module so both
+# modes look the same to callers: a slot is a Period, saved or not.
+
+
+class InvalidSlot(Exception):
+    pass
+
+
+def slot_key(offer_id, day, time_from):
+    """
+    Identifies a slot whether or not it has a row, "<offer>:<day>:<HH:MM>".
+    """
+    return f"{offer_id}:{day.isoformat()}:{time_from.strftime('%H:%M')}"
+
+
+def parse_slot_key(key):
+    try:
+        offer_id, day, time_from = str(key).split(":", 2)
+        return (
+            int(offer_id),
+            datetime.strptime(day, "%Y-%m-%d").date(),
+            datetime.strptime(time_from, "%H:%M").time(),
+        )
+    except ValueError:
+        raise InvalidSlot("Invalid slot, expected <offer>:<YYYY-MM-DD>:<HH:MM>.")
+
+
+def is_open(activity, day):
+    return (
+        activity.available_from <= day <= activity.available_to
+        and day.strftime("%A").lower() not in activity.get_days_off()
+    )
+
+
+def open_days(activity, day_from, day_to):
+    day_from = max(day_from, activity.available_from)
+    day_to = min(day_to, activity.available_to)
+    days_off = activity.get_days_off()
+    day = day_from
+    while day <= day_to:
+        if day.strftime("%A").lower() not in days_off:
+            yield day
+        day += timedelta(days=1)
+
+
+def get_slots(offer, day_from, day_to):
+    """
+    The slots of an offer over a window ordered by day and time. In
+    virtual mode the rule's slots are returned as unsaved Periods with
+    the offer's price and stock, replaced by their override row if any.
+    """
+    periods = list(
+        with_available(
+            Period.objects.filter(activity_offer=offer, day__range=(day_from, day_to))
+        ).order_by("day", "time_from")
+    )
+    for period in periods:
+        # share the caller's (possibly prefetched) offer
+        period.activity_offer = offer
+    activity = offer.activity
+    if not activity.virtual_slots:
+        return periods
+
+    overrides = {(period.day, period.time_from): period for period in periods}
+    slots = []
+    slot_times = activity.get_slot_times()
+    for day in open_days(activity, day_from, day_to):
+        for time_from, time_to in slot_times:
+            period = overrides.get((day, time_from))
+            if period is None:
+                period = Period(
+                    day=day,
+                    time_from=time_from,
+                    time_to=time_to,
+                    stock=offer.stock,
+                    price=offer.price,
+                    activity_offer=offer,
+                )
+            slots.append(period)
+    return slots
+
+
+def materialize(offer, day, time_from):
+    """
+    Returns the Period row of a slot, creating its override row from the
+    rule the first time the slot is booked, blocked or repriced.
+    """
+    activity = offer.activity
+    if not activity.virtual_slots:
+        try:
+            return Period.objects.get(
+                activity_offer=offer, day=day, time_from=time_from
+            )
+        except Period.DoesNotExist:
+            raise InvalidSlot("No such slot.")
+
+    slot_times = dict(activity.get_slot_times())
+    if time_from not in slot_times or not is_open(activity, day):
+        raise InvalidSlot("No such slot.")
+    try:
+        with transaction.atomic():
+            period, _ = Period.objects.get_or_create(
+                activity_offer=offer,
+                day=day,
+                time_from=time_from,
+                defaults={
+                    "time_to": slot_times[time_from],
+                    "stock": offer.stock,
+                    "price": offer.price,
+                },
+            )
+    except IntegrityError:
+        # created concurrently, the unique constraint kept a single row
+        period = Period.objects.get(activity_offer=offer, day=day, time_from=time_from)
+    return period
+
+
+def resolve_period(period_id=None, slot=None):
+    """
+    The Period a booking refers to, by id or by slot key.
+    """
+    if period_id:
+        try:
+            return Period.objects.get(pk=period_id)
+        except Period.DoesNotExist:
+            raise InvalidSlot("Period not found.")
+    if not slot:
+        raise InvalidSlot("Period is required.")
+    offer_id, day, time_from = parse_slot_key(slot)
+    try:
+        offer = ActivityOffer.objects.select_related("activity").get(pk=offer_id)
+    except ActivityOffer.DoesNotExist:
+        raise InvalidSlot("Offer not found.")
+    return materialize(offer, day, time_from)
+
+
+def block_day(activity, day):
+    """
+    Sets the stock of every slot of the day to 0, writing the override
+    rows first in virtual mode. Returns the number of slots blocked.
+    """
+    with transaction.atomic():
+        if activity.virtual_slots and is_open(activity, day):
+            # created empty, they open with no stock movement
+            offers = list(activity.offers.all())
+            Period.objects.bulk_create(
+                [
+                    Period(
+                        activity_offer=offer,
+                        day=day,
+                        time_from=time_from,
+                        time_to=time_to,
+                        stock=0,
+                        price=offer.price,
+                    )
+                    for offer in offers
+                    for time_from, time_to in activity.get_slot_times()
+                ],
+                ignore_conflicts=True,
+            )
+        return block(Period.objects.filter(activity_offer__activity=activity, day=day))
+
+
+def daily_summary(offer, day_from, day_to):
+    """
+    Calendar rows of a virtual slot offer: the rule gives every open day
+    the same slots at the offer's price and stock, the override rows of
+    the window (one grouped aggregate) adjust the days they fall on.
+    """
+    activity = offer.activity
+    slot_times = activity.get_slot_times()
+    rule_times = [time_from for time_from, _ in slot_times]
+    overrides = {
+        row["day"]: row
+        for row in Period.objects.filter(
+            activity_offer=offer,
+            day__range=(day_from, day_to),
+            time_from__in=rule_times,
+        )
+        .order_by()
+        .values("day")
+        .annotate(
+            count=Count("id"),
+            min_price=Min("price"),
+            stock=Sum(F("stock") - held(Period)),
+        )
+    }
+    rows = []
+    for day in open_days(activity, day_from, day_to):
+        override = overrides.get(day)
+        virtual = len(slot_times) - (override["count"] if override else 0)
+        prices = [offer.price] if virtual else []
+        if override:
+            prices.append(override["min_price"])
+        rows.append(
+            {
+                "day": day,
+                "min_price": min(prices) if prices else None,
+                "stock": virtual * offer.stock + (override["stock"] if override else 0),
+                "slots": len(slot_times),
+            }
+        )
+    return rows
@@ -1,3 +1,99 @@
+from datetime import date, time, timedelta
+
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.tests import CatalogFixtureMixin
+from booking.models import ActivityBooking
+from users.models import CustomUser, Customer
+from .models import Period
+
+
+class CreatePeriodsTests(CatalogFixtureMixin, TestCase):
+    def test_bulk_generation_honors_days_off(self):
+        # two weeks starting on a monday, sundays off
+        monday = date(2030, 1, 7)
+        activity = self.create_activity(days_off="Sunday")
+        activity.available_from = monday
+        activity.available_to = monday + timedelta(days=13)
+        activity.start_time = time(9)
+        activity.end_time = time(12, 30)
+        activity.period = 30
+
+        # offers, savepoint, three 100 row chunked inserts, the opening
+        # stock movements of each of the two flushes, release
+        with self.assertNumQueries(8):
+            report = activity.create_periods(batch_size=100)
+
+        # 12 days x 2 offers x 7 half hour slots
+        self.assertEqual(report["days"], 12)
+        self.assertEqual(report["periods"], 168)
+        self.assertEqual(Period.objects.count(), 168)
+        self.assertFalse(Period.objects.filter(day=monday + timedelta(days=6)).exists())
+        last = Period.objects.order_by("day", "time_from").last()
+        self.assertEqual((last.time_from, last.time_to), (time(12), time(12, 30)))
+
+
+class VirtualSlotsTests(CatalogFixtureMixin, TestCase):
+    def setUp(self):
+        # 9:00 to 12:00 in one hour slots, nothing stored
+        self.activity = self.create_activity(virtual_slots=True)
+        self.offer = self.activity.offers.first()
+        self.activity.create_periods()
+        self.day = date.today() + timedelta(days=1)
+        user = CustomUser.objects.create_user(username="customer", is_customer=True)
+        Customer.objects.create(user=user)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def day_slots(self):
+        url = reverse("get_daily_periods", args=[self.offer.id, self.day])
+        return self.client.get(url).data
+
+    def test_slots_are_computed_from_the_schedule(self):
+        self.assertFalse(Period.objects.exists())
+        slots = self.day_slots()
+        self.assertEqual(
+            [(slot["id"], slot["time_from"], slot["stock"]) for slot in slots],
+            [(None, "09:00:00", 5), (None, "10:00:00", 5), (None, "11:00:00", 5)],
+        )
+        self.assertEqual(slots[0]["slot"], f"{self.offer.id}:{self.day}:09:00")
+
+    def test_booking_a_slot_stores_a_single_override(self):
+        slot = self.day_slots()[1]["slot"]
+        for _ in range(2):
+            response = self.client.post(
+                reverse("create_activity_booking"),
+                {"slot": slot, "quantity": 1},
+                format="json",
+            )
+            self.assertEqual(response.status_code, 201)
+        period = Period.objects.get()
+        self.assertEqual((period.day, period.time_from), (self.day, time(10)))
+        self.assertEqual(ActivityBooking.objects.filter(period=period).count(), 2)
+        self.assertEqual(self.day_slots()[1]["id"], period.id)
+
+        response = self.client.post(
+            reverse("create_activity_booking"),
+            {"slot": f"{self.offer.id}:{self.day}:10:30", "quantity": 1},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 404)
 
-# Create your tests here.
+    def test_calendar_merges_overrides(self):
+        Period.objects.create(
+            activity_offer=self.offer,
+            day=self.day,
+            time_from=time(9),
+            time_to=time(10),
+            stock=0,
+            price=15,
+        )
+        url = reverse("activity_offer_calendar", args=[self.offer.id])
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {"from": self.day, "to": self.day})
+        self.assertEqual(
+            response.data["days"],
+            [{"day": self.day, "min_price": 15, "stock": 10, "slots": 3}],
+        )
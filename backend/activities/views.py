@@ -1,12 +1,24 @@
 from .models import Activity, Period, ActivityOffer
 from django.shortcuts import get_object_or_404
-from .serializers import ActivitySerializer, PeriodSerializer, ActivityOfferSerializer
+from .serializers import (
+    ActivitySerializer,
+    ActivityCardSerializer,
+    PeriodSerializer,
+    ActivityOfferSerializer,
+)
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from django.utils import timezone
 from datetime import datetime
+from api.pagination import KeysetPagination, InvalidCursor
+from api.eager import get_listing_serializer, serialize_listing
+from api.conditional import conditional_detail
+from api.calendar import daily_summary, offer_calendar
+from booking.inventory import decrement, OutOfStock
+from booking.models import StockMovement
+from . import slots
 
 
 @api_view(["POST"])
@@ -34,18 +46,14 @@ def block_activity_day(request):
             status=status.HTTP_403_FORBIDDEN,
         )
 
-    # Fetch all periods on the specified day for this activity
-    periods = Period.objects.filter(activity_offer__activity=activity, day=day)
-
-    if not periods.exists():
+    # Set the stock of all periods on this day to 0, virtual slots get
+    # their override rows written
+    if not slots.block_day(activity, day):
         return Response(
             {"error": "No periods found for the specified day."},
             status=status.HTTP_404_NOT_FOUND,
         )
 
-    # Set the stock of all periods on this day to 0
-    periods.update(stock=0)
-
     return Response(
         {"success": f"All periods on {day_str} have been blocked."},
         status=status.HTTP_200_OK,
@@ -58,7 +66,7 @@ def reserve_activity(request):
     supplier = request.user.supplier
     activity_offer_id = request.data.get("activity_offer")
     period_id = request.data.get("period")
-    number_of_reservations = int(request.data.get("number_of_reservations", 0))
+    number_of_reservations = request.data.get("number_of_reservations", 0)
 
     # Fetch the activity offer
     activity_offer = get_object_or_404(ActivityOffer, id=activity_offer_id)
@@ -70,19 +78,32 @@ def reserve_activity(request):
             status=status.HTTP_403_FORBIDDEN,
         )
 
-    # Fetch the period
-    period = get_object_or_404(Period, id=period_id)
+    # Fetch the period, virtual slots are given by key and get their row here
+    try:
+        period = slots.resolve_period(period_id, request.data.get("slot"))
+    except slots.InvalidSlot as e:
+        return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+    if period.activity_offer_id != activity_offer.id:
+        return Response(
+            {"error": "Period not found for this offer."},
+            status=status.HTTP_404_NOT_FOUND,
+        )
 
-    # Check if there is enough stock
-    if period.stock < number_of_reservations:
+    # Deduct the number of reservations from the stock if there is enough
+    try:
+        decrement(
+            Period, period.pk, number_of_reservations, reason=StockMovement.RESERVE
+        )
+    except OutOfStock:
         return Response(
             {"error": "Not enough stock available for this period."},
             status=status.HTTP_400_BAD_REQUEST,
         )
-
-    # Deduct the number of reservations from the stock
-    period.stock -= number_of_reservations
-    period.save()
+    except (TypeError, ValueError):
+        return Response(
+            {"error": "number_of_reservations must be a number of at least 1."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
     return Response(
         {"success": "Reservation completed successfully."}, status=status.HTTP_200_OK
@@ -99,7 +120,9 @@ def get_offers_by_activity(request, activity_id):
             {"error": "Activity not found"}, status=status.HTTP_404_NOT_FOUND
         )
 
-    offers = ActivityOffer.objects.filter(activity=activity)
+    offers = ActivityOfferSerializer.setup_eager_loading(
+        ActivityOffer.objects.filter(activity=activity)
+    )
     serializer = ActivityOfferSerializer(offers, many=True)
     return Response(serializer.data)
 
@@ -110,15 +133,27 @@ def get_all_activities(request):
     # timezone of the server, should be set to Lebanon
     current_time = timezone.now()
     # exclude items that their time has passed
-    activities = Activity.objects.filter(available_to__gte=current_time)
-    serializer = ActivitySerializer(activities, many=True)
-    return Response(serializer.data)
+    serializer_class, fields = get_listing_serializer(
+        request, ActivityCardSerializer, ActivitySerializer
+    )
+    activities = serializer_class.plan_queryset(
+        Activity.objects.filter(available_to__gte=current_time), fields
+    )
+    # paginated by (created_at, id) so deep pages cost the same as the first
+    paginator = KeysetPagination()
+    try:
+        page = paginator.paginate_queryset(activities, request)
+    except InvalidCursor as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = serializer_class(page, many=True, fields=fields)
+    return paginator.get_paginated_response(serializer.data)
 
 
+@conditional_detail(Activity)
 @api_view(["GET"])
 @permission_classes([AllowAny])
 def get_activity(request, pk):
-    activity = Activity.objects.get(pk=pk)
+    activity = ActivitySerializer.setup_eager_loading(Activity.objects).get(pk=pk)
     serializer = ActivitySerializer(activity)
     return Response(serializer.data)
 
@@ -128,19 +163,47 @@ def get_activity(request, pk):
 @permission_classes([AllowAny])
 def get_activities(request):
     current_time = timezone.now()
-    activities = Activity.objects.filter(available_to__gte=current_time)[:20]
-    serializer = ActivitySerializer(activities, many=True)
-    return Response(serializer.data)
+    activities = Activity.objects.filter(available_to__gte=current_time)
+    return Response(
+        serialize_listing(
+            request, ActivityCardSerializer, ActivitySerializer, activities, limit=20
+        )
+    )
 
 
 @api_view(["GET"])
 @permission_classes([AllowAny])
 def get_periods_by_offer_and_day(request, offer_id, day):
     try:
-        offer = ActivityOffer.objects.get(pk=offer_id)
+        day = datetime.strptime(day, "%Y-%m-%d").date()
+    except ValueError:
+        return Response(
+            {"error": "Invalid date format. Use YYYY-MM-DD."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    try:
+        offer = ActivityOfferSerializer.setup_eager_loading(ActivityOffer.objects).get(
+            pk=offer_id
+        )
     except ActivityOffer.DoesNotExist:
         return Response({"error": "Offer not found"}, status=status.HTTP_404_NOT_FOUND)
 
-    periods = Period.objects.filter(activity_offer=offer, day=day, stock__gt=0)
+    periods = [
+        period
+        for period in slots.get_slots(offer, day, day)
+        if getattr(period, "available", period.stock) > 0
+    ]
     serializer = PeriodSerializer(periods, many=True)
     return Response(serializer.data)
+
+
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def get_activity_offer_calendar(request, offer_id):
+    def summarize(offer, day_from, day_to):
+        if offer.activity.virtual_slots:
+            return slots.daily_summary(offer, day_from, day_to)
+        return daily_summary(offer.periods.filter(day__range=(day_from, day_to)))
+
+    offers = ActivityOffer.objects.select_related("activity")
+    return offer_calendar(request, offers, offer_id, summarize)
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+from django.db.models import Count, F, Min, Sum
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from booking.inventory import held
+
+
+# longest window a single calendar request may cover
+MAX_CALENDAR_DAYS = 93
+
+
+class InvalidWindow(Exception):
+    pass
+
+
+def parse_window(request):
+    """
+    Reads ?from=YYYY-MM-DD&to=YYYY-MM-DD, defaulting to the current month.
+    """
+    today = timezone.now().date()
+    try:
+        day_from = request.query_params.get("from")
+        day_from = (
+            datetime.strptime(day_from, "%Y-%m-%d").date()
+            if day_from
+            else today.replace(day=1)
+        )
+        day_to = request.query_params.get("to")
+        day_to = (
+            datetime.strptime(day_to, "%Y-%m-%d").date()
+            if day_to
+            else (day_from.replace(day=28) + timedelta(days=4)).replace(day=1)
+            - timedelta(days=1)
+        )
+    except ValueError:
+        raise InvalidWindow("Invalid date format. Use YYYY-MM-DD.")
+    if day_to < day_from:
+        raise InvalidWindow("The window ends before it starts.")
+    if (day_to - day_from).days >= MAX_CALENDAR_DAYS:
+        raise InvalidWindow(f"The window can't exceed {MAX_CALENDAR_DAYS} days.")
+    return day_from, day_to
+
+
+def daily_summary(queryset):
+    """
+    One grouped aggregate over slot rows (Period, TourDay, PackageDay),
+    returning a row per day with the cheapest price, the stock left (net
+    of checkout holds) and the number of slots.
+    """
+    rows = (
+        queryset.order_by()
+        .values("day")
+        .annotate(
+            min_price=Min("price"),
+            stock=Sum(F("stock") - held(queryset.model)),
+            slots=Count("id"),
+        )
+        .order_by("day")
+    )
+    return [
+        {
+            "day": row["day"],
+            "min_price": row["min_price"],
+            "stock": row["stock"],
+            "slots": row["slots"],
+        }
+        for row in rows
+    ]
+
+
+def offer_calendar(request, offers, offer_id, summarize):
+    """
+    The calendar response of one offer: one request paints a whole
+    calendar, a summary per day of the window computed with a single
+    grouped aggregate. summarize(offer, day_from, day_to) returns the
+    days, usually a daily_summary() of the offer's slot rows.
+    """
+    try:
+        day_from, day_to = parse_window(request)
+    except InvalidWindow as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    offer = offers.filter(pk=offer_id).first()
+    if offer is None:
+        name = offers.model._meta.verbose_name.capitalize()
+        return Response(
+            {"error": f"{name} not found."}, status=status.HTTP_404_NOT_FOUND
+        )
+    days = summarize(offer, day_from, day_to)
+    return Response({"from": day_from, "to": day_to, "days": days})
@@ -0,0 +1,40 @@
+from calendar import timegm
+from functools import wraps
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def conditional_detail(model):
+    """
+    Answers If-None-Match / If-Modified-Since on a catalog detail view from
+    the item's updated_at alone, so an unchanged item costs one indexed
+    lookup instead of the whole nested serialization.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, pk, *args, **kwargs):
+            updated_at = (
+                model.objects.filter(pk=pk).values_list("updated_at", flat=True).first()
+            )
+            if updated_at is None:
+                return view(request, pk, *args, **kwargs)
+
+            version = int(updated_at.timestamp() * 1_000_000)
+            etag = quote_etag(f"{model._meta.model_name}-{pk}-{version}")
+            last_modified = timegm(updated_at.utctimetuple())
+
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is None:
+                response = view(request, pk, *args, **kwargs)
+            if request.method in ("GET", "HEAD") and response.status_code in (200, 304):
+                response.headers.setdefault("ETag", etag)
+                response.headers.setdefault("Last-Modified", http_date(last_modified))
+            return response
+
+        return wrapper
+
+    return decorator
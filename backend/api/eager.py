@@ -0,0 +1,156 @@
+from django.db.models import Prefetch
+from rest_framework.exceptions import ParseError
+
+from .pagination import KeysetPagination
+
+
+def _prefix_lookup(prefix, lookup):
+    if isinstance(lookup, Prefetch):
+        return Prefetch(
+            prefix + lookup.prefetch_through,
+            queryset=lookup.queryset,
+            to_attr=lookup.to_attr,
+        )
+    return prefix + lookup
+
+
+# serializers declare the relations they render, views call
+# setup_eager_loading() on the queryset before serializing it so nested
+# serializers read from the prefetch cache instead of querying per row.
+# A prefetched child's link back to its parent (an offer's activity) is
+# the parent itself, it needs no lookups of its own
+class EagerLoadingMixin:
+    # forward FK / one to one relations rendered by the serializer
+    select_related_fields = []
+    # reverse FK and M2M relations, can hold Prefetch objects
+    prefetch_related_fields = []
+    # nested serializers reached through a forward relation,
+    # e.g. {"activity_offer": ActivityOfferSerializer}
+    nested_eager_loading = {}
+
+    @classmethod
+    def get_eager_lookups(cls, prefix=""):
+        select_related = [prefix + field for field in cls.select_related_fields]
+        prefetch_related = [
+            _prefix_lookup(prefix, lookup) for lookup in cls.prefetch_related_fields
+        ]
+        for field, serializer_class in cls.nested_eager_loading.items():
+            select_related.append(prefix + field)
+            nested_select, nested_prefetch = serializer_class.get_eager_lookups(
+                prefix + field + "__"
+            )
+            select_related += nested_select
+            prefetch_related += nested_prefetch
+        return select_related, prefetch_related
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        select_related, prefetch_related = cls.get_eager_lookups()
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+
+def _lookup_root(lookup):
+    if isinstance(lookup, Prefetch):
+        lookup = lookup.prefetch_through
+    return lookup.split("__")[0]
+
+
+# lets a serializer render a subset of its declared fields, e.g.
+# ActivitySerializer(page, many=True, fields=["id", "title", "faqs"]),
+# and plans the queryset for exactly that subset: relations that aren't
+# rendered aren't prefetched and columns that aren't rendered are deferred
+class SparseFieldsMixin(EagerLoadingMixin):
+    # relations whose nested serializers render the parent row again
+    # (offers -> activity), asking for them needs the full plan
+    full_row_fields = []
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def plan_queryset(cls, queryset, fields=None):
+        sources = {
+            field.source.split(".")[0] for field in cls(fields=fields).fields.values()
+        }
+        if sources & set(cls.full_row_fields):
+            return cls.setup_eager_loading(queryset)
+
+        select_related, prefetch_related = cls.get_eager_lookups()
+        select_related = [
+            lookup for lookup in select_related if _lookup_root(lookup) in sources
+        ]
+        prefetch_related = [
+            lookup for lookup in prefetch_related if _lookup_root(lookup) in sources
+        ]
+        # the listings' cursor is built from the ordering columns, deferring
+        # them would cost a query per page to read them back
+        ordering = {field.lstrip("-") for field in KeysetPagination.ordering}
+        columns = [
+            field.name
+            for field in queryset.model._meta.concrete_fields
+            if field.primary_key or field.name in sources | ordering
+        ]
+        queryset = queryset.only(*columns)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+
+class InvalidFields(ParseError):
+    pass
+
+
+def get_requested_fields(request, serializer_class, default_fields):
+    """
+    Reads ?fields= (replaces the default fields) and ?expand= (adds to
+    them) from the request. Returns None when neither is given, raises
+    InvalidFields (a 400) naming the fields the serializer doesn't have.
+    """
+    fields = request.query_params.get("fields")
+    expand = request.query_params.get("expand")
+    if not fields and not expand:
+        return None
+    requested = fields.split(",") if fields else list(default_fields)
+    if expand:
+        requested += expand.split(",")
+    requested = [name for name in dict.fromkeys(requested) if name]
+    available = serializer_class().fields
+    unknown = [name for name in requested if name not in available]
+    if unknown:
+        raise InvalidFields({"error": f"Unknown fields: {', '.join(unknown)}."})
+    return requested
+
+
+def get_listing_serializer(request, card_serializer_class, serializer_class):
+    """
+    Listings render cards unless the client asks for other fields, then
+    the full serializer narrowed to those fields is used.
+    Returns (serializer_class, fields).
+    """
+    fields = get_requested_fields(
+        request, serializer_class, card_serializer_class.Meta.fields
+    )
+    if fields is None:
+        return card_serializer_class, None
+    return serializer_class, fields
+
+
+def serialize_listing(
+    request, card_serializer_class, serializer_class, queryset, limit=None
+):
+    serializer_class, fields = get_listing_serializer(
+        request, card_serializer_class, serializer_class
+    )
+    queryset = serializer_class.plan_queryset(queryset, fields)
+    if limit is not None:
+        queryset = queryset[:limit]
+    return serializer_class(queryset, many=True, fields=fields).data
@@ -0,0 +1,71 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+VERSION_KEY = "catalog:feed-version"
+FEED_TIMEOUT = getattr(settings, "FEED_CACHE_TIMEOUT", 300)
+# how long a rebuild may hold the lock before another request takes over
+LOCK_TIMEOUT = 30
+# how long a request waits for someone else's rebuild before doing its own
+WAIT_TIMEOUT = 5
+WAIT_INTERVAL = 0.05
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # start from the clock so a version lost to eviction never comes
+        # back to a number that older, stale entries were stored under
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate():
+    """
+    Makes every cached feed stale by moving to a new version, the old
+    entries are never read again and expire on their own.
+    """
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, time.time_ns(), None)
+
+
+def get_feed(name, build, vary=()):
+    """
+    Returns the cached feed, building it with build() on a miss. Only one
+    request rebuilds a missing feed at a time, the others serve the last
+    built copy meanwhile (or wait for the rebuild when there is none).
+    """
+    suffix = hashlib.md5(repr(vary).encode()).hexdigest()
+    stale_key = f"catalog:feed:{name}:{suffix}"
+    key = f"{stale_key}:v{get_version()}"
+    data = cache.get(key)
+    if data is not None:
+        return data
+
+    lock_key = f"{key}:lock"
+    if cache.add(lock_key, True, LOCK_TIMEOUT):
+        try:
+            data = build()
+            cache.set(key, data, FEED_TIMEOUT)
+            cache.set(stale_key, data, None)
+        finally:
+            cache.delete(lock_key)
+        return data
+
+    data = cache.get(stale_key)
+    if data is not None:
+        return data
+
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        data = cache.get(key)
+        if data is not None:
+            return data
+    return build()
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.recommendations import rebuild_for_customer
+from users.models import Customer
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the \"for you\" recommendations of every customer. Run once "
+        "when deploying the recommendations table, the views and signals "
+        "only keep it up to date afterwards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        customers = rows = 0
+        for customer in Customer.objects.order_by("pk").iterator(
+            chunk_size=options["batch_size"]
+        ):
+            rows += rebuild_for_customer(customer)
+            customers += 1
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {rows} recommendations for {customers} customers "
+                f"in {time.monotonic() - started:.2f}s"
+            )
+        )
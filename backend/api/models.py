@@ -1,3 +1,52 @@
 from django.db import models
+from users.models import Customer
 
-# Create your models here.
+
+ITEM_TYPES = [
+    ("activity", "Activity"),
+    ("tour", "Tour"),
+    ("package", "Package"),
+]
+
+
+# one row per catalog item holding the text that search matches on,
+# kept in sync by api.signals. The full text index itself lives next to
+# it in the database (see api.search)
+class SearchEntry(models.Model):
+    item_type = models.CharField(max_length=20, choices=ITEM_TYPES)
+    item_id = models.PositiveIntegerField()
+    title = models.CharField(max_length=255)
+    body = models.TextField()
+    location = models.CharField(max_length=150)
+
+    class Meta:
+        unique_together = ("item_type", "item_id")
+        verbose_name_plural = "search entries"
+
+    def __str__(self):
+        return f"{self.item_type} {self.item_id} - {self.title}"
+
+
+# materialized "for you" index: one row per (customer, catalog item) the
+# customer's locations and preferred categories match, maintained by
+# api.recommendations so for_you_items is a single indexed lookup. Deploy
+# step: run the rebuild_recommendations command once to fill it for the
+# customers that existed before, they only get rows when they or a
+# matching item change otherwise
+class Recommendation(models.Model):
+    customer = models.ForeignKey(
+        Customer, on_delete=models.CASCADE, related_name="recommendations"
+    )
+    item_type = models.CharField(max_length=20, choices=ITEM_TYPES)
+    item_id = models.PositiveIntegerField()
+    # number of the customer's preferred categories the item is in
+    score = models.PositiveIntegerField(default=0)
+    # copied from the item so expired items drop out without a recompute
+    available_to = models.DateField()
+
+    class Meta:
+        unique_together = ("customer", "item_type", "item_id")
+        indexes = [models.Index(fields=["customer", "-score", "-id"])]
+
+    def __str__(self):
+        return f"{self.customer} - {self.item_type} {self.item_id} ({self.score})"
@@ -0,0 +1,123 @@
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.response import Response
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(values):
+    payload = json.dumps(values, default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor, size, fields=()):
+    """
+    The cursor's values, each parsed by its model field in fields (None
+    leaves a value as is), so a tampered value is an InvalidCursor rather
+    than an error in the query.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor.")
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor("Invalid cursor.")
+    fields = list(fields) + [None] * (size - len(fields))
+    parsed = []
+    for value, field in zip(values, fields):
+        if field is None:
+            parsed.append(value)
+            continue
+        try:
+            value = field.to_python(value)
+        except (ValidationError, TypeError, ValueError):
+            raise InvalidCursor("Invalid cursor.")
+        if value is None:
+            raise InvalidCursor("Invalid cursor.")
+        parsed.append(value)
+    return parsed
+
+
+# keyset (seek) pagination: the cursor holds the ordering values of the
+# last row of the page and the next page filters past them, so deep
+# pages use the same index range scan as the first one instead of
+# counting through an OFFSET. The catalog models index (created_at, id)
+# for the default ordering
+class KeysetPagination:
+    # the last field must be unique so the ordering is total
+    ordering = ("-created_at", "-id")
+    page_size = getattr(settings, "CATALOG_PAGE_SIZE", 20)
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = ordering
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_fields(self, model):
+        fields = []
+        for field in self.ordering:
+            try:
+                fields.append(model._meta.get_field(field.lstrip("-")))
+            except FieldDoesNotExist:
+                # a lookup across relations or an annotation
+                fields.append(None)
+        return fields
+
+    def get_seek_filter(self, values):
+        # (a, b, c) after (x, y, z) expands to
+        # a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        seek = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            seek |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+        return seek
+
+    def paginate_queryset(self, queryset, request):
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            values = decode_cursor(
+                cursor, len(self.ordering), self.get_fields(queryset.model)
+            )
+            queryset = queryset.filter(self.get_seek_filter(values))
+
+        # fetch one extra row to know whether there is a next page
+        page = list(queryset[: self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        page = page[: self.page_size]
+        self.next_cursor = None
+        if self.has_next:
+            last = page[-1]
+            self.next_cursor = encode_cursor(
+                [self.get_value(last, field.lstrip("-")) for field in self.ordering]
+            )
+        return page
+
+    def get_value(self, obj, name):
+        if isinstance(obj, dict):
+            return obj[name]
+        for attr in name.split("__"):
+            obj = getattr(obj, attr)
+        return obj
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.next_cursor, "results": data})
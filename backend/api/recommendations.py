@@ -0,0 +1,80 @@
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from users.models import Customer
+from .models import Recommendation
+from .search import SEARCHABLE_MODELS
+
+
+def rebuild_for_customer(customer):
+    """
+    Recomputes every recommendation of one customer, called when the
+    customer changes their locations or preferred categories.
+    """
+    locations = list(customer.location.values_list("id", flat=True))
+    categories = list(customer.preferences.values_list("id", flat=True))
+    rows = []
+    if locations and categories:
+        today = timezone.now().date()
+        for item_type, model in SEARCHABLE_MODELS.items():
+            # the categories join is filtered to the preferred ones, so
+            # counting it gives the number of matching categories
+            matches = (
+                model.objects.filter(
+                    location__in=locations,
+                    categories__in=categories,
+                    available_to__gte=today,
+                )
+                .values("id", "available_to")
+                .annotate(score=Count("categories"))
+            )
+            rows += [
+                Recommendation(
+                    customer=customer,
+                    item_type=item_type,
+                    item_id=match["id"],
+                    score=match["score"],
+                    available_to=match["available_to"],
+                )
+                for match in matches
+            ]
+    with transaction.atomic():
+        Recommendation.objects.filter(customer=customer).delete()
+        Recommendation.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def refresh_item(item_type, item):
+    """
+    Recomputes the recommendations of one catalog item for every customer,
+    called when the item or its categories change.
+    """
+    categories = list(item.categories.values_list("id", flat=True))
+    rows = []
+    if categories:
+        customers = (
+            Customer.objects.filter(
+                location=item.location_id, preferences__in=categories
+            )
+            .values("id")
+            .annotate(score=Count("preferences"))
+        )
+        rows = [
+            Recommendation(
+                customer_id=customer["id"],
+                item_type=item_type,
+                item_id=item.pk,
+                score=customer["score"],
+                available_to=item.available_to,
+            )
+            for customer in customers
+        ]
+    with transaction.atomic():
+        remove_item(item_type, item.pk)
+        Recommendation.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def remove_item(item_type, item_id):
+    Recommendation.objects.filter(item_type=item_type, item_id=item_id).delete()
@@ -0,0 +1,230 @@
+import re
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
+
+from activities.models import Activity
+from tours.models import Tour
+from packages.models import Package
+from .models import SearchEntry
+
+
+SEARCHABLE_MODELS = {
+    "activity": Activity,
+    "tour": Tour,
+    "package": Package,
+}
+
+TABLE = SearchEntry._meta.db_table
+FTS_TABLE = f"{TABLE}_fts"
+
+# sqlite keeps an FTS5 index over the search entries, the triggers keep
+# it in sync with every insert/update/delete done through the ORM
+SQLITE_SCHEMA = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, body, location,
+        content='{TABLE}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_ai AFTER INSERT ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, body, location)
+        VALUES (new.id, new.title, new.body, new.location);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_ad AFTER DELETE ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body, location)
+        VALUES ('delete', old.id, old.title, old.body, old.location);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_au AFTER UPDATE ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body, location)
+        VALUES ('delete', old.id, old.title, old.body, old.location);
+        INSERT INTO {FTS_TABLE}(rowid, title, body, location)
+        VALUES (new.id, new.title, new.body, new.location);
+    END
+    """,
+]
+
+# postgres matches against a weighted tsvector expression, the GIN index
+# is built on the very same expression so the planner can use it
+PG_VECTOR = (
+    "setweight(to_tsvector('simple', title), 'A') || "
+    "setweight(to_tsvector('simple', location), 'B') || "
+    "setweight(to_tsvector('simple', body), 'C')"
+)
+PG_SCHEMA = [
+    f"CREATE INDEX IF NOT EXISTS {TABLE}_tsv ON {TABLE} USING GIN (({PG_VECTOR}))",
+]
+
+
+def ensure_schema(using=connection):
+    statements = {"sqlite": SQLITE_SCHEMA, "postgresql": PG_SCHEMA}.get(
+        using.vendor, []
+    )
+    try:
+        with transaction.atomic(using=using.alias):
+            with using.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+    except DatabaseError:
+        # sqlite built without FTS5, search falls back to LIKE queries
+        return False
+    return True
+
+
+def tokenize(query):
+    return re.findall(r"\w+", query.lower())[:10]
+
+
+def build_entry(item_type, item):
+    return SearchEntry(
+        item_type=item_type,
+        item_id=item.pk,
+        title=item.title,
+        body=item.description,
+        location=item.location.name,
+    )
+
+
+def index_item(item_type, item):
+    entry = build_entry(item_type, item)
+    SearchEntry.objects.update_or_create(
+        item_type=item_type,
+        item_id=item.pk,
+        defaults={
+            "title": entry.title,
+            "body": entry.body,
+            "location": entry.location,
+        },
+    )
+
+
+def remove_item(item_type, item_id):
+    SearchEntry.objects.filter(item_type=item_type, item_id=item_id).delete()
+
+
+def rename_location(location):
+    for item_type, model in SEARCHABLE_MODELS.items():
+        SearchEntry.objects.filter(
+            item_type=item_type,
+            item_id__in=model.objects.filter(location=location).values("id"),
+        ).update(location=location.name)
+
+
+def rebuild(batch_size=500):
+    ensure_schema()
+    count = 0
+    with transaction.atomic():
+        SearchEntry.objects.all().delete()
+        for item_type, model in SEARCHABLE_MODELS.items():
+            items = model.objects.select_related("location").only(
+                "id", "title", "description", "location__name"
+            )
+            entries = [build_entry(item_type, item) for item in items.iterator()]
+            SearchEntry.objects.bulk_create(entries, batch_size=batch_size)
+            count += len(entries)
+        if connection.vendor == "sqlite":
+            # rewrite the index in one pass instead of trusting the triggers
+            # fired while the table was emptied and refilled
+            with connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return count
+
+
+# the hits are paged by keyset on (score, entry id): after is the pair of
+# the previous page's last hit and the next page reads past it, instead
+# of ranking and skipping every earlier hit again with an OFFSET
+
+
+def _search_sqlite(terms, limit, after):
+    # every term must match, the last one as a prefix for search as you type
+    match = " ".join(f'"{term}"' for term in terms[:-1])
+    match = f'{match} "{terms[-1]}"*'.strip()
+    seek, params = "", [match]
+    if after:
+        seek = "WHERE score < %s OR (score = %s AND id > %s)"
+        params += [after[0], after[0], after[1]]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT item_type, item_id, score, id FROM (
+                SELECT e.item_type, e.item_id, e.id,
+                       -bm25({FTS_TABLE}, 10.0, 1.0, 5.0) AS score
+                FROM {FTS_TABLE}
+                JOIN {TABLE} e ON e.id = {FTS_TABLE}.rowid
+                WHERE {FTS_TABLE} MATCH %s
+            )
+            {seek}
+            ORDER BY score DESC, id
+            LIMIT %s
+            """,
+            params + [limit],
+        )
+        return cursor.fetchall()
+
+
+def _search_postgres(terms, limit, after):
+    tsquery = " & ".join(f"{term}:*" for term in terms)
+    seek, params = "", [tsquery, tsquery]
+    if after:
+        seek = "WHERE score < %s OR (score = %s AND id > %s)"
+        params += [after[0], after[0], after[1]]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT item_type, item_id, score, id FROM (
+                SELECT item_type, item_id, id,
+                       ts_rank({PG_VECTOR}, to_tsquery('simple', %s)) AS score
+                FROM {TABLE}
+                WHERE ({PG_VECTOR}) @@ to_tsquery('simple', %s)
+            ) hits
+            {seek}
+            ORDER BY score DESC, id
+            LIMIT %s
+            """,
+            params + [limit],
+        )
+        return cursor.fetchall()
+
+
+def _search_fallback(terms, limit, after):
+    entries = SearchEntry.objects.all()
+    for term in terms:
+        entries = entries.filter(
+            Q(title__icontains=term)
+            | Q(body__icontains=term)
+            | Q(location__icontains=term)
+        )
+    # unranked, every score is 0 so the entry id alone orders the hits
+    if after:
+        entries = entries.filter(id__gt=after[1])
+    return [
+        (item_type, item_id, 0.0, entry_id)
+        for item_type, item_id, entry_id in entries.order_by("id").values_list(
+            "item_type", "item_id", "id"
+        )[:limit]
+    ]
+
+
+def search(query, limit=20, after=None):
+    """
+    Returns (item_type, item_id, score, entry_id) tuples, best matches
+    first, starting past the (score, entry_id) pair after.
+    """
+    terms = tokenize(query)
+    if not terms:
+        return []
+    if connection.vendor == "sqlite":
+        try:
+            return _search_sqlite(terms, limit, after)
+        except DatabaseError:
+            # sqlite built without FTS5
+            pass
+    elif connection.vendor == "postgresql":
+        return _search_postgres(terms, limit, after)
+    return _search_fallback(terms, limit, after)
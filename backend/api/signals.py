@@ -0,0 +1,220 @@
+from django.db import connections, transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_migrate,
+    post_save,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from activities import models as activities
+from activities.models import Activity
+from tours import models as tours
+from tours.models import Tour
+from packages import models as packages
+from packages.models import Package
+from location.models import Location
+from . import feeds, recommendations, search
+
+
+@receiver(post_migrate)
+def create_search_index(sender, using, **kwargs):
+    if sender.name == "api":
+        search.ensure_schema(connections[using])
+
+
+@receiver(post_save, sender=Activity)
+@receiver(post_save, sender=Tour)
+@receiver(post_save, sender=Package)
+def index_catalog_item(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    search.index_item(sender._meta.model_name, instance)
+
+
+@receiver(post_delete, sender=Activity)
+@receiver(post_delete, sender=Tour)
+@receiver(post_delete, sender=Package)
+def unindex_catalog_item(sender, instance, **kwargs):
+    search.remove_item(sender._meta.model_name, instance.pk)
+
+
+@receiver(post_save, sender=Activity)
+@receiver(post_save, sender=Tour)
+@receiver(post_save, sender=Package)
+def refresh_recommendations(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    recommendations.refresh_item(sender._meta.model_name, instance)
+
+
+@receiver(post_delete, sender=Activity)
+@receiver(post_delete, sender=Tour)
+@receiver(post_delete, sender=Package)
+def remove_recommendations(sender, instance, **kwargs):
+    recommendations.remove_item(sender._meta.model_name, instance.pk)
+
+
+def refresh_categorized_recommendations(model):
+    item_type = model._meta.model_name
+
+    def handler(sender, instance, action, reverse, pk_set, **kwargs):
+        if not reverse:
+            if action in ("post_add", "post_remove", "post_clear"):
+                recommendations.refresh_item(item_type, instance)
+            return
+        # category.activities.add(...) and friends: instance is the category
+        if action == "pre_clear":
+            instance._cleared_item_ids = list(
+                model.objects.filter(categories=instance).values_list("pk", flat=True)
+            )
+            return
+        if action == "post_clear":
+            pk_set = instance.__dict__.pop("_cleared_item_ids", [])
+        elif action not in ("post_add", "post_remove"):
+            return
+        for item in model.objects.filter(pk__in=pk_set):
+            recommendations.refresh_item(item_type, item)
+
+    return handler
+
+
+for model in [Activity, Tour, Package]:
+    m2m_changed.connect(
+        refresh_categorized_recommendations(model),
+        sender=model.categories.through,
+        weak=False,
+        dispatch_uid=f"recommendations-categories-{model._meta.label}",
+    )
+
+
+@receiver(post_save, sender=Location)
+def reindex_location(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    search.rename_location(instance)
+
+
+# every model rendered by the homepage feeds, directly or nested
+FEED_MODELS = [
+    Location,
+    Activity,
+    activities.ActivityOffer,
+    activities.Included,
+    activities.Excluded,
+    activities.Faq,
+    activities.Catalog,
+    Tour,
+    tours.TourOffer,
+    tours.ItineraryStep,
+    tours.Included,
+    tours.Excluded,
+    tours.Faq,
+    tours.Catalog,
+    Package,
+    packages.PackageOffer,
+    packages.ItineraryStep,
+    packages.Included,
+    packages.Excluded,
+    packages.Faq,
+    packages.Catalog,
+]
+
+
+def invalidate_feeds(sender, raw=False, **kwargs):
+    # once the write commits, a feed rebuilt before that would cache the
+    # old rows under the new version
+    if not raw:
+        transaction.on_commit(feeds.invalidate)
+
+
+for model in FEED_MODELS:
+    post_save.connect(
+        invalidate_feeds, sender=model, dispatch_uid=f"feeds-save-{model._meta.label}"
+    )
+    post_delete.connect(
+        invalidate_feeds, sender=model, dispatch_uid=f"feeds-delete-{model._meta.label}"
+    )
+
+for model in [Activity, Tour, Package]:
+    m2m_changed.connect(
+        invalidate_feeds,
+        sender=model.categories.through,
+        dispatch_uid=f"feeds-categories-{model._meta.label}",
+    )
+
+
+# child rows rendered by the detail endpoints and the foreign key to
+# their item, saving or deleting one bumps the item's updated_at
+CHILD_MODELS = {
+    activities.ActivityOffer: (Activity, "activity_id"),
+    activities.Included: (Activity, "activity_id"),
+    activities.Excluded: (Activity, "activity_id"),
+    activities.Faq: (Activity, "activity_id"),
+    activities.Catalog: (Activity, "activity_id"),
+    tours.TourOffer: (Tour, "tour_id"),
+    tours.ItineraryStep: (Tour, "tour_id"),
+    tours.Included: (Tour, "tour_id"),
+    tours.Excluded: (Tour, "tour_id"),
+    tours.Faq: (Tour, "tour_id"),
+    tours.Catalog: (Tour, "tour_id"),
+    packages.PackageOffer: (Package, "package_id"),
+    packages.ItineraryStep: (Package, "package_id"),
+    packages.Included: (Package, "package_id"),
+    packages.Excluded: (Package, "package_id"),
+    packages.Faq: (Package, "package_id"),
+    packages.Catalog: (Package, "package_id"),
+}
+
+
+def touch_parent(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    model, attname = CHILD_MODELS[sender]
+    # update() doesn't send post_save, so this doesn't cascade
+    model.objects.filter(pk=getattr(instance, attname)).update(
+        updated_at=timezone.now()
+    )
+
+
+for model in CHILD_MODELS:
+    post_save.connect(
+        touch_parent, sender=model, dispatch_uid=f"touch-save-{model._meta.label}"
+    )
+    post_delete.connect(
+        touch_parent, sender=model, dispatch_uid=f"touch-delete-{model._meta.label}"
+    )
+
+
+def touch_categorized_items(model):
+    def handler(sender, instance, action, reverse, pk_set, **kwargs):
+        if action not in ("post_add", "post_remove", "pre_clear"):
+            return
+        if not reverse:
+            items = model.objects.filter(pk=instance.pk)
+        elif action == "pre_clear":
+            # category.activities.clear(): instance is the category
+            items = model.objects.filter(categories=instance)
+        else:
+            items = model.objects.filter(pk__in=pk_set)
+        items.update(updated_at=timezone.now())
+
+    return handler
+
+
+for model in [Activity, Tour, Package]:
+    m2m_changed.connect(
+        touch_categorized_items(model),
+        sender=model.categories.through,
+        weak=False,
+        dispatch_uid=f"touch-categories-{model._meta.label}",
+    )
+
+
+@receiver(post_save, sender=Location)
+def touch_location_items(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    for model in [Activity, Tour, Package]:
+        model.objects.filter(location=instance).update(updated_at=timezone.now())
@@ -1,3 +1,483 @@
-from django.test import TestCase
+import hashlib
+from datetime import date, time, timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from activities.models import Activity, ActivityOffer, Faq, Included, Period
+from activities.serializers import ActivityCardSerializer
+from categories.models import Category
+from location.models import Location
+from packages.models import Package, PackageOffer
+from tours.models import ItineraryStep, Tour, TourOffer
+from users.models import CustomUser, Customer, Supplier
+from . import feeds
+from .models import SearchEntry
+from .pagination import encode_cursor
+
+
+class CatalogFixtureMixin:
+    @classmethod
+    def setUpTestData(cls):
+        user = CustomUser.objects.create_user(username="supplier", is_supplier=True)
+        cls.supplier = Supplier.objects.create(user=user)
+        cls.location = Location.objects.create(name="Byblos")
+        cls.category = Category.objects.create(name="Hiking")
+
+    @classmethod
+    def create_activity(cls, **kwargs):
+        today = date.today()
+        activity = Activity.objects.create(
+            supplier=cls.supplier,
+            location=cls.location,
+            title=kwargs.pop("title", "Kayaking"),
+            image="activities/kayak.webp",
+            description=kwargs.pop("description", "Paddle along the coast"),
+            price=20,
+            available_from=today,
+            available_to=today + timedelta(days=30),
+            map="<iframe></iframe>",
+            period=60,
+            unit="person",
+            start_time=time(9),
+            end_time=time(12),
+            **kwargs,
+        )
+        activity.categories.add(cls.category)
+        Included.objects.create(activity=activity, include="Gear")
+        Faq.objects.create(activity=activity, question="Age?", answer="12+")
+        ActivityOffer.objects.create(activity=activity, title="Single", price=20, stock=5)
+        ActivityOffer.objects.create(activity=activity, title="Double", price=35, stock=5)
+        return activity
+
+    @classmethod
+    def create_tour(cls, **kwargs):
+        today = date.today()
+        tour = Tour.objects.create(
+            supplier=cls.supplier,
+            location=cls.location,
+            title=kwargs.pop("title", "Cedars day trip"),
+            image="tours/cedars.webp",
+            description=kwargs.pop("description", "A day in the mountains"),
+            price=50,
+            available_from=today,
+            available_to=today + timedelta(days=30),
+            period=8,
+            unit="person",
+            pickup_location="Beirut",
+            pickup_time=time(8),
+            dropoff_time=time(18),
+            **kwargs,
+        )
+        tour.categories.add(cls.category)
+        ItineraryStep.objects.create(tour=tour, title="Cedars", activity="Walk")
+        TourOffer.objects.create(tour=tour, title="Standard", price=50, stock=10)
+        return tour
+
+    @classmethod
+    def create_package(cls, **kwargs):
+        today = date.today()
+        package = Package.objects.create(
+            supplier=cls.supplier,
+            location=cls.location,
+            title=kwargs.pop("title", "North weekend"),
+            image="packages/north.webp",
+            description=kwargs.pop("description", "Two days up north"),
+            duration="2 days",
+            available_from=today,
+            available_to=today + timedelta(days=30),
+            period=2,
+            unit="person",
+            pickup_location="Beirut",
+            pickup_time=time(8),
+            dropoff_time=time(18),
+            **kwargs,
+        )
+        package.categories.add(cls.category)
+        PackageOffer.objects.create(package=package, title="Standard", price=90, stock=4)
+        return package
+
+
+class ListingQueryBudgetTests(CatalogFixtureMixin, TestCase):
+    """
+    Listing endpoints must cost the same number of queries whether they
+    return one item or many.
+    """
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertConstantQueries(self, url, create, budget):
+        create()
+        single = self.count_queries(url)
+        for _ in range(4):
+            create()
+        many = self.count_queries(url)
+        self.assertEqual(single, many)
+        self.assertLessEqual(many, budget)
+
+    def test_all_activities(self):
+        url = reverse("get_all_activities")
+        self.assertConstantQueries(url, self.create_activity, budget=1)
+        self.assertConstantQueries(
+            url + "?expand=offers", self.create_activity, budget=7
+        )
+
+    def test_all_tours(self):
+        url = reverse("get_all_tours")
+        self.assertConstantQueries(url, self.create_tour, budget=1)
+        self.assertConstantQueries(url + "?expand=offers", self.create_tour, budget=8)
+
+    def test_all_packages(self):
+        url = reverse("get_all_packages")
+        self.assertConstantQueries(url, self.create_package, budget=1)
+        self.assertConstantQueries(
+            url + "?expand=offers", self.create_package, budget=8
+        )
+
+    def test_homepage_feeds(self):
+        def create_all():
+            # the feeds are invalidated once the writes commit
+            with self.captureOnCommitCallbacks(execute=True):
+                self.create_activity(featured=True)
+                self.create_tour(featured=True)
+                self.create_package(featured=True)
+
+        self.assertConstantQueries(reverse("latest_items_api"), create_all, budget=3)
+        self.assertConstantQueries(reverse("featured-items"), create_all, budget=3)
+        self.assertConstantQueries(
+            reverse("featured-items") + "?expand=offers", create_all, budget=23
+        )
+
+
+class SparseFieldsetTests(CatalogFixtureMixin, TestCase):
+    def test_listing_defaults_to_cards(self):
+        self.create_activity()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("get_all_activities"))
+        item = response.data["results"][0]
+        self.assertEqual(set(item), set(ActivityCardSerializer.Meta.fields))
+        # the heavy text columns are not read at all
+        self.assertNotIn('"description"', queries[0]["sql"])
+        self.assertNotIn('"map"', queries[0]["sql"])
+
+    def test_fields_and_expand(self):
+        self.create_activity()
+        url = reverse("get_all_activities")
+
+        response = self.client.get(url, {"fields": "id,title,faqs,unknown"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["error"], "Unknown fields: unknown.")
+        response = self.client.get(url, {"expand": "bogus"})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(url, {"fields": "id,title,faqs"})
+        item = response.data["results"][0]
+        self.assertEqual(set(item), {"id", "title", "faqs"})
+        self.assertEqual(item["faqs"][0]["question"], "Age?")
+
+        response = self.client.get(url, {"expand": "offers"})
+        item = response.data["results"][0]
+        self.assertEqual(
+            set(item), set(ActivityCardSerializer.Meta.fields) | {"offers"}
+        )
+        self.assertEqual(len(item["offers"]), 2)
+
+
+    def test_fields_keep_the_cursor_columns(self):
+        self.create_activity()
+        self.create_activity()
+        url = reverse("get_all_activities")
+        # the next cursor reads created_at without loading it back
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {"fields": "title", "page_size": 1})
+        self.assertEqual(response.data["results"], [{"title": "Kayaking"}])
+        self.assertIsNotNone(response.data["next"])
+
+
+class KeysetPaginationTests(CatalogFixtureMixin, TestCase):
+    def test_pages_cover_every_item_once(self):
+        created = {self.create_activity(title=f"Activity {i}").id for i in range(7)}
+        url = reverse("get_all_activities")
+        seen = []
+        params = {"page_size": 3}
+        while True:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            seen += [item["id"] for item in response.data["results"]]
+            if not response.data["next"]:
+                break
+            params["cursor"] = response.data["next"]
+        self.assertEqual(len(seen), len(created))
+        self.assertEqual(set(seen), created)
+        # newest first
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("get_all_tours"), {"cursor": "nope"})
+        self.assertEqual(response.status_code, 400)
+        # well formed, but not a datetime the query could use
+        for values in (["yesterday", 1], ["2026-02-30T10:00:00", 1], [None, "x"]):
+            response = self.client.get(
+                reverse("get_all_tours"), {"cursor": encode_cursor(values)}
+            )
+            self.assertEqual(response.status_code, 400, values)
+
+
+class SearchTests(CatalogFixtureMixin, TestCase):
+    def search(self, query):
+        response = self.client.get(reverse("search"), {"query": query})
+        self.assertEqual(response.status_code, 200)
+        return [(hit["type"], hit["item"]["id"]) for hit in response.data["results"]]
+
+    def test_index_follows_saves_and_deletes(self):
+        activity = self.create_activity(title="Kayaking in Batroun")
+        tour = self.create_tour(description="Visit the kayaking club")
+        self.create_package()
+
+        # title matches rank above description matches
+        self.assertEqual(
+            self.search("kayak"), [("activity", activity.id), ("tour", tour.id)]
+        )
+
+        activity.title = "Hiking"
+        activity.description = "Trails"
+        activity.save()
+        self.assertEqual(self.search("kayak"), [("tour", tour.id)])
+
+        tour.delete()
+        self.assertEqual(self.search("kayak"), [])
+
+    @override_settings(CATALOG_PAGE_SIZE=2)
+    def test_pages_follow_the_cursor(self):
+        # equal scores are ordered by entry, title matches come first
+        kayaking = [self.create_activity(title="Kayaking") for _ in range(3)]
+        tours = [self.create_tour(description="Kayaking club") for _ in range(2)]
+        url = reverse("search")
+        seen = []
+        params = {"query": "kayak"}
+        while True:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            seen += [
+                (hit["type"], hit["item"]["id"]) for hit in response.data["results"]
+            ]
+            if not response.data["next"]:
+                break
+            params["cursor"] = response.data["next"]
+        self.assertEqual(
+            seen,
+            [("activity", item.id) for item in kayaking]
+            + [("tour", item.id) for item in tours],
+        )
+
+        response = self.client.get(url, {"query": "kayak", "cursor": "nope"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_location_rename_is_indexed(self):
+        activity = self.create_activity()
+        self.location.name = "Jbeil"
+        self.location.save()
+        self.assertEqual(self.search("jbeil"), [("activity", activity.id)])
+
+    def test_rebuild(self):
+        activity = self.create_activity()
+        SearchEntry.objects.all().delete()
+        self.assertEqual(self.search("kayaking"), [])
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(self.search("kayaking"), [("activity", activity.id)])
+
+
+class FeedCacheTests(CatalogFixtureMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_feed_is_served_from_cache_until_invalidated(self):
+        activity = self.create_activity(featured=True)
+        url = reverse("featured-items")
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.data["activities"][0]["title"], "Kayaking")
+
+        # a child row change invalidates the feed, once it commits
+        with self.captureOnCommitCallbacks() as callbacks:
+            Faq.objects.create(activity=activity, question="Food?", answer="No")
+            with self.assertNumQueries(0):
+                self.client.get(url)
+        for callback in callbacks:
+            callback()
+        with self.assertNumQueries(3):
+            self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            activity.title = "Rafting"
+            activity.save()
+        response = self.client.get(url)
+        self.assertEqual(response.data["activities"][0]["title"], "Rafting")
+
+    def test_feeds_vary_on_fieldsets(self):
+        self.create_activity(featured=True)
+        url = reverse("featured-items")
+        self.client.get(url)
+        response = self.client.get(url, {"fields": "id"})
+        self.assertEqual(set(response.data["activities"][0]), {"id"})
+
+    def test_single_flight(self):
+        builds = []
+
+        def build():
+            builds.append(1)
+            return {"built": len(builds)}
+
+        self.assertEqual(feeds.get_feed("test", build), {"built": 1})
+        feeds.invalidate()
+        # another request holds the rebuild lock: serve the previous copy
+        key = f"catalog:feed:test:{hashlib.md5(repr(()).encode()).hexdigest()}"
+        cache.add(f"{key}:v{feeds.get_version()}:lock", True)
+        self.assertEqual(feeds.get_feed("test", build), {"built": 1})
+        self.assertEqual(len(builds), 1)
+
+
+class ConditionalDetailTests(CatalogFixtureMixin, TestCase):
+    def test_not_modified_until_a_child_row_changes(self):
+        activity = self.create_activity()
+        url = reverse("get_activity", args=[activity.id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["ETag"]
+        self.assertIn("Last-Modified", response.headers)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Faq.objects.create(activity=activity, question="Food?", answer="No")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_category_change_bumps_tour(self):
+        tour = self.create_tour()
+        url = reverse("get_tour", args=[tour.id])
+        etag = self.client.get(url).headers["ETag"]
+        tour.categories.clear()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["categories"], [])
+
+
+class RecommendationTests(CatalogFixtureMixin, TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create_user(username="customer", is_customer=True)
+        self.customer = Customer.objects.create(user=user)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def for_you(self):
+        response = self.client.get(reverse("for_you"))
+        self.assertEqual(response.status_code, 200)
+        return [(hit["type"], hit["item"]["id"], hit["score"]) for hit in response.data["results"]]
+
+    def test_recomputed_on_preference_and_catalog_changes(self):
+        other = Category.objects.create(name="Sea")
+        activity = self.create_activity()
+        tour = self.create_tour()
+        self.assertEqual(self.for_you(), [])
+
+        self.client.put(
+            reverse("update-customer-locations"),
+            {"location": [self.location.id]},
+            format="json",
+        )
+        self.client.put(
+            reverse("update-customer-preferences"),
+            {"preferences": [self.category.id, other.id]},
+            format="json",
+        )
+        self.assertEqual(
+            self.for_you(), [("tour", tour.id, 1), ("activity", activity.id, 1)]
+        )
+
+        # matching one more preferred category ranks the activity first
+        activity.categories.add(other)
+        self.assertEqual(
+            self.for_you(), [("activity", activity.id, 2), ("tour", tour.id, 1)]
+        )
+
+        tour.categories.clear()
+        self.assertEqual(self.for_you(), [("activity", activity.id, 2)])
+
+        package = self.create_package()
+        self.assertEqual(
+            self.for_you(),
+            [("activity", activity.id, 2), ("package", package.id, 1)],
+        )
+
+    def test_rebuild_command_fills_existing_customers(self):
+        activity = self.create_activity()
+        # set before the table existed, no signal wrote its rows
+        self.customer.location.add(self.location)
+        self.customer.preferences.add(self.category)
+        self.assertEqual(self.for_you(), [])
+        call_command("rebuild_recommendations", stdout=StringIO())
+        self.assertEqual(self.for_you(), [("activity", activity.id, 1)])
+
+    def test_constant_queries(self):
+        self.customer.location.add(self.location)
+        self.customer.preferences.add(self.category)
+        for _ in range(3):
+            self.create_activity()
+            self.create_tour()
+        # customer, the index page, one query per item type
+        with self.assertNumQueries(4):
+            self.for_you()
+
+
+class CalendarTests(CatalogFixtureMixin, TestCase):
+    def test_activity_offer_calendar(self):
+        activity = self.create_activity()
+        offer = activity.offers.first()
+        today = date.today()
+        tomorrow = today + timedelta(days=1)
+        for day, hour, stock, price in [
+            (today, 9, 3, 20),
+            (today, 10, 0, 15),
+            (tomorrow, 9, 5, 25),
+            (today + timedelta(days=40), 9, 5, 25),
+        ]:
+            Period.objects.create(
+                day=day,
+                time_from=time(hour),
+                time_to=time(hour + 1),
+                stock=stock,
+                price=price,
+                activity_offer=offer,
+            )
+        url = reverse("activity_offer_calendar", args=[offer.id])
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                url, {"from": today, "to": today + timedelta(days=7)}
+            )
+        days = [
+            (day["day"], day["min_price"], day["stock"], day["slots"])
+            for day in response.data["days"]
+        ]
+        self.assertEqual(days, [(today, 15, 3, 2), (tomorrow, 25, 5, 1)])
+
+    def test_invalid_window(self):
+        tour = self.create_tour()
+        url = reverse("tour_offer_calendar", args=[tour.tour_offer.first().id])
+        response = self.client.get(url, {"from": "2024-02-10", "to": "2024-02-01"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse("package_offer_calendar", args=[999]))
+        self.assertEqual(response.status_code, 404)
@@ -5,9 +5,14 @@ from booking.views import (
     activity_booking_create,
     tour_booking_create,
     package_booking_create,
+    create_hold,
+    release_hold,
+    batch_booking_create,
+    booking_qr_code,
 )
 from dashboard.views import (
     supplier_offers,
+    supplier_offer_list,
     supplier_dashboard,
     supplier_activity_bookings,
     customer_activity_bookings,
@@ -24,6 +29,8 @@ from dashboard.views import (
     bookings_per_month,
     customers_per_month,
     sales_per_month,
+    supplier_analytics,
+    supplier_booking_inbox,
 )
 from activities.views import (
     get_activities,
@@ -31,6 +38,7 @@ from activities.views import (
     get_offers_by_activity,
     get_activity,
     get_all_activities,
+    get_activity_offer_calendar,
     reserve_activity,
     block_activity_day,
 )
@@ -39,6 +47,7 @@ from packages.views import (
     get_package_days,
     get_package,
     get_all_packages,
+    get_package_offer_calendar,
     reserve_package,
     block_package_day,
 )
@@ -47,6 +56,7 @@ from tours.views import (
     get_tour_days,
     get_tour,
     get_all_tours,
+    get_tour_offer_calendar,
     reserve_tour,
     block_tourday,
 )
@@ -75,6 +85,11 @@ urlpatterns = [
     path("block-package-day/", block_package_day, name="block_package_day"),
     path("supplier-dashboard/", supplier_dashboard, name="supplier_dashboard"),
     path("supplier-offers/", supplier_offers, name="supplier_offers"),
+    path(
+        "supplier-offers/<str:offer_type>/",
+        supplier_offer_list,
+        name="supplier_offer_list",
+    ),
     path("all-favorites/", all_favorites, name="all_favorites"),
     path(
         "favorite-activity/<int:activity_id>/",
@@ -119,6 +134,21 @@ urlpatterns = [
         get_periods_by_offer_and_day,
         name="get_daily_periods",
     ),
+    path(
+        "offer/<int:offer_id>/calendar/",
+        get_activity_offer_calendar,
+        name="activity_offer_calendar",
+    ),
+    path(
+        "touroffer/<int:offer_id>/calendar/",
+        get_tour_offer_calendar,
+        name="tour_offer_calendar",
+    ),
+    path(
+        "packageoffer/<int:offer_id>/calendar/",
+        get_package_offer_calendar,
+        name="package_offer_calendar",
+    ),
     path("bookingactivity/", activity_booking_create, name="create_activity_booking"),
     path(
         "supplier/bookings/",
@@ -142,6 +172,14 @@ urlpatterns = [
     ),
     path("bookingtour/", tour_booking_create, name="create_tour_booking"),
     path("bookingpackage/", package_booking_create, name="create_package_booking"),
+    path("bookingbatch/", batch_booking_create, name="create_batch_booking"),
+    path(
+        "bookings/<str:booking_type>/<int:booking_id>/qr.<str:image_format>",
+        booking_qr_code,
+        name="booking_qr_code",
+    ),
+    path("holds/", create_hold, name="create_hold"),
+    path("holds/<uuid:token>/", release_hold, name="release_hold"),
     path(
         "supplier/packagesb/",
         supplier_packages_bookings,
@@ -185,4 +223,6 @@ urlpatterns = [
     path(
         "supplier/customers-per-month/", customers_per_month, name="customers-per-month"
     ),
+    path("supplier/analytics/", supplier_analytics, name="supplier-analytics"),
+    path("supplier/inbox/", supplier_booking_inbox, name="supplier-booking-inbox"),
 ]
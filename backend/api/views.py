@@ -3,146 +3,181 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework import status
 from activities.models import Activity
-from activities.serializers import ActivitySerializer
+from activities.serializers import ActivitySerializer, ActivityCardSerializer
 from tours.models import Tour
-from tours.serializers import TourSerializer
+from tours.serializers import TourSerializer, TourCardSerializer
 from packages.models import Package
-from packages.serializers import PackageSerializer
+from packages.serializers import PackageSerializer, PackageCardSerializer
 from users.models import Customer
-from django.db.models import Q
+from django.conf import settings
+from django.db.models import FloatField, IntegerField
 from django.utils import timezone
+from . import feeds, search as search_index
+from .eager import get_listing_serializer, serialize_listing
+from .models import Recommendation
+from .pagination import (
+    KeysetPagination,
+    InvalidCursor,
+    decode_cursor,
+    encode_cursor,
+)
 
 
 @api_view(["GET"])
 @permission_classes([AllowAny])
 def for_you_items(request):
     customer = Customer.objects.get(user=request.user)
-    preferred_locations = customer.location.all()
-    preferred_categories = customer.preferences.all()
+    # precomputed by api.recommendations, best matches first
+    entries = Recommendation.objects.filter(
+        customer=customer, available_to__gte=timezone.now().date()
+    ).values("id", "item_type", "item_id", "score")
+    paginator = KeysetPagination(ordering=("-score", "-id"))
+    try:
+        page = paginator.paginate_queryset(entries, request)
+    except InvalidCursor as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    hits = [(entry["item_type"], entry["item_id"], entry["score"]) for entry in page]
+    return paginator.get_paginated_response(serialize_hits(request, hits))
 
-    current_time = timezone.now()
-    activities = Activity.objects.filter(
-        location__in=preferred_locations,
-        categories__in=preferred_categories,
-        available_to__gte=current_time,
-    ).distinct()
-    packages = Package.objects.filter(
-        location__in=preferred_locations,
-        categories__in=preferred_categories,
-        available_to__gte=current_time,
-    ).distinct()
-    tours = Tour.objects.filter(
-        location__in=preferred_locations,
-        categories__in=preferred_categories,
-        available_to__gte=current_time,
-    ).distinct()
-
-    activity_serializer = ActivitySerializer(activities, many=True)
-    package_serializer = PackageSerializer(packages, many=True)
-    tour_serializer = TourSerializer(tours, many=True)
-
-    combined_results = {
-        "activities": activity_serializer.data,
-        "packages": package_serializer.data,
-        "tours": tour_serializer.data,
-    }
 
-    return Response(combined_results)
+def feed_vary(request):
+    # the only request input the homepage feeds depend on
+    return (request.query_params.get("fields"), request.query_params.get("expand"))
 
 
-@api_view(["GET"])
-@permission_classes([AllowAny])
-def latest_items_api(request):
+def build_latest_items(request):
     current_time = timezone.now()
     activities = Activity.objects.filter(
         available_to__gte=current_time,
-    ).order_by(
-        "-created_at"
-    )[:4]
+    ).order_by("-created_at")
     tours = Tour.objects.filter(
         available_to__gte=current_time,
-    ).order_by(
-        "-created_at"
-    )[:3]
+    ).order_by("-created_at")
     packages = Package.objects.filter(
         available_to__gte=current_time,
-    ).order_by(
-        "-created_at"
-    )[:3]
-    activity_serializer = ActivitySerializer(activities, many=True)
-    tour_serializer = TourSerializer(tours, many=True)
-    package_serializer = PackageSerializer(packages, many=True)
-    data = {
-        "activities": activity_serializer.data,
-        "tours": tour_serializer.data,
-        "packages": package_serializer.data,
+    ).order_by("-created_at")
+    return {
+        "activities": serialize_listing(
+            request, ActivityCardSerializer, ActivitySerializer, activities, limit=4
+        ),
+        "tours": serialize_listing(
+            request, TourCardSerializer, TourSerializer, tours, limit=3
+        ),
+        "packages": serialize_listing(
+            request, PackageCardSerializer, PackageSerializer, packages, limit=3
+        ),
     }
-    return Response(data)
 
 
-@api_view(["GET"])
-@permission_classes([AllowAny])
-def featured_items_api(request):
+def build_featured_items(request):
     # Fetch featured items from each model
     current_time = timezone.now()
     activities = Activity.objects.filter(
         featured=True,
         available_to__gte=current_time,
-    ).order_by("-created_at")[:10]
+    ).order_by("-created_at")
     tours = Tour.objects.filter(
         featured=True,
         available_to__gte=current_time,
-    ).order_by("-created_at")[:10]
+    ).order_by("-created_at")
     packages = Package.objects.filter(
         featured=True,
         available_to__gte=current_time,
-    ).order_by("-created_at")[:10]
-    activity_serializer = ActivitySerializer(activities, many=True)
-    tour_serializer = TourSerializer(tours, many=True)
-    package_serializer = PackageSerializer(packages, many=True)
-    data = {
-        "activities": activity_serializer.data,
-        "tours": tour_serializer.data,
-        "packages": package_serializer.data,
+    ).order_by("-created_at")
+    return {
+        "activities": serialize_listing(
+            request, ActivityCardSerializer, ActivitySerializer, activities, limit=10
+        ),
+        "tours": serialize_listing(
+            request, TourCardSerializer, TourSerializer, tours, limit=10
+        ),
+        "packages": serialize_listing(
+            request, PackageCardSerializer, PackageSerializer, packages, limit=10
+        ),
     }
+
+
+# both feeds are served from the cache, api.signals invalidates them
+# whenever a catalog item or one of its child rows changes
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def latest_items_api(request):
+    data = feeds.get_feed(
+        "latest", lambda: build_latest_items(request), vary=feed_vary(request)
+    )
     return Response(data)
 
 
 @api_view(["GET"])
 @permission_classes([AllowAny])
-def search(request):
-    query = request.GET.get("query", "")
+def featured_items_api(request):
+    data = feeds.get_feed(
+        "featured", lambda: build_featured_items(request), vary=feed_vary(request)
+    )
+    return Response(data)
 
-    if query:
-        activity_results = Activity.objects.filter(
-            Q(title__icontains=query)
-            | Q(description__icontains=query)
-            | Q(location__name__icontains=query)
-        )
-        tour_results = Tour.objects.filter(
-            Q(title__icontains=query)
-            | Q(description__icontains=query)
-            | Q(location__name__icontains=query)
-        )
-        package_results = Package.objects.filter(
-            Q(title__icontains=query)
-            | Q(description__icontains=query)
-            | Q(location__name__icontains=query)
+
+CATALOG_SERIALIZERS = {
+    "activity": (ActivityCardSerializer, ActivitySerializer),
+    "tour": (TourCardSerializer, TourSerializer),
+    "package": (PackageCardSerializer, PackageSerializer),
+}
+
+
+def serialize_hits(request, hits):
+    """
+    Renders (item_type, item_id, score) hits in their order, loading the
+    items with one planned query per item type.
+    """
+    items = {}
+    for item_type, serializer_classes in CATALOG_SERIALIZERS.items():
+        ids = [item_id for hit_type, item_id, score in hits if hit_type == item_type]
+        if not ids:
+            continue
+        model = search_index.SEARCHABLE_MODELS[item_type]
+        serializer_class, fields = get_listing_serializer(request, *serializer_classes)
+        objects = list(
+            serializer_class.plan_queryset(model.objects.filter(id__in=ids), fields)
         )
-    else:
-        activity_results = Activity.objects.none()
-        tour_results = Tour.objects.none()
-        package_results = Package.objects.none()
+        serializer = serializer_class(objects, many=True, fields=fields)
+        for obj, data in zip(objects, serializer.data):
+            items[(item_type, obj.id)] = data
+    return [
+        {"type": item_type, "score": score, "item": items[(item_type, item_id)]}
+        for item_type, item_id, score in hits
+        # skip entries whose item was deleted without the signal firing
+        if (item_type, item_id) in items
+    ]
+
+
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def search(request):
+    """
+    Ranked hits as {"next": cursor, "results": [{"type", "score", "item"}]},
+    replacing the former {"activities", "tours", "packages"} lists. The
+    next page is requested with ?cursor=next.
+    """
+    query = request.GET.get("query", "")
+    after = None
+    cursor = request.GET.get("cursor")
+    if cursor:
+        try:
+            after = decode_cursor(cursor, 2, [FloatField(), IntegerField()])
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    page_size = settings.CATALOG_PAGE_SIZE
 
-    activity_serializer = ActivitySerializer(activity_results, many=True)
-    tour_serializer = TourSerializer(tour_results, many=True)
-    package_serializer = PackageSerializer(package_results, many=True)
+    # ranked hits from the full text index, one extra to know if there's more
+    hits = search_index.search(query, limit=page_size + 1, after=after)
+    next_cursor = None
+    if len(hits) > page_size:
+        hits = hits[:page_size]
+        item_type, item_id, score, entry_id = hits[-1]
+        next_cursor = encode_cursor([score, entry_id])
+    hits = [(item_type, item_id, score) for item_type, item_id, score, _ in hits]
 
     return Response(
-        {
-            "activities": activity_serializer.data,
-            "tours": tour_serializer.data,
-            "packages": package_serializer.data,
-        },
+        {"next": next_cursor, "results": serialize_hits(request, hits)},
         status=status.HTTP_200_OK,
     )
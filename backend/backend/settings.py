@@ -131,6 +131,20 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# the homepage feeds are cached here, point this at memcached/redis in
+# production so every worker shares them
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# seconds the homepage feeds are kept, signals invalidate them earlier
+FEED_CACHE_TIMEOUT = 300
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -176,3 +190,20 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# default number of items per page on the catalog listings
+CATALOG_PAGE_SIZE = 20
+
+# seconds a checkout hold keeps stock aside for a customer
+STOCK_HOLD_TTL = 600
+
+# also store each confirmed booking's QR code as a file under qrcodes/
+# (rendered by the qr_worker command), the QR endpoint doesn't need it
+QR_CODE_FILES = False
+
+# seconds an Idempotency-Key of the booking endpoints is remembered, the
+# expire_idempotency_keys command deletes the older ones
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+# seconds a key stays locked by a request still running, so a key whose
+# worker was killed answers 409 only this long
+IDEMPOTENCY_IN_PROGRESS_TTL = 5 * 60
@@ -0,0 +1,371 @@
+import random
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import date, time as clock, timedelta
+
+from django.db import OperationalError, connection
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from activities.models import Activity, ActivityOffer, Period
+from location.models import Location
+from packages.models import Package, PackageDay, PackageOffer
+from tours.models import Tour, TourDay, TourOffer
+from users.models import CustomUser, Customer, Supplier
+from . import ledger
+from .inventory import decrement
+from .models import ActivityBooking, PackageBooking, StockMovement, TourBooking
+
+
+# Load test of the booking views: a synthetic catalog is seeded with a few
+# slots of small stock, then N threads each with their own connection and
+# test client post bookings (or confirmations) at random slots, through
+# the whole middleware and view stack. The report is plain JSON so runs
+# on two commits can be diffed. It writes to the configured database and
+# deletes what it seeded afterwards.
+
+SCENARIOS = ("activity", "tour", "package", "confirm")
+# days of a seeded package
+PACKAGE_PERIOD = 3
+
+
+class Catalog:
+    """
+    The seeded supplier, customers and slots of one run.
+    """
+
+    def __init__(self, clients, slots, stock):
+        run = uuid.uuid4().hex[:8]
+        start = date.today() + timedelta(days=1)
+        end = start + timedelta(days=slots + PACKAGE_PERIOD)
+        self.location = Location.objects.create(name=f"benchmark-{run}")
+        self.supplier = Supplier.objects.create(
+            user=CustomUser.objects.create_user(
+                username=f"benchmark-{run}-supplier", is_supplier=True
+            )
+        )
+        self.customers = [
+            Customer.objects.create(
+                user=CustomUser.objects.create_user(
+                    username=f"benchmark-{run}-{i}", is_customer=True
+                )
+            )
+            for i in range(clients)
+        ]
+        common = {
+            "supplier": self.supplier,
+            "location": self.location,
+            "image": "benchmark.webp",
+            "description": "Benchmark",
+            "available_from": start,
+            "available_to": end,
+            "unit": "person",
+        }
+        trip = {
+            "pickup_location": "Beirut",
+            "pickup_time": clock(8),
+            "dropoff_time": clock(18),
+        }
+
+        activity = Activity.objects.create(
+            title="Benchmark activity",
+            price=10,
+            map="",
+            period=60,
+            start_time=clock(9),
+            end_time=clock(10),
+            **common,
+        )
+        offer = ActivityOffer.objects.create(
+            activity=activity, title="Benchmark", price=10, stock=stock
+        )
+        self.periods = [
+            Period.objects.create(
+                activity_offer=offer,
+                day=start + timedelta(days=i),
+                time_from=clock(9),
+                time_to=clock(10),
+                stock=stock,
+                price=10,
+            )
+            for i in range(slots)
+        ]
+
+        tour = Tour.objects.create(
+            title="Benchmark tour", price=10, period=8, **trip, **common
+        )
+        offer = TourOffer.objects.create(
+            tour=tour, title="Benchmark", price=10, stock=stock
+        )
+        self.tourdays = [
+            TourDay.objects.create(
+                tour_offer=offer, day=start + timedelta(days=i), stock=stock, price=10
+            )
+            for i in range(slots)
+        ]
+
+        package = Package.objects.create(
+            title="Benchmark package",
+            duration=f"{PACKAGE_PERIOD} days",
+            period=PACKAGE_PERIOD,
+            **trip,
+            **common,
+        )
+        self.package_offer = PackageOffer.objects.create(
+            package=package, title="Benchmark", price=10, stock=stock
+        )
+        self.package_days = [
+            PackageDay.objects.create(
+                package_offer=self.package_offer,
+                day=start + timedelta(days=i),
+                stock=stock,
+                price=10,
+            )
+            for i in range(slots + PACKAGE_PERIOD - 1)
+        ]
+        self.start_dates = [start + timedelta(days=i) for i in range(slots)]
+        self.stock = stock
+        self.bookings = []
+
+    def book_tours(self, quantity):
+        """
+        Fills the tour days with bookings waiting for confirmation, for
+        the confirm scenario.
+        """
+        for tourday in self.tourdays:
+            for i in range(self.stock // quantity):
+                booking = TourBooking.objects.create(
+                    tourday=tourday,
+                    customer=self.customers[i % len(self.customers)],
+                    quantity=quantity,
+                    price=quantity * tourday.price,
+                )
+                decrement(TourDay, tourday.pk, quantity, booking=booking)
+                self.bookings.append(booking.pk)
+
+    def fill(self, count, days=365, confirmed=0.7, seed=0):
+        """
+        Inserts count bookings of the three types spread evenly over the
+        past days, without taking stock: data for the read side benchmarks.
+        """
+        rng = random.Random(seed)
+        now = timezone.now()
+        per_day = -(-count // days)
+        created = 0
+        for day in range(days):
+            batch = {ActivityBooking: [], TourBooking: [], PackageBooking: []}
+            for i in range(min(per_day, count - created)):
+                customer = rng.choice(self.customers)
+                quantity = rng.randint(1, 4)
+                kind = (created + i) % 3
+                if kind == 0:
+                    booking = ActivityBooking(period=rng.choice(self.periods))
+                elif kind == 1:
+                    booking = TourBooking(tourday=rng.choice(self.tourdays))
+                else:
+                    start = rng.choice(self.start_dates)
+                    booking = PackageBooking(
+                        package_offer=self.package_offer,
+                        start_date=start,
+                        end_date=start + timedelta(days=PACKAGE_PERIOD - 1),
+                    )
+                booking.customer = customer
+                booking.quantity = quantity
+                booking.price = quantity * 10
+                booking.confirmed = rng.random() < confirmed
+                batch[type(booking)].append(booking)
+            created_at = now - timedelta(days=day, minutes=rng.randint(0, 1439))
+            for model, bookings in batch.items():
+                model.objects.bulk_create(bookings, batch_size=500)
+                # created_at is auto_now_add, backdated once inserted
+                model.objects.filter(pk__in=[b.pk for b in bookings]).update(
+                    created_at=created_at
+                )
+                created += len(bookings)
+            if created >= count:
+                break
+        return created
+
+    def slots(self):
+        return {
+            Period: [p.pk for p in self.periods],
+            TourDay: [d.pk for d in self.tourdays],
+            PackageDay: [d.pk for d in self.package_days],
+        }
+
+    def oversold(self):
+        """
+        Units sold beyond a slot's seeded stock, summed over the slots.
+        """
+        sold = Counter()
+        for period_id, quantity in ActivityBooking.objects.filter(
+            period__in=self.periods
+        ).values_list("period_id", "quantity"):
+            sold["period", period_id] += quantity
+        for tourday_id, quantity in TourBooking.objects.filter(
+            tourday__in=self.tourdays
+        ).values_list("tourday_id", "quantity"):
+            sold["tourday", tourday_id] += quantity
+        days = {day.day: day.pk for day in self.package_days}
+        for start, end, quantity in PackageBooking.objects.filter(
+            package_offer=self.package_offer
+        ).values_list("start_date", "end_date", "quantity"):
+            while start <= end:
+                sold["packageday", days[start]] += quantity
+                start += timedelta(days=1)
+        return sum(max(0, units - self.stock) for units in sold.values())
+
+    def drift(self):
+        return sum(
+            ledger.drift(model).filter(pk__in=ids).count()
+            for model, ids in self.slots().items()
+        )
+
+    def delete(self):
+        for model, ids in self.slots().items():
+            StockMovement.objects.filter(
+                slot_type=model._meta.model_name, slot_id__in=ids
+            ).delete()
+        # the catalog goes with its location, the bookings with their users
+        self.location.delete()
+        CustomUser.objects.filter(
+            pk__in=[self.supplier.user_id, *(c.user_id for c in self.customers)]
+        ).delete()
+
+
+def request_factory(scenario, catalog, quantity):
+    """
+    A function drawing one request of the scenario, (user, url, data),
+    from a random generator.
+    """
+    if scenario == "activity":
+        url = reverse("create_activity_booking")
+        return lambda rng, customer: (
+            customer.user,
+            url,
+            {"period_id": rng.choice(catalog.periods).pk, "quantity": quantity},
+        )
+    if scenario == "tour":
+        url = reverse("create_tour_booking")
+        return lambda rng, customer: (
+            customer.user,
+            url,
+            {"tourday_id": rng.choice(catalog.tourdays).pk, "quantity": quantity},
+        )
+    if scenario == "package":
+        url = reverse("create_package_booking")
+        return lambda rng, customer: (
+            customer.user,
+            url,
+            {
+                "package_offer_id": catalog.package_offer.pk,
+                "start_date": str(rng.choice(catalog.start_dates)),
+                "quantity": quantity,
+            },
+        )
+    # several suppliers' clicks on the same bookings
+    return lambda rng, customer: (
+        catalog.supplier.user,
+        reverse("confirm_tour_booking", args=[rng.choice(catalog.bookings)]),
+        {},
+    )
+
+
+def percentile(values, p):
+    # nearest rank
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))]
+
+
+def run(scenario, threads=8, requests=25, slots=3, stock=20, quantity=1, seed=0):
+    """
+    Runs one scenario on a freshly seeded catalog and returns its report.
+    """
+    catalog = Catalog(threads, slots, stock)
+    try:
+        if scenario == "confirm":
+            catalog.book_tours(quantity)
+        draw = request_factory(scenario, catalog, quantity)
+        latencies = []
+        statuses = Counter()
+        failures = defaultdict(int)
+        # 2xx answers per url, a booking confirmed twice shows up here
+        answered = Counter()
+        lock = threading.Lock()
+        start = threading.Barrier(threads)
+
+        def client(index):
+            rng = random.Random(seed * 1000 + index)
+            api = APIClient()
+            customer = catalog.customers[index]
+            try:
+                start.wait()
+                for _ in range(requests):
+                    user, url, data = draw(rng, customer)
+                    api.force_authenticate(user)
+                    began = time.perf_counter()
+                    try:
+                        response = api.post(url, data, format="json")
+                        outcome = response.status_code
+                        if outcome >= 500 and "lock" in str(response.data).lower():
+                            outcome = "lock_errors"
+                    except OperationalError:
+                        # sqlite "database is locked", postgres lock timeouts
+                        outcome = "lock_errors"
+                    except Exception:
+                        outcome = "errors"
+                    elapsed = time.perf_counter() - began
+                    with lock:
+                        latencies.append(elapsed)
+                        if isinstance(outcome, int):
+                            statuses[outcome] += 1
+                            answered[url] += outcome < 300
+                        else:
+                            failures[outcome] += 1
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=client, args=(i,)) for i in range(threads)]
+        began = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        seconds = time.perf_counter() - began
+
+        latencies.sort()
+        ok = sum(n for code, n in statuses.items() if code < 300)
+        report = {
+            "scenario": scenario,
+            "database": connection.vendor,
+            "threads": threads,
+            "requests": threads * requests,
+            "slots": slots,
+            "stock": stock,
+            "quantity": quantity,
+            "seconds": round(seconds, 3),
+            "throughput": round(len(latencies) / seconds, 1) if seconds else None,
+            "latency_ms": {
+                name: round(percentile(latencies, p) * 1000, 2) if latencies else None
+                for name, p in (("p50", 50), ("p95", 95), ("p99", 99), ("max", 100))
+            },
+            "status": {str(code): n for code, n in sorted(statuses.items())},
+            "succeeded": ok,
+            "rejected": sum(n for code, n in statuses.items() if 400 <= code < 500),
+            "lock_errors": failures["lock_errors"],
+            "errors": failures["errors"]
+            + sum(n for code, n in statuses.items() if code >= 500),
+            "oversold": catalog.oversold(),
+            "ledger_drift": catalog.drift(),
+        }
+        if scenario == "confirm":
+            # confirmations answered 200 for a booking already confirmed
+            report["oversold"] = sum(n - 1 for n in answered.values() if n > 1)
+            report["bookings"] = len(catalog.bookings)
+        return report
+    finally:
+        catalog.delete()
@@ -0,0 +1,155 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+
+# Mobile clients retry a booking POST when the connection drops. With an
+# Idempotency-Key header the first request's response is stored and every
+# retry of it gets that response back instead of another booking.
+
+HEADER = "Idempotency-Key"
+KEY_TTL = getattr(settings, "IDEMPOTENCY_KEY_TTL", 24 * 60 * 60)
+# the lease of a key whose request is running, a retry takes the key over
+# once it lapses (the worker running it was likely killed)
+IN_PROGRESS_TTL = getattr(settings, "IDEMPOTENCY_IN_PROGRESS_TTL", 5 * 60)
+
+
+def fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.path}\n{body}".encode()).hexdigest()
+
+
+def claim(user, key, request_fingerprint):
+    """
+    The key's row, created in progress when it is new, taken over when it
+    expired (a stored response past KEY_TTL or a lapsed lease). The write
+    commits on its own so a concurrent retry sees it.
+    """
+    now = timezone.now()
+    lease = now + timedelta(seconds=IN_PROGRESS_TTL)
+    record = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if record is not None and record.expires_at > now:
+        return record, False
+    if record is not None:
+        # conditional, a single retry takes the key over
+        taken = IdempotencyKey.objects.filter(
+            pk=record.pk, expires_at=record.expires_at
+        ).update(
+            fingerprint=request_fingerprint,
+            status=IdempotencyKey.IN_PROGRESS,
+            response_status=None,
+            response_content=None,
+            response_content_type="",
+            expires_at=lease,
+        )
+        if taken:
+            record.fingerprint = request_fingerprint
+            record.status = IdempotencyKey.IN_PROGRESS
+            record.expires_at = lease
+            return record, True
+        return IdempotencyKey.objects.get(pk=record.pk), False
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(
+                user=user,
+                key=key,
+                fingerprint=request_fingerprint,
+                expires_at=lease,
+            ), True
+    except IntegrityError:
+        # a concurrent retry created it first
+        return IdempotencyKey.objects.get(user=user, key=key), False
+
+
+def idempotent(view):
+    """
+    Put below @api_view, the request is authenticated and parsed by then.
+    A reused key answers 422 when the request differs from the first one
+    and 409 while the first one is still running, for IN_PROGRESS_TTL at
+    most: a retry after that runs the request again. Server errors aren't
+    stored, the client may retry them with the same key.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+        if len(key) > 255:
+            return Response(
+                {"error": f"{HEADER} is at most 255 characters."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        request_fingerprint = fingerprint(request)
+        record, created = claim(request.user, key, request_fingerprint)
+        if not created:
+            if record.fingerprint != request_fingerprint:
+                return Response(
+                    {"error": f"{HEADER} was already used for another request."},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            if record.status == IdempotencyKey.IN_PROGRESS:
+                return Response(
+                    {"error": "The original request is still being processed."},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            response = HttpResponse(
+                record.response_content,
+                status=record.response_status,
+                content_type=record.response_content_type,
+            )
+            response["Idempotent-Replayed"] = "true"
+            return response
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+        if response.status_code >= 500:
+            record.delete()
+            return response
+        # render it as @api_view would, so the stored bytes are the ones sent
+        view_instance = request.parser_context["view"]
+        response.accepted_renderer = request.accepted_renderer
+        response.accepted_media_type = request.accepted_media_type
+        response.renderer_context = view_instance.get_renderer_context()
+        response.render()
+        IdempotencyKey.objects.filter(pk=record.pk).update(
+            status=IdempotencyKey.DONE,
+            response_status=response.status_code,
+            response_content=response.content,
+            response_content_type=response["Content-Type"],
+            expires_at=timezone.now() + timedelta(seconds=KEY_TTL),
+        )
+        return response
+
+    return wrapper
+
+
+def expire(batch_size=1000):
+    """
+    Deletes the expired keys, one DELETE per batch. Returns how many.
+    """
+    deleted = 0
+    now = timezone.now()
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=now)
+            .order_by("expires_at")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,238 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from rest_framework import serializers
+
+from . import ledger
+from .models import StockHold, StockMovement
+
+
+# Every stock change of a bookable slot (Period, TourDay, PackageDay) goes
+# through here. Stock is never read, checked and saved back: the check is
+# the WHERE clause of a single conditional UPDATE, so concurrent bookings
+# of the last seats can't both succeed and no row lock is held longer than
+# that statement. What's available is the stock minus the active holds.
+# Each change writes its movements to the stock ledger (booking.ledger)
+# in the same transaction.
+
+HOLD_TTL = getattr(settings, "STOCK_HOLD_TTL", 600)
+
+
+class OutOfStock(Exception):
+    def __init__(self, message="Not enough stock available.", available=None):
+        super().__init__(message)
+        self.available = available
+
+
+class InvalidHold(Exception):
+    pass
+
+
+def positive(quantity):
+    # a quantity below 1 would pass the stock guard and add stock
+    quantity = int(quantity)
+    if quantity < 1:
+        raise ValueError("Quantity must be at least 1.")
+    return quantity
+
+
+def active_holds(model):
+    return StockHold.objects.filter(
+        slot_type=model._meta.model_name,
+        status=StockHold.ACTIVE,
+        expires_at__gt=timezone.now(),
+    )
+
+
+def held(model):
+    """
+    The units of the outer slot row held by active holds, as a correlated
+    aggregate over the (slot_type, slot_id, status, expires_at) index.
+    """
+    holds = active_holds(model).filter(slot_id=OuterRef("pk"))
+    return Coalesce(
+        Subquery(
+            holds.order_by()
+            .values("slot_id")
+            .annotate(total=Sum("quantity"))
+            .values("total")
+        ),
+        0,
+    )
+
+
+def with_available(queryset):
+    """
+    Annotates each slot with what's left to book, stock minus holds.
+    """
+    return queryset.annotate(available=F("stock") - held(queryset.model))
+
+
+class AvailableField(serializers.ReadOnlyField):
+    # the with_available() annotation, or the stock where there is none
+    def get_attribute(self, instance):
+        return getattr(instance, "available", instance.stock)
+
+
+def decrement(
+    model, pk, quantity, reason=StockMovement.BOOKING, booking=None, movements=None
+):
+    """
+    Takes quantity off one slot's stock, raising OutOfStock (with what's
+    available) when there isn't enough and model.DoesNotExist when the
+    slot doesn't exist. The movement refers to booking when given, it's
+    added to the movements batch (a ledger.MovementBatch) if there is one.
+    Raises ValueError for a quantity below 1.
+    """
+    quantity = positive(quantity)
+    # rolled back with the caller's transaction, it needs no savepoint
+    with transaction.atomic(savepoint=False):
+        updated = model.objects.filter(
+            pk=pk, stock__gte=held(model) + quantity
+        ).update(stock=F("stock") - quantity)
+        if updated and movements is not None:
+            movements.add(model, pk, -quantity, reason, booking)
+        elif updated:
+            ledger.record(model, [(pk, -quantity)], reason, booking)
+    if not updated:
+        slot = with_available(model.objects.filter(pk=pk)).first()
+        if slot is None:
+            raise model.DoesNotExist(f"{model.__name__} {pk} not found.")
+        raise OutOfStock(available=slot.available)
+
+
+def decrement_range(queryset, quantity, days, booking=None):
+    """
+    Takes quantity off each of the days of a multi-day booking (queryset
+    covers the date range, e.g. a package offer's PackageDays), all or
+    nothing and in two queries whatever the length: one aggregate checks
+    that all the days exist and have the stock, one conditional UPDATE
+    takes it, then the days' movements are written. Raises OutOfStock
+    otherwise, ValueError for a quantity below 1. Returns the aggregate,
+    with the sum of the days' prices.
+    """
+    quantity = positive(quantity)
+    with transaction.atomic():
+        summary = with_available(queryset).aggregate(
+            days=Count("id"), min_available=Min("available"), price=Sum("price")
+        )
+        if summary["days"] != days:
+            raise OutOfStock("Not every day of the range can be booked.", available=0)
+        if summary["min_available"] < quantity:
+            raise OutOfStock(
+                "Not enough stock for every day. "
+                f"Available stock: {summary['min_available']}",
+                available=summary["min_available"],
+            )
+        updated = queryset.filter(
+            stock__gte=held(queryset.model) + quantity
+        ).update(stock=F("stock") - quantity)
+        if updated != days:
+            # taken meanwhile, rolls the partial update back
+            raise OutOfStock()
+        ledger.record(
+            queryset.model,
+            [(pk, -quantity) for pk in queryset.values_list("pk", flat=True)],
+            StockMovement.BOOKING,
+            booking,
+        )
+    return summary
+
+
+def block(queryset):
+    """
+    Sets the stock of the slots to 0, each movement takes what the slot
+    had. Returns the number of slots blocked.
+    """
+    model = queryset.model
+    with transaction.atomic():
+        # locked first so no booking changes the stock read below
+        queryset.update(stock=F("stock"))
+        stocks = list(queryset.values_list("pk", "stock"))
+        model.objects.filter(pk__in=[pk for pk, _ in stocks]).update(stock=0)
+        ledger.record(model, [(pk, -stock) for pk, stock in stocks], StockMovement.BLOCK)
+    return len(stocks)
+
+
+def hold(customer, model, slot_ids, quantity, ttl=None):
+    """
+    Sets quantity units of every slot aside for the customer for ttl
+    seconds, all or nothing. Returns the holds, they share one token.
+    """
+    quantity = positive(quantity)
+    slot_ids = sorted(set(slot_ids))
+    expires_at = timezone.now() + timedelta(seconds=ttl or HOLD_TTL)
+    with transaction.atomic():
+        # a no-op update takes the slots' write locks, so concurrent holds
+        # of the same slots queue here and each sees the ones before it
+        locked = model.objects.filter(pk__in=slot_ids).update(stock=F("stock"))
+        if locked != len(slot_ids):
+            raise model.DoesNotExist(f"{model.__name__} not found.")
+        short = with_available(model.objects.filter(pk__in=slot_ids)).filter(
+            available__lt=quantity
+        )
+        if short.exists():
+            raise OutOfStock()
+        holds = [
+            StockHold(
+                customer=customer,
+                slot_type=model._meta.model_name,
+                slot_id=slot_id,
+                quantity=quantity,
+                expires_at=expires_at,
+            )
+            for slot_id in slot_ids
+        ]
+        for hold in holds[1:]:
+            hold.token = holds[0].token
+        return StockHold.objects.bulk_create(holds)
+
+
+def convert(token, customer, model, slot_ids, expected=None):
+    """
+    Turns the customer's active holds on the slots into a booking's: they
+    stop counting against availability so the booking's own decrement can
+    take the units. Call inside the booking's transaction so a failed
+    booking puts the holds back. slot_ids may be a values("pk") queryset,
+    expected is then the number of slots it covers.
+    """
+    if expected is None:
+        slot_ids = set(slot_ids)
+        expected = len(slot_ids)
+    converted = (
+        active_holds(model)
+        .filter(token=token, customer=customer, slot_id__in=slot_ids)
+        .update(status=StockHold.CONVERTED)
+    )
+    if converted != expected:
+        raise InvalidHold("The hold expired or doesn't cover this booking.")
+
+
+def release(token, customer):
+    return StockHold.objects.filter(
+        token=token, customer=customer, status=StockHold.ACTIVE
+    ).update(status=StockHold.RELEASED)
+
+
+def release_expired(batch_size=1000):
+    """
+    Retires expired holds with one UPDATE per batch, returns how many.
+    They already stopped counting, this keeps the active set small.
+    """
+    released = 0
+    now = timezone.now()
+    while True:
+        ids = list(
+            StockHold.objects.filter(status=StockHold.ACTIVE, expires_at__lte=now)
+            .order_by("expires_at")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return released
+        released += StockHold.objects.filter(
+            id__in=ids, status=StockHold.ACTIVE
+        ).update(status=StockHold.RELEASED)
@@ -0,0 +1,96 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ActivityBooking, PackageBooking, QrCodeJob, TourBooking
+
+
+logger = logging.getLogger(__name__)
+
+BOOKING_MODELS = {
+    "activity": ActivityBooking,
+    "tour": TourBooking,
+    "package": PackageBooking,
+}
+BOOKING_TYPES = {model: name for name, model in BOOKING_MODELS.items()}
+
+# a failing job is retried this many times before it's marked failed
+MAX_ATTEMPTS = 3
+# a job running longer than this is assumed lost with its worker
+STALE_AFTER = timedelta(minutes=5)
+
+
+def enqueue(booking):
+    """
+    Queues the rendering of a booking's QR code file when they are stored
+    (settings.QR_CODE_FILES), called inside the confirmation's transaction
+    so the job only exists if it commits.
+    """
+    if not getattr(settings, "QR_CODE_FILES", False):
+        # the QR endpoint renders the codes on request
+        return None
+    return QrCodeJob.objects.create(
+        booking_type=BOOKING_TYPES[type(booking)], booking_id=booking.pk
+    )
+
+
+def claim(worker, batch_size):
+    """
+    Takes up to batch_size pending jobs for the worker. The conditional
+    update only moves jobs that are still pending, so workers racing for
+    the same rows never both get one.
+    """
+    ids = list(
+        QrCodeJob.objects.filter(status=QrCodeJob.PENDING)
+        .order_by("id")
+        .values_list("id", flat=True)[:batch_size]
+    )
+    if not ids:
+        return []
+    QrCodeJob.objects.filter(id__in=ids, status=QrCodeJob.PENDING).update(
+        status=QrCodeJob.RUNNING,
+        worker=worker,
+        started_at=timezone.now(),
+        attempts=F("attempts") + 1,
+    )
+    return list(
+        QrCodeJob.objects.filter(id__in=ids, status=QrCodeJob.RUNNING, worker=worker)
+    )
+
+
+def run(job):
+    """
+    Renders one job's QR code. The file name is written with an update of
+    that column alone so the worker never overwrites the booking's other
+    fields with what it loaded.
+    """
+    model = BOOKING_MODELS[job.booking_type]
+    try:
+        booking = model.objects.get(pk=job.booking_id)
+        booking.generate_qr_code(save=False)
+        model.objects.filter(pk=booking.pk).update(qr_code=booking.qr_code.name)
+    except Exception as e:
+        logger.exception("QR code job %s failed", job.pk)
+        retry = job.attempts < MAX_ATTEMPTS and not isinstance(e, model.DoesNotExist)
+        QrCodeJob.objects.filter(pk=job.pk).update(
+            status=QrCodeJob.PENDING if retry else QrCodeJob.FAILED,
+            error=str(e),
+            finished_at=timezone.now(),
+        )
+        return False
+    QrCodeJob.objects.filter(pk=job.pk).update(
+        status=QrCodeJob.DONE, error="", finished_at=timezone.now()
+    )
+    return True
+
+
+def requeue_stale():
+    """
+    Puts back the jobs whose worker died while running them.
+    """
+    return QrCodeJob.objects.filter(
+        status=QrCodeJob.RUNNING, started_at__lt=timezone.now() - STALE_AFTER
+    ).update(status=QrCodeJob.PENDING)
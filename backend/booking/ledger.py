@@ -0,0 +1,165 @@
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from activities.models import Period
+from packages.models import PackageDay
+from tours.models import TourDay
+from .jobs import BOOKING_TYPES
+from .models import StockMovement, StockSnapshot
+
+
+# The stock ledger: booking.inventory writes a movement for every change
+# of a slot's stock in the same transaction as the change, the slot rows
+# only hold the running total. compact() rolls old movements into one
+# snapshot per slot, drift() recomputes every slot's stock from the two.
+
+SLOT_MODELS = {"period": Period, "tourday": TourDay, "packageday": PackageDay}
+
+
+class MovementBatch:
+    """
+    Collects the movements of several stock changes and writes them with
+    a single INSERT, call write() inside the transaction of the changes.
+    """
+
+    def __init__(self):
+        self.movements = []
+
+    def add(self, model, slot_id, delta, reason, booking=None):
+        if not delta:
+            return
+        self.movements.append(
+            StockMovement(
+                slot_type=model._meta.model_name,
+                slot_id=slot_id,
+                delta=delta,
+                reason=reason,
+                booking_type=BOOKING_TYPES[type(booking)] if booking is not None else "",
+                booking_id=getattr(booking, "pk", None),
+            )
+        )
+
+    def write(self):
+        movements, self.movements = self.movements, []
+        if movements:
+            StockMovement.objects.bulk_create(movements)
+        return movements
+
+
+def record(model, deltas, reason, booking=None):
+    """
+    Writes the movements of (slot_id, delta) pairs with one INSERT, zero
+    deltas are left out. Call inside the transaction changing the stock.
+    """
+    batch = MovementBatch()
+    for slot_id, delta in deltas:
+        batch.add(model, slot_id, delta, reason, booking)
+    return batch.write()
+
+
+def record_created(model, slots):
+    """
+    The opening movements of new slot rows, for the paths that
+    bulk_create them and skip the post_save signal.
+    """
+    return record(model, [(slot.pk, slot.stock) for slot in slots], StockMovement.INIT)
+
+
+def with_ledger(queryset):
+    """
+    Annotates each slot with its stock according to the ledger, its
+    snapshot plus the movements after it, as correlated subqueries.
+    """
+    slot_type = queryset.model._meta.model_name
+    snapshot = StockSnapshot.objects.filter(slot_type=slot_type, slot_id=OuterRef("pk"))
+    movements = StockMovement.objects.filter(
+        slot_type=slot_type, slot_id=OuterRef("pk"), id__gt=OuterRef("through")
+    )
+    return queryset.annotate(
+        through=Coalesce(Subquery(snapshot.values("through_id")[:1]), 0)
+    ).annotate(
+        ledger=Coalesce(Subquery(snapshot.values("stock")[:1]), 0)
+        + Coalesce(
+            Subquery(
+                movements.order_by()
+                .values("slot_id")
+                .annotate(total=Sum("delta"))
+                .values("total")
+            ),
+            0,
+        )
+    )
+
+
+def drift(model):
+    """
+    The slots whose stock doesn't match the ledger, one query per model.
+    """
+    return with_ledger(model.objects.all()).exclude(ledger=F("stock")).order_by("pk")
+
+
+def adjust(model, slots):
+    """
+    Writes the movements bringing the ledger of the drifting slots back
+    to their stock, the ledger stays append-only.
+    """
+    with transaction.atomic():
+        return record(
+            model,
+            [(slot.pk, slot.stock - slot.ledger) for slot in slots],
+            StockMovement.ADJUST,
+        )
+
+
+def compact(before, batch_size=1000):
+    """
+    Rolls the movements older than before into the slots' snapshots and
+    deletes them, batch_size slots per transaction. Returns how many
+    movements were compacted. Run one compaction at a time.
+    """
+    cutoff = StockMovement.objects.filter(created_at__lt=before).aggregate(
+        last=Max("id")
+    )["last"]
+    if cutoff is None:
+        return 0
+    compacted = 0
+    while True:
+        with transaction.atomic():
+            groups = list(
+                StockMovement.objects.filter(id__lte=cutoff)
+                .values("slot_type", "slot_id")
+                .annotate(delta=Sum("delta"))
+                .order_by("slot_type", "slot_id")[:batch_size]
+            )
+            if not groups:
+                return compacted
+            for slot_type, rows in groupby(groups, key=lambda row: row["slot_type"]):
+                deltas = {row["slot_id"]: row["delta"] for row in rows}
+                snapshots = {
+                    snapshot.slot_id: snapshot
+                    for snapshot in StockSnapshot.objects.filter(
+                        slot_type=slot_type, slot_id__in=deltas
+                    )
+                }
+                for snapshot in snapshots.values():
+                    snapshot.stock += deltas[snapshot.slot_id]
+                    snapshot.through_id = cutoff
+                StockSnapshot.objects.bulk_update(
+                    snapshots.values(), ["stock", "through_id"]
+                )
+                StockSnapshot.objects.bulk_create(
+                    StockSnapshot(
+                        slot_type=slot_type,
+                        slot_id=slot_id,
+                        stock=delta,
+                        through_id=cutoff,
+                    )
+                    for slot_id, delta in deltas.items()
+                    if slot_id not in snapshots
+                )
+                compacted += StockMovement.objects.filter(
+                    slot_type=slot_type, slot_id__in=deltas, id__lte=cutoff
+                ).delete()[0]
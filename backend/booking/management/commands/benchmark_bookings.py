@@ -0,0 +1,56 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from booking import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the booking and confirm views from concurrent threads and "
+        "print p50/p95/p99 latency, throughput, lock errors and oversell as "
+        "JSON. Seeds its own catalog in the configured database and deletes "
+        "it afterwards, don't point it at production"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scenario",
+            action="append",
+            choices=benchmark.SCENARIOS,
+            help="Scenario to run, may be repeated, all of them by default",
+        )
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument(
+            "--requests", type=int, default=25, help="Requests per thread"
+        )
+        parser.add_argument("--slots", type=int, default=3)
+        parser.add_argument(
+            "--stock", type=int, default=20, help="Stock of each seeded slot"
+        )
+        parser.add_argument("--quantity", type=int, default=1)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        # the test client's host
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            reports = [
+                benchmark.run(
+                    scenario,
+                    threads=options["threads"],
+                    requests=options["requests"],
+                    slots=options["slots"],
+                    stock=options["stock"],
+                    quantity=options["quantity"],
+                    seed=options["seed"],
+                )
+                for scenario in options["scenario"] or benchmark.SCENARIOS
+            ]
+        output = json.dumps(reports, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        self.stdout.write(output)
@@ -0,0 +1,64 @@
+import os
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from booking.jobs import BOOKING_MODELS
+
+
+QR_DIRECTORY = "qrcodes"
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the QR code files no booking references. With --all, also "
+        "drop every stored QR file, the QR endpoint renders them on request"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Clear the bookings' qr_code field and delete every file",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        referenced = set()
+        if not options["all"]:
+            for model in BOOKING_MODELS.values():
+                referenced.update(
+                    os.path.basename(name)
+                    for name in model.objects.exclude(qr_code="")
+                    .exclude(qr_code__isnull=True)
+                    .values_list("qr_code", flat=True)
+                    .iterator()
+                )
+
+        try:
+            _, files = default_storage.listdir(QR_DIRECTORY)
+        except FileNotFoundError:
+            files = []
+        orphans = [name for name in files if name not in referenced]
+
+        if options["dry_run"]:
+            self.stdout.write(f"Would delete {len(orphans)} of {len(files)} files")
+            return
+
+        cleared = 0
+        if options["all"]:
+            # one UPDATE per model, before the files go
+            for model in BOOKING_MODELS.values():
+                cleared += (
+                    model.objects.exclude(qr_code="")
+                    .exclude(qr_code__isnull=True)
+                    .update(qr_code="")
+                )
+        for name in orphans:
+            default_storage.delete(f"{QR_DIRECTORY}/{name}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Deleted {len(orphans)} of {len(files)} files, "
+                f"cleared {cleared} bookings"
+            )
+        )
@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from booking import ledger
+
+
+class Command(BaseCommand):
+    help = "Roll the stock movements older than --days into per slot snapshots"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30)
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options["days"])
+        compacted = ledger.compact(before, batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Compacted {compacted} stock movements"))
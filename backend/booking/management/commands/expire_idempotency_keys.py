@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from booking import idempotency
+
+
+class Command(BaseCommand):
+    help = "Delete the expired booking Idempotency-Keys, one DELETE per batch"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted = idempotency.expire(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired keys"))
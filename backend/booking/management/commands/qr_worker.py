@@ -0,0 +1,52 @@
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from booking import jobs
+
+
+class Command(BaseCommand):
+    help = "Render the queued booking QR codes with a pool of threads"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument("--batch-size", type=int, default=20)
+        parser.add_argument(
+            "--poll", type=float, default=2.0, help="Seconds between empty polls"
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Exit when the queue is empty"
+        )
+
+    def handle(self, *args, **options):
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        done = failed = 0
+
+        def run(job):
+            try:
+                return jobs.run(job)
+            finally:
+                # each pool thread has its own connection
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=options["threads"]) as pool:
+            while True:
+                close_old_connections()
+                jobs.requeue_stale()
+                batch = jobs.claim(worker, options["batch_size"])
+                if not batch:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll"])
+                    continue
+                for ok in pool.map(run, batch):
+                    done += ok
+                    failed += not ok
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Rendered {done} QR codes, {failed} failed")
+        )
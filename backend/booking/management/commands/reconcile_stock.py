@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from booking import ledger
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every slot's stock from the ledger and report the slots "
+        "that drifted. With --fix, write the movements that bring the ledger "
+        "back to the stock, e.g. for slots older than the ledger"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true")
+        parser.add_argument(
+            "--show", type=int, default=20, help="Slots listed per slot type"
+        )
+
+    def handle(self, *args, **options):
+        drifting = 0
+        for slot_type, model in ledger.SLOT_MODELS.items():
+            slots = list(ledger.drift(model))
+            drifting += len(slots)
+            for slot in slots[: options["show"]]:
+                self.stdout.write(
+                    f"{slot_type} {slot.pk}: stock {slot.stock}, ledger {slot.ledger}"
+                )
+            if len(slots) > options["show"]:
+                self.stdout.write(f"... {len(slots) - options['show']} more {slot_type}s")
+            if options["fix"]:
+                ledger.adjust(model, slots)
+
+        if not drifting:
+            self.stdout.write(self.style.SUCCESS("Stock matches the ledger"))
+        elif options["fix"]:
+            self.stdout.write(self.style.SUCCESS(f"Adjusted {drifting} slots"))
+        else:
+            self.stdout.write(self.style.WARNING(f"{drifting} slots drifted"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from booking import inventory
+
+
+class Command(BaseCommand):
+    help = "Release the stock holds that expired, one UPDATE per batch"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        released = inventory.release_expired(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Released {released} expired holds"))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from activities.models import Period
+from booking.inventory import OutOfStock, decrement
+from booking.models import ActivityBooking, StockMovement
+
+
+class Command(BaseCommand):
+    help = (
+        "Take the stock of the unconfirmed activity bookings made before "
+        "activity stock was taken at booking time. Run once when deploying "
+        "the stock ledger, confirming no longer takes the stock"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        # the bookings without a movement, reruns skip the ones already taken
+        pending = ActivityBooking.objects.filter(confirmed=False).exclude(
+            pk__in=StockMovement.objects.filter(
+                reason=StockMovement.BOOKING, booking_type="activity"
+            ).values("booking_id")
+        )
+        taken = 0
+        short = []
+        for booking in pending.order_by("pk").iterator(
+            chunk_size=options["batch_size"]
+        ):
+            try:
+                with transaction.atomic():
+                    decrement(
+                        Period, booking.period_id, booking.quantity, booking=booking
+                    )
+            except OutOfStock as e:
+                short.append(
+                    f"booking {booking.pk}: {booking.quantity} booked, "
+                    f"{e.available} available"
+                )
+                continue
+            taken += 1
+
+        for line in short:
+            self.stdout.write(line)
+        if short:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{len(short)} bookings don't fit their period's stock, "
+                    "decline them rather than confirm them"
+                )
+            )
+        self.stdout.write(self.style.SUCCESS(f"Took the stock of {taken} bookings"))
@@ -1,18 +1,31 @@
-import io
-import qrcode
-from django.core.files import File
+import uuid
+from django.conf import settings
+from django.core.files.base import ContentFile
 from django.db import models
 from users.models import Customer
 from activities.models import Period
 from packages.models import PackageOffer
 from tours.models import TourDay
 from django.urls import reverse
+from .qr import render as render_qr
 
 
 host = "https://www.lebadvisor.com"
 
 
-class ActivityBooking(models.Model):
+class QrCodeMixin:
+    # the QR code encodes the payment confirmation url. It's rendered on
+    # request by the booking_qr_code endpoint, storing it as a file is
+    # only done with settings.QR_CODE_FILES
+    def get_qr_code_image(self, image_format="png"):
+        return render_qr(self.get_qr_code_url(), image_format)
+
+    def generate_qr_code(self, save=True):
+        filebuffer = ContentFile(self.get_qr_code_image("png"))
+        self.qr_code.save(f"qr_code_{self.id}.png", filebuffer, save=save)
+
+
+class ActivityBooking(QrCodeMixin, models.Model):
     quantity = models.PositiveIntegerField(default=1)
     period = models.ForeignKey(Period, on_delete=models.CASCADE)
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
@@ -25,28 +38,12 @@ class ActivityBooking(models.Model):
     def get_qr_code_url(self):
         return host + reverse("confirm_activity_payment", args=[self.id])
 
-    def generate_qr_code(self):
-        qr_code_url = f"{self.get_qr_code_url()}"
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(qr_code_url)
-        qr.make(fit=True)
-        img = qr.make_image(fill="black", back_color="white")
-        buffer = io.BytesIO()
-        img.save(buffer, format="PNG")
-        filebuffer = File(buffer)
-        self.qr_code.save(f"qr_code_{self.id}.png", filebuffer)
-
     def __str__(self):
         return f"Booking for {self.period.activity_offer.activity.title} \
                 by {self.customer.user.username}"
 
 
-class TourBooking(models.Model):
+class TourBooking(QrCodeMixin, models.Model):
     quantity = models.PositiveIntegerField(default=1)
     tourday = models.ForeignKey(TourDay, on_delete=models.CASCADE)
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
@@ -59,28 +56,12 @@ class TourBooking(models.Model):
     def get_qr_code_url(self):
         return host + reverse("confirm_tour_payment", args=[self.id])
 
-    def generate_qr_code(self):
-        qr_code_url = f"{self.get_qr_code_url()}"
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(qr_code_url)
-        qr.make(fit=True)
-        img = qr.make_image(fill="black", back_color="white")
-        buffer = io.BytesIO()
-        img.save(buffer, format="PNG")
-        filebuffer = File(buffer)
-        self.qr_code.save(f"qr_code_{self.id}.png", filebuffer)
-
     def __str__(self):
         return f"Booking for {self.tourday.tour_offer.title} \
                 by {self.customer.user.username}"
 
 
-class PackageBooking(models.Model):
+class PackageBooking(QrCodeMixin, models.Model):
     package_offer = models.ForeignKey(PackageOffer, on_delete=models.CASCADE)
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
     start_date = models.DateField()
@@ -95,21 +76,180 @@ class PackageBooking(models.Model):
     def get_qr_code_url(self):
         return host + reverse("confirm_package_payment", args=[self.id])
 
-    def generate_qr_code(self):
-        qr_code_url = f"{self.get_qr_code_url()}"
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(qr_code_url)
-        qr.make(fit=True)
-        img = qr.make_image(fill="black", back_color="white")
-        buffer = io.BytesIO()
-        img.save(buffer, format="PNG")
-        filebuffer = File(buffer)
-        self.qr_code.save(f"qr_code_{self.id}.png", filebuffer)
-
     def __str__(self):
         return f"Booking for {self.package_offer.package.title} by {self.customer.user.username}"
+
+
+# the slot models a hold can be taken on, keyed by model name
+HOLD_SLOT_TYPES = [
+    ("period", "Activity period"),
+    ("tourday", "Tour day"),
+    ("packageday", "Package day"),
+]
+
+
+# units of a slot set aside for a customer while they check out. Stock
+# isn't touched, availability is the stock minus the active holds (see
+# booking.inventory) and a hold stops counting once it expires, the
+# release_expired_holds command only retires them in bulk
+class StockHold(models.Model):
+    ACTIVE = "active"
+    CONVERTED = "converted"
+    RELEASED = "released"
+    STATUSES = [
+        (ACTIVE, "Active"),
+        (CONVERTED, "Converted to a booking"),
+        (RELEASED, "Released"),
+    ]
+
+    # shared by the holds taken together, e.g. every day of a package
+    token = models.UUIDField(default=uuid.uuid4, editable=False, db_index=True)
+    customer = models.ForeignKey(
+        Customer, on_delete=models.CASCADE, related_name="holds"
+    )
+    slot_type = models.CharField(max_length=20, choices=HOLD_SLOT_TYPES)
+    slot_id = models.PositiveIntegerField()
+    quantity = models.PositiveIntegerField(default=1)
+    status = models.CharField(max_length=20, choices=STATUSES, default=ACTIVE)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # sum of the active holds of a slot
+            models.Index(fields=["slot_type", "slot_id", "status", "expires_at"]),
+            # the sweeper's scan
+            models.Index(fields=["status", "expires_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.slot_type} {self.slot_id} ({self.status})"
+
+
+BOOKING_TYPES = [
+    ("activity", "Activity booking"),
+    ("tour", "Tour booking"),
+    ("package", "Package booking"),
+]
+
+
+# QR codes are rendered by the qr_worker command instead of the confirm
+# request, one row per booking to render (see booking.jobs)
+class QrCodeJob(models.Model):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    booking_type = models.CharField(max_length=20, choices=BOOKING_TYPES)
+    booking_id = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    # the worker that claimed the job
+    worker = models.CharField(max_length=64, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        # the workers' queue scan
+        indexes = [models.Index(fields=["status", "id"])]
+
+    def __str__(self):
+        return f"QR for {self.booking_type} booking {self.booking_id} ({self.status})"
+
+
+# every change of a slot's stock, written in the transaction that makes
+# it (see booking.ledger). A slot's stock is its snapshot plus the
+# movements after it, the reconcile_stock command checks they agree
+class StockMovement(models.Model):
+    INIT = "init"
+    BOOKING = "booking"
+    RESERVE = "reserve"
+    BLOCK = "block"
+    ADJUST = "adjust"
+    REASONS = [
+        (INIT, "Slot created"),
+        (BOOKING, "Booked by a customer"),
+        (RESERVE, "Reserved by the supplier"),
+        (BLOCK, "Day blocked"),
+        (ADJUST, "Adjusted to the slot's stock"),
+    ]
+
+    slot_type = models.CharField(max_length=20, choices=HOLD_SLOT_TYPES)
+    slot_id = models.PositiveIntegerField()
+    delta = models.IntegerField()
+    reason = models.CharField(max_length=20, choices=REASONS)
+    booking_type = models.CharField(max_length=20, choices=BOOKING_TYPES, blank=True)
+    booking_id = models.PositiveIntegerField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # sum of a slot's movements after its snapshot
+            models.Index(fields=["slot_type", "slot_id", "id"]),
+            # the compaction's cutoff
+            models.Index(fields=["created_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.delta:+} {self.slot_type} {self.slot_id} ({self.reason})"
+
+
+# the compacted movements of a slot, up to and including through_id
+class StockSnapshot(models.Model):
+    slot_type = models.CharField(max_length=20, choices=HOLD_SLOT_TYPES)
+    slot_id = models.PositiveIntegerField()
+    stock = models.IntegerField(default=0)
+    through_id = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["slot_type", "slot_id"], name="unique_stock_snapshot"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.slot_type} {self.slot_id}: {self.stock}"
+
+
+# a client's Idempotency-Key on a booking endpoint and the response it got,
+# retries of the request are answered from here (see booking.idempotency)
+class IdempotencyKey(models.Model):
+    IN_PROGRESS = "in_progress"
+    DONE = "done"
+    STATUSES = [(IN_PROGRESS, "In progress"), (DONE, "Done")]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="idempotency_keys",
+    )
+    key = models.CharField(max_length=255)
+    # hash of the path and body the key was first used with
+    fingerprint = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUSES, default=IN_PROGRESS)
+    response_status = models.PositiveSmallIntegerField(blank=True, null=True)
+    # the rendered response, replayed byte for byte
+    response_content = models.BinaryField(blank=True, null=True)
+    response_content_type = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="unique_idempotency_key")
+        ]
+        # the expiry sweep
+        indexes = [models.Index(fields=["expires_at"])]
+
+    def __str__(self):
+        return f"{self.key} ({self.status})"
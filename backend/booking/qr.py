@@ -0,0 +1,35 @@
+import io
+from functools import lru_cache
+
+import qrcode
+import qrcode.image.svg
+
+
+# QR codes only encode a booking's payment confirmation url, so they are
+# rendered when asked for instead of stored, and the recent renders are
+# kept in memory: a customer reopening their ticket costs nothing
+FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+@lru_cache(maxsize=512)
+def render(data, image_format="png"):
+    """
+    The QR code of data as PNG or SVG bytes.
+    """
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+        image_factory=(
+            qrcode.image.svg.SvgPathImage if image_format == "svg" else None
+        ),
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    buffer = io.BytesIO()
+    if image_format == "svg":
+        qr.make_image().save(buffer)
+    else:
+        qr.make_image(fill="black", back_color="white").save(buffer, format="PNG")
+    return buffer.getvalue()
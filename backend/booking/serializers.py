@@ -1,23 +1,60 @@
-from rest_framework.serializers import ModelSerializer
+from django.conf import settings
+from django.urls import reverse
+from rest_framework.serializers import ModelSerializer, ReadOnlyField
 from .models import ActivityBooking, PackageBooking, TourBooking
 from activities.serializers import PeriodSerializer
 from packages.serializers import PackageSerializer, PackageOfferSerializer
 from tours.serializers import TourDaySerializer
 from users.serializers import CustomerSerializer
+from api.eager import EagerLoadingMixin
 
 
-class ActivityBookingSerializer(ModelSerializer):
+class QrStatusField(ReadOnlyField):
+    # "ready" once the booking is confirmed, or when QR files are stored
+    # once the qr_worker wrote it ("pending" meanwhile), null before
+    def get_attribute(self, instance):
+        if instance.qr_code:
+            return "ready"
+        if not instance.confirmed:
+            return None
+        return "pending" if getattr(settings, "QR_CODE_FILES", False) else "ready"
+
+
+class QrUrlField(ReadOnlyField):
+    # the booking_qr_code endpoint rendering the confirmed booking's QR code
+    def __init__(self, booking_type, **kwargs):
+        self.booking_type = booking_type
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        if not instance.confirmed:
+            return None
+        return reverse("booking_qr_code", args=[self.booking_type, instance.pk, "png"])
+
+
+class ActivityBookingSerializer(EagerLoadingMixin, ModelSerializer):
     customer = CustomerSerializer()
     period = PeriodSerializer()
+    qr_status = QrStatusField()
+    qr_url = QrUrlField("activity")
+
+    nested_eager_loading = {"customer": CustomerSerializer, "period": PeriodSerializer}
 
     class Meta:
         model = ActivityBooking
         fields = "__all__"
 
 
-class PackageBookingSerializer(ModelSerializer):
+class PackageBookingSerializer(EagerLoadingMixin, ModelSerializer):
     package_offer = PackageOfferSerializer()
     customer = CustomerSerializer()
+    qr_status = QrStatusField()
+    qr_url = QrUrlField("package")
+
+    nested_eager_loading = {
+        "package_offer": PackageOfferSerializer,
+        "customer": CustomerSerializer,
+    }
 
     class Meta:
         model = PackageBooking
@@ -32,6 +69,8 @@ class PackageBookingSerializer(ModelSerializer):
             "quantity",
             "created_at",
             "qr_code",
+            "qr_status",
+            "qr_url",
             "price",
         ]
         read_only_fields = [
@@ -44,9 +83,13 @@ class PackageBookingSerializer(ModelSerializer):
         ]
 
 
-class TourBookingSerializer(ModelSerializer):
+class TourBookingSerializer(EagerLoadingMixin, ModelSerializer):
     tourday = TourDaySerializer()
     customer = CustomerSerializer()
+    qr_status = QrStatusField()
+    qr_url = QrUrlField("tour")
+
+    nested_eager_loading = {"tourday": TourDaySerializer, "customer": CustomerSerializer}
 
     class Meta:
         model = TourBooking
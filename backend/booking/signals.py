@@ -0,0 +1,16 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from activities.models import Period
+from packages.models import PackageDay
+from tours.models import TourDay
+from . import ledger
+
+
+@receiver(post_save, sender=Period)
+@receiver(post_save, sender=TourDay)
+@receiver(post_save, sender=PackageDay)
+def record_created_slot(sender, instance, created, raw=False, **kwargs):
+    # stock edited later isn't a movement, reconcile_stock reports it
+    if created and not raw:
+        ledger.record_created(sender, [instance])
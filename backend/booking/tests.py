@@ -1,3 +1,709 @@
-from django.test import TestCase
+import json
+import tempfile
+import threading
+from datetime import date, time, timedelta
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from activities.models import Period
+from api.tests import CatalogFixtureMixin
+from notifications.models import Notification
+from packages.models import Package, PackageDay
+from tours.models import TourDay
+from users.models import CustomUser, Customer
+from . import ledger
+from .inventory import decrement, decrement_range, OutOfStock
+from .models import (
+    ActivityBooking,
+    IdempotencyKey,
+    QrCodeJob,
+    StockHold,
+    StockMovement,
+    StockSnapshot,
+    TourBooking,
+)
+
+
+class InventoryTests(CatalogFixtureMixin, TestCase):
+    def setUp(self):
+        offer = self.create_tour().tour_offer.first()
+        self.day = TourDay.objects.create(
+            tour_offer=offer, day=date.today(), stock=3, price=50
+        )
+
+    def test_decrement(self):
+        decrement(TourDay, self.day.pk, 2)
+        with self.assertRaises(OutOfStock) as raised:
+            decrement(TourDay, self.day.pk, 2)
+        self.assertEqual(raised.exception.available, 1)
+        self.day.refresh_from_db()
+        self.assertEqual(self.day.stock, 1)
+        with self.assertRaises(TourDay.DoesNotExist):
+            decrement(TourDay, 0, 1)
+
+    def test_quantity_below_one_is_rejected(self):
+        for quantity in (0, -5):
+            with self.assertRaises(ValueError):
+                decrement(TourDay, self.day.pk, quantity)
+            with self.assertRaises(ValueError):
+                decrement_range(TourDay.objects.filter(pk=self.day.pk), quantity, 1)
+        self.day.refresh_from_db()
+        self.assertEqual(self.day.stock, 3)
+        self.assertFalse(
+            StockMovement.objects.filter(reason=StockMovement.RESERVE).exists()
+        )
+
+    def test_reserve_view_checks_quantity_and_offer(self):
+        client = APIClient()
+        client.force_authenticate(self.supplier.user)
+        url = reverse("reserve_tour")
+        data = {"tour_offer": self.day.tour_offer_id, "tour_day": self.day.pk}
+        for number in (-5, 0, "many"):
+            response = client.post(
+                url, {**data, "number_of_reservations": number}, format="json"
+            )
+            self.assertEqual(response.status_code, 400, number)
+        other_offer = self.create_tour(title="Other").tour_offer.first()
+        response = client.post(
+            url,
+            {**data, "tour_offer": other_offer.id, "number_of_reservations": 1},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 404)
+        self.day.refresh_from_db()
+        self.assertEqual(self.day.stock, 3)
+        response = client.post(
+            url, {**data, "number_of_reservations": 2}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.day.refresh_from_db()
+        self.assertEqual(self.day.stock, 1)
+
+    def test_decrement_range_is_all_or_nothing(self):
+        other = TourDay.objects.create(
+            tour_offer=self.day.tour_offer, day=date.today(), stock=1, price=50
+        )
+        days = TourDay.objects.filter(pk__in=[self.day.pk, other.pk])
+        with self.assertRaises(OutOfStock) as raised:
+            decrement_range(days, 2, 2)
+        self.assertEqual(raised.exception.available, 1)
+        with self.assertRaises(OutOfStock):
+            decrement_range(days, 1, 3)
+        self.assertEqual(sorted(days.values_list("stock", flat=True)), [1, 3])
+        summary = decrement_range(days, 1, 2)
+        self.assertEqual((summary["days"], summary["price"]), (2, 100))
+        self.assertEqual(sorted(days.values_list("stock", flat=True)), [0, 2])
+
+
+class PackageRangeBookingTests(CatalogFixtureMixin, TestCase):
+    def setUp(self):
+        self.package = self.create_package()
+        self.offer = self.package.offers.first()
+        PackageDay.objects.bulk_create(
+            PackageDay(
+                package_offer=self.offer,
+                day=date.today() + timedelta(days=i),
+                stock=4,
+                price=90,
+            )
+            for i in range(31)
+        )
+        user = CustomUser.objects.create_user(username="customer", is_customer=True)
+        Customer.objects.create(user=user)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def book(self, days, start=0, quantity=1):
+        Package.objects.filter(pk=self.package.pk).update(period=days)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse("create_package_booking"),
+                {
+                    "package_offer_id": self.offer.id,
+                    "start_date": str(date.today() + timedelta(days=start)),
+                    "quantity": quantity,
+                },
+                format="json",
+            )
+        return response, len(queries)
+
+    def test_query_count_is_constant_in_package_length(self):
+        counts = {}
+        for days in [2, 7, 30]:
+            response, counts[days] = self.book(days)
+            self.assertEqual(response.status_code, 201, response.data)
+            end_date = date.today() + timedelta(days=days - 1)
+            self.assertEqual(response.data["end_date"], str(end_date))
+        self.assertEqual(len(set(counts.values())), 1, counts)
+        self.assertEqual(
+            list(PackageDay.objects.order_by("day").values_list("stock", flat=True)[:3]),
+            [1, 1, 2],
+        )
+
+    def test_short_day_rejects_the_whole_range(self):
+        PackageDay.objects.filter(day=date.today() + timedelta(days=3)).update(stock=0)
+        response, _ = self.book(7)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Available stock: 0", response.data["error"])
+        self.assertFalse(PackageDay.objects.filter(stock__lt=4).exclude(stock=0).exists())
+
+
+class StockHoldTests(CatalogFixtureMixin, TestCase):
+    def setUp(self):
+        offer = self.create_tour().tour_offer.first()
+        self.day = TourDay.objects.create(
+            tour_offer=offer, day=date.today(), stock=5, price=50
+        )
+        self.clients = []
+        for username in ["first", "second"]:
+            user = CustomUser.objects.create_user(username=username, is_customer=True)
+            Customer.objects.create(user=user)
+            client = APIClient()
+            client.force_authenticate(user)
+            self.clients.append(client)
+
+    def hold(self, client, quantity):
+        return client.post(
+            reverse("create_hold"),
+            {"slot_type": "tourday", "slot_id": self.day.id, "quantity": quantity},
+            format="json",
+        )
+
+    def book(self, client, quantity, **data):
+        return client.post(
+            reverse("create_tour_booking"),
+            {"tourday_id": self.day.id, "quantity": quantity, **data},
+            format="json",
+        )
+
+    def test_hold_is_converted_by_the_booking(self):
+        first, second = self.clients
+        token = self.hold(first, 4).data["token"]
+        self.assertEqual(self.hold(second, 2).status_code, 400)
+        self.assertEqual(self.book(second, 2).status_code, 400)
+
+        tourdays = first.get(reverse("get_tour_days", args=[self.day.tour_offer_id]))
+        self.assertEqual(tourdays.data[0]["available"], 1)
+
+        # someone else's token is refused
+        self.assertEqual(self.book(second, 4, hold_token=token).status_code, 409)
+        self.assertEqual(self.book(first, 4, hold_token=token).status_code, 201)
+        self.day.refresh_from_db()
+        self.assertEqual(self.day.stock, 1)
+        self.assertEqual(StockHold.objects.get().status, StockHold.CONVERTED)
+        # a hold is used once
+        self.assertEqual(self.book(first, 1, hold_token=token).status_code, 409)
+        self.assertEqual(TourBooking.objects.count(), 1)
+
+    def test_released_and_expired_holds_stop_counting(self):
+        first, second = self.clients
+        token = self.hold(first, 5).data["token"]
+        response = first.delete(reverse("release_hold", args=[token]))
+        self.assertEqual(response.status_code, 204)
+        self.hold(first, 5)
+        StockHold.objects.filter(status=StockHold.ACTIVE).update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertEqual(self.book(second, 5).status_code, 201)
+
+        out = StringIO()
+        call_command("release_expired_holds", batch_size=1, stdout=out)
+        self.assertIn("Released 1 expired holds", out.getvalue())
+        self.assertFalse(StockHold.objects.filter(status=StockHold.ACTIVE).exists())
+
+
+class BatchBookingTests(CatalogFixtureMixin, TestCase):
+    def setUp(self):
+        tour_offer = self.create_tour().tour_offer.first()
+        activity_offer = self.create_activity().offers.first()
+        self.tourdays = [
+            TourDay.objects.create(
+                tour_offer=tour_offer, day=date.today() + timedelta(days=i), stock=3, price=50
+            )
+            for i in range(2)
+        ]
+        self.period = Period.objects.create(
+            activity_offer=activity_offer,
+            day=date.today(),
+            time_from=time(9),
+            time_to=time(10),
+            stock=5,
+            price=20,
+        )
+        user = CustomUser.objects.create_user(username="customer", is_customer=True)
+        Customer.objects.create(user=user)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def book(self, items):
+        return self.client.post(
+            reverse("create_batch_booking"), {"items": items}, format="json"
+        )
+
+    def test_books_every_item_at_once(self):
+        items = [
+            {"type": "activity", "slot_id": self.period.id, "quantity": 2},
+            {"type": "tour", "slot_id": self.tourdays[0].id, "quantity": 1},
+            {"type": "tour", "slot_id": self.tourdays[1].id, "quantity": 3},
+        ]
+        # customer, one select per slot type, then in the transaction one
+        # insert per booking table, one update per booking, one insert of
+        # their stock movements and the supplier's rollup rows (one insert,
+        # one update per booking type)
+        # notifications are inserted once the transaction commits
+        with self.assertNumQueries(15), self.captureOnCommitCallbacks(execute=True):
+            response = self.book(items)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [(b["type"], b["quantity"], b["price"]) for b in response.data["bookings"]],
+            [("activity", 2, "40.00"), ("tour", 1, "50.00"), ("tour", 3, "150.00")],
+        )
+        self.assertEqual(response.data["total"], "240.00")
+        self.assertEqual(ActivityBooking.objects.count(), 1)
+        self.assertEqual(TourBooking.objects.count(), 2)
+        self.assertEqual(Notification.objects.count(), 6)
+        self.assertEqual(
+            list(TourDay.objects.order_by("day").values_list("stock", flat=True)),
+            [2, 0],
+        )
+        self.period.refresh_from_db()
+        self.assertEqual(self.period.stock, 3)
+
+    def test_all_or_nothing(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.book(
+                [
+                    {"type": "tour", "slot_id": self.tourdays[0].id, "quantity": 2},
+                    {"type": "tour", "slot_id": self.tourdays[1].id, "quantity": 4},
+                ]
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(TourBooking.objects.exists())
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(
+            list(TourDay.objects.values_list("stock", flat=True)), [3, 3]
+        )
+        response = self.book([{"type": "tour", "slot_id": 0, "quantity": 1}])
+        self.assertEqual(response.status_code, 404)
+
+
+    def test_virtual_activity_slots(self):
+        offer = self.create_activity(virtual_slots=True).offers.first()
+        day = date.today() + timedelta(days=1)
+        slot = f"{offer.id}:{day}:10:00"
+        # a failing item rolls back the slot's override row too
+        response = self.book(
+            [
+                {"type": "activity", "slot": slot, "quantity": 1},
+                {"type": "tour", "slot_id": self.tourdays[0].id, "quantity": 4},
+            ]
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Period.objects.filter(activity_offer=offer).exists())
+
+        response = self.book(
+            [{"type": "activity", "slot": f"{offer.id}:{day}:10:30", "quantity": 1}]
+        )
+        self.assertEqual(response.status_code, 404)
+
+        response = self.book([{"type": "activity", "slot": slot, "quantity": 2}])
+        self.assertEqual(response.status_code, 201)
+        period = Period.objects.get(activity_offer=offer)
+        self.assertEqual(
+            (period.day, period.time_from, period.stock), (day, time(10), 3)
+        )
+        self.assertEqual(response.data["bookings"][0]["slot_id"], period.id)
+
+
+class StockLedgerTests(CatalogFixtureMixin, TestCase):
+    def setUp(self):
+        self.day = TourDay.objects.create(
+            tour_offer=self.create_tour().tour_offer.first(),
+            day=date.today(),
+            stock=5,
+            price=50,
+        )
+        user = CustomUser.objects.create_user(username="customer", is_customer=True)
+        Customer.objects.create(user=user)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def movements(self):
+        return list(
+            StockMovement.objects.order_by("id").values_list("delta", "reason")
+        )
+
+    def reconcile(self, **options):
+        out = StringIO()
+        call_command("reconcile_stock", stdout=out, **options)
+        return out.getvalue()
+
+    def test_every_change_is_a_movement(self):
+        response = self.client.post(
+            reverse("create_tour_booking"),
+            {"tourday_id": self.day.id, "quantity": 2},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        # confirming doesn't take the stock a second time
+        self.client.force_authenticate(self.supplier.user)
+        url = reverse("confirm_tour_booking", args=[response.data["id"]])
+        self.assertEqual(self.client.post(url).status_code, 200)
+        self.day.refresh_from_db()
+        self.assertEqual(self.day.stock, 3)
+
+        response = self.client.post(
+            reverse("block_tour_day"),
+            {"tour_id": self.day.tour_offer.tour_id, "day": str(self.day.day)},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.movements(),
+            [
+                (5, StockMovement.INIT),
+                (-2, StockMovement.BOOKING),
+                (-3, StockMovement.BLOCK),
+            ],
+        )
+        self.assertEqual(
+            StockMovement.objects.get(reason=StockMovement.BOOKING).booking_type,
+            "tour",
+        )
+        self.assertIn("Stock matches the ledger", self.reconcile())
+
+    def test_legacy_activity_bookings_get_their_stock(self):
+        period = Period.objects.create(
+            activity_offer=self.create_activity().offers.first(),
+            day=date.today(),
+            time_from=time(9),
+            time_to=time(10),
+            stock=5,
+            price=20,
+        )
+        # made while activity stock was taken at confirmation
+        booking = ActivityBooking.objects.create(
+            period=period, customer=Customer.objects.get(), quantity=2, price=40
+        )
+        too_big = ActivityBooking.objects.create(
+            period=period, customer=Customer.objects.get(), quantity=4, price=80
+        )
+        out = StringIO()
+        call_command("take_pending_activity_stock", stdout=out)
+        self.assertIn(f"booking {too_big.pk}: 4 booked, 3 available", out.getvalue())
+        self.assertIn("Took the stock of 1 bookings", out.getvalue())
+        # a second run takes nothing more
+        out = StringIO()
+        call_command("take_pending_activity_stock", stdout=out)
+        self.assertIn("Took the stock of 0 bookings", out.getvalue())
+
+        self.client.force_authenticate(self.supplier.user)
+        url = reverse("confirm_activity_booking", args=[booking.pk])
+        self.assertEqual(self.client.post(url).status_code, 200)
+        period.refresh_from_db()
+        self.assertEqual(period.stock, 3)
+        self.assertIn("Stock matches the ledger", self.reconcile())
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        TourDay.objects.filter(pk=self.day.pk).update(stock=7)
+        self.assertIn(f"tourday {self.day.pk}: stock 7, ledger 5", self.reconcile())
+        self.assertIn("Adjusted 1 slots", self.reconcile(fix=True))
+        self.assertEqual(self.movements()[-1], (2, StockMovement.ADJUST))
+        self.assertIn("Stock matches the ledger", self.reconcile())
+
+    def test_compaction_keeps_the_stock(self):
+        decrement(TourDay, self.day.pk, 1)
+        decrement(TourDay, self.day.pk, 1)
+        out = StringIO()
+        call_command("compact_stock_ledger", days=-1, stdout=out)
+        self.assertIn("Compacted 3 stock movements", out.getvalue())
+        self.assertEqual(
+            StockSnapshot.objects.values_list("slot_id", "stock").get(),
+            (self.day.pk, 3),
+        )
+        decrement(TourDay, self.day.pk, 1)
+        self.assertEqual(len(self.movements()), 1)
+        self.assertEqual(ledger.with_ledger(TourDay.objects).get().ledger, 2)
+        self.assertIn("Stock matches the ledger", self.reconcile())
+
+
+class IdempotencyTests(CatalogFixtureMixin, TestCase):
+    def setUp(self):
+        self.day = TourDay.objects.create(
+            tour_offer=self.create_tour().tour_offer.first(),
+            day=date.today(),
+            stock=5,
+            price=50,
+        )
+        self.user = CustomUser.objects.create_user(
+            username="customer", is_customer=True
+        )
+        Customer.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def book(self, quantity=2, key="retry-1"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse("create_tour_booking"),
+                {"tourday_id": self.day.id, "quantity": quantity},
+                format="json",
+                HTTP_IDEMPOTENCY_KEY=key,
+            )
+
+    def test_retries_get_the_first_response(self):
+        first = self.book()
+        self.assertEqual(first.status_code, 201)
+        # answered from the store: one key lookup, no stock taken
+        with self.assertNumQueries(1):
+            retry = self.book()
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.json()["id"], first.data["id"])
+        self.assertEqual(TourBooking.objects.count(), 1)
+        self.assertEqual(Notification.objects.count(), 2)
+        self.day.refresh_from_db()
+        self.assertEqual(self.day.stock, 3)
+        # another key is another booking
+        self.assertEqual(self.book(key="retry-2").status_code, 201)
+        self.assertEqual(TourBooking.objects.count(), 2)
+
+    def test_replay_is_byte_identical(self):
+        self.day.price = Decimal("49.90")
+        self.day.save()
+        first = self.book()
+        self.assertEqual(first.data["price"], "99.80")
+        retry = self.book()
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry["Content-Type"], first["Content-Type"])
+
+    def test_reused_or_running_keys(self):
+        self.book()
+        self.assertEqual(self.book(quantity=1).status_code, 422)
+        IdempotencyKey.objects.create(
+            user=self.user,
+            key="running",
+            fingerprint=IdempotencyKey.objects.get().fingerprint,
+            expires_at=timezone.now() + timedelta(minutes=1),
+        )
+        self.assertEqual(self.book(key="running").status_code, 409)
+        self.assertEqual(TourBooking.objects.count(), 1)
+
+    def test_lapsed_lease_is_taken_over(self):
+        self.book()
+        # claimed by a worker that was killed before it answered
+        IdempotencyKey.objects.create(
+            user=self.user,
+            key="lost",
+            fingerprint=IdempotencyKey.objects.get().fingerprint,
+            expires_at=timezone.now() - timedelta(seconds=1),
+        )
+        started = timezone.now()
+        response = self.book(key="lost")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(TourBooking.objects.count(), 2)
+        # the stored response is kept for the full TTL, not the lease
+        record = IdempotencyKey.objects.get(key="lost")
+        self.assertEqual(record.status, IdempotencyKey.DONE)
+        self.assertGreater(record.expires_at, started + timedelta(hours=23))
+        self.assertEqual(self.book(key="lost").content, response.content)
+
+    def test_expired_keys(self):
+        self.book()
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        out = StringIO()
+        call_command("expire_idempotency_keys", batch_size=1, stdout=out)
+        self.assertIn("Deleted 1 expired keys", out.getvalue())
+        self.assertEqual(self.book().status_code, 201)
+        self.assertEqual(TourBooking.objects.count(), 2)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), QR_CODE_FILES=True)
+class QrCodeJobTests(CatalogFixtureMixin, TransactionTestCase):
+    # the worker's threads need to see committed rows
+
+    def setUp(self):
+        self.setUpTestData()
+        tourday = TourDay.objects.create(
+            tour_offer=self.create_tour().tour_offer.first(),
+            day=date.today(),
+            stock=3,
+            price=50,
+        )
+        user = CustomUser.objects.create_user(username="customer", is_customer=True)
+        self.booking = TourBooking.objects.create(
+            tourday=tourday,
+            customer=Customer.objects.create(user=user),
+            quantity=1,
+            price=50,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.supplier.user)
+
+    def test_confirm_queues_the_qr_code(self):
+        url = reverse("confirm_tour_booking", args=[self.booking.id])
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["qr_status"], "pending")
+        self.assertFalse(response.data["qr_code"])
+        job = QrCodeJob.objects.get()
+        self.assertEqual((job.booking_type, job.booking_id), ("tour", self.booking.id))
+
+        # paid while the job waits, the worker mustn't undo it
+        TourBooking.objects.filter(pk=self.booking.pk).update(paid=True)
+        out = StringIO()
+        call_command("qr_worker", once=True, threads=2, stdout=out)
+        self.assertIn("Rendered 1 QR codes, 0 failed", out.getvalue())
+
+        self.booking.refresh_from_db()
+        self.assertTrue(self.booking.qr_code.name.endswith(".png"))
+        self.assertTrue(self.booking.paid)
+        self.assertEqual(QrCodeJob.objects.get().status, QrCodeJob.DONE)
+        response = self.client.get(reverse("supplier_tours_bookings"))
+        self.assertEqual(response.data[0]["qr_status"], "ready")
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class QrCodeEndpointTests(CatalogFixtureMixin, TestCase):
+    def setUp(self):
+        tourday = TourDay.objects.create(
+            tour_offer=self.create_tour().tour_offer.first(),
+            day=date.today(),
+            stock=3,
+            price=50,
+        )
+        self.user = CustomUser.objects.create_user(username="customer", is_customer=True)
+        self.booking = TourBooking.objects.create(
+            tourday=tourday,
+            customer=Customer.objects.create(user=self.user),
+            quantity=1,
+            price=50,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.supplier.user)
+
+    def test_rendered_on_request(self):
+        response = self.client.post(
+            reverse("confirm_tour_booking", args=[self.booking.id])
+        )
+        self.assertEqual(response.data["qr_status"], "ready")
+        self.assertFalse(QrCodeJob.objects.exists())
+
+        self.client.force_authenticate(self.user)
+        response = self.client.get(response.data["qr_url"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertTrue(response.content.startswith(b"\x89PNG"))
+
+        svg = reverse("booking_qr_code", args=["tour", self.booking.id, "svg"])
+        response = self.client.get(svg)
+        self.assertTrue(response.content.lstrip().startswith(b"<?xml"))
+        response = self.client.get(svg, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+        stranger = CustomUser.objects.create_user(username="stranger")
+        self.client.force_authenticate(stranger)
+        self.assertEqual(self.client.get(svg).status_code, 403)
+
+    def test_unconfirmed_bookings_have_none(self):
+        url = reverse("booking_qr_code", args=["tour", self.booking.id, "png"])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_cleanup_removes_orphaned_files(self):
+        self.booking.generate_qr_code()
+        default_storage.save("qrcodes/qr_code_999.png", ContentFile(b"orphan"))
+        out = StringIO()
+        call_command("cleanup_qr_files", stdout=out)
+        self.assertIn("Deleted 1 of 2 files", out.getvalue())
+        self.assertTrue(default_storage.exists(self.booking.qr_code.name))
+
+        call_command("cleanup_qr_files", all=True, stdout=out)
+        self.booking.refresh_from_db()
+        self.assertFalse(self.booking.qr_code)
+        self.assertEqual(default_storage.listdir("qrcodes")[1], [])
+
+
+class BenchmarkCommandTests(TransactionTestCase):
+    def test_reports_every_scenario(self):
+        out = StringIO()
+        call_command(
+            "benchmark_bookings", threads=2, requests=4, stock=3, stdout=out
+        )
+        reports = json.loads(out.getvalue())
+        self.assertEqual(
+            [report["scenario"] for report in reports],
+            ["activity", "tour", "package", "confirm"],
+        )
+        for report in reports:
+            self.assertEqual(report["requests"], 8)
+            self.assertEqual(report["oversold"], 0)
+            self.assertEqual(report["ledger_drift"], 0)
+            self.assertEqual(report["errors"], 0)
+            self.assertIsNotNone(report["latency_ms"]["p99"])
+        # the seeded catalog is gone
+        self.assertFalse(TourDay.objects.exists())
+        self.assertFalse(CustomUser.objects.exists())
+
+
+class ContentionTests(CatalogFixtureMixin, TransactionTestCase):
+    """
+    Many threads booking the same slot at once must sell exactly its stock.
+    """
+
+    STOCK = 25
+    THREADS = 8
+    ATTEMPTS = 10
+
+    def setUp(self):
+        self.setUpTestData()
+        offer = self.create_tour().tour_offer.first()
+        self.day = TourDay.objects.create(
+            tour_offer=offer, day=date.today(), stock=self.STOCK, price=50
+        )
+
+    def test_no_oversell_under_contention(self):
+        sold = []
+        rejected = []
+        start = threading.Barrier(self.THREADS)
+
+        def book():
+            start.wait()
+            try:
+                for _ in range(self.ATTEMPTS):
+                    while True:
+                        try:
+                            decrement(TourDay, self.day.pk, 1)
+                            sold.append(1)
+                        except OutOfStock:
+                            rejected.append(1)
+                        except OperationalError:
+                            # sqlite reports a busy database instead of
+                            # waiting for the lock, try again
+                            continue
+                        break
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=book) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.day.refresh_from_db()
+        self.assertEqual(len(sold), self.STOCK)
+        self.assertEqual(len(rejected), self.THREADS * self.ATTEMPTS - self.STOCK)
+        self.assertEqual(self.day.stock, 0)
+        # every decrement that went through has its movement
+        self.assertFalse(ledger.drift(TourDay).exists())
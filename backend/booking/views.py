@@ -1,16 +1,33 @@
-from rest_framework import status
+from rest_framework import serializers, status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from notifications.models import Notification
+from notifications.dispatch import NotificationBatch
+from dashboard import stats
 from rest_framework.decorators import (
     api_view,
     permission_classes,
 )
+from django.db import transaction
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from activities import slots
 from activities.models import Period
 from tours.models import TourDay
 from packages.models import PackageDay, PackageOffer
 from users.models import Customer
 from .models import ActivityBooking, TourBooking, PackageBooking
+from . import inventory, jobs, ledger, qr
+from .idempotency import idempotent
+from .inventory import (
+    convert,
+    decrement,
+    decrement_range,
+    with_available,
+    InvalidHold,
+    OutOfStock,
+)
 from .serializers import (
     ActivityBookingSerializer,
     TourBookingSerializer,
@@ -21,46 +38,82 @@ from datetime import timedelta, datetime
 
 @permission_classes([IsAuthenticated])
 @api_view(["POST"])
+@idempotent
 def activity_booking_create(request):
     if not request.user.is_customer:
         return Response(status=status.HTTP_403_FORBIDDEN)
 
     try:
         period_id = request.data.get("period_id")
+        # virtual slots have no period id until booked, they come by key
+        slot = request.data.get("slot")
         quantity = request.data.get("quantity")
-        if not period_id:
+        if not period_id and not slot:
             return Response(
                 {"error": "Period is required."}, status=status.HTTP_400_BAD_REQUEST
             )
-        period = Period.objects.get(pk=period_id)
+        try:
+            period = slots.resolve_period(period_id, slot)
+        except slots.InvalidSlot as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
         customer = Customer.objects.get(user=request.user)
+        hold_token = request.data.get("hold_token")
 
-        if period.stock < 1:
+        # availability and what the notifications need in one query
+        slot = (
+            with_available(Period.objects.filter(pk=period.pk))
+            .values(
+                "available",
+                "activity_offer__activity__title",
+                "activity_offer__activity__supplier",
+                "activity_offer__activity__supplier__user",
+                "activity_offer__activity__supplier__user__username",
+            )
+            .get()
+        )
+        if not hold_token and slot["available"] < 1:
             return Response(
                 {"error": "No available slots for this period."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        booking = ActivityBooking.objects.create(
-            period=period,
-            customer=customer,
-            quantity=quantity,
-            price=quantity * period.price,
-        )
+        try:
+            with transaction.atomic():
+                if hold_token:
+                    convert(hold_token, customer, Period, [period.pk])
+                booking = ActivityBooking.objects.create(
+                    period=period,
+                    customer=customer,
+                    quantity=quantity,
+                    price=quantity * period.price,
+                )
+                # the stock is taken here, confirming doesn't take it again
+                decrement(Period, period.pk, quantity, booking=booking)
+                stats.record(
+                    booking, slot["activity_offer__activity__supplier"], created=True
+                )
+                title = slot["activity_offer__activity__title"]
+                notifications = NotificationBatch()
+                notifications.add(
+                    request.user,
+                    f"Booking {title} created waiting for confirmation from {slot['activity_offer__activity__supplier__user__username']}",
+                )
+                notifications.add(
+                    slot["activity_offer__activity__supplier__user"],
+                    f"Booking {title} created waiting for your confirmation",
+                )
+                notifications.send()
+        except InvalidHold as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        except OutOfStock:
+            return Response(
+                {"error": "No available slots for this period."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         serializer = ActivityBookingSerializer(booking)
-        Notification.objects.create(
-            user=request.user,
-            message=f"Booking {period.activity_offer.activity.title} created waiting for confirmation from {period.activity_offer.activity.supplier.user.username}",
-        )
-        Notification.objects.create(
-            user=period.activity_offer.activity.supplier.user,
-            message=f"Booking {period.activity_offer.activity.title} created waiting for your confirmation",
-        )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
-    except Period.DoesNotExist:
-        return Response(
-            {"error": "Period not found."}, status=status.HTTP_404_NOT_FOUND
-        )
     except Customer.DoesNotExist:
         return Response(
             {"error": "Customer not found."}, status=status.HTTP_404_NOT_FOUND
@@ -71,6 +124,7 @@ def activity_booking_create(request):
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
+@idempotent
 def tour_booking_create(request):
     customer = request.user.customer
     tourday_id = request.data.get("tourday_id")
@@ -82,46 +136,57 @@ def tour_booking_create(request):
         )
 
     try:
-        tourday = TourDay.objects.get(id=tourday_id)
+        tourday = TourDay.objects.select_related(
+            "tour_offer__tour__supplier__user"
+        ).get(id=tourday_id)
     except TourDay.DoesNotExist:
         return Response(
             {"error": "Tour day not found."}, status=status.HTTP_404_NOT_FOUND
         )
 
-    if tourday.stock < quantity:
+    hold_token = request.data.get("hold_token")
+    try:
+        with transaction.atomic():
+            if hold_token:
+                convert(hold_token, customer, TourDay, [tourday.pk])
+            booking = TourBooking.objects.create(
+                tourday=tourday,
+                customer=customer,
+                quantity=quantity,
+                price=quantity * tourday.price,
+            )
+            decrement(TourDay, tourday.pk, quantity, booking=booking)
+            stats.record(booking, tourday.tour_offer.tour.supplier_id, created=True)
+            supplier = tourday.tour_offer.tour.supplier.user
+            notifications = NotificationBatch()
+            notifications.add(
+                request.user,
+                f"Booking {tourday.tour_offer.title} created waiting for confirmation from {supplier.username}",
+            )
+            notifications.add(
+                supplier,
+                f"New booking for {tourday.tour_offer.title} created waiting for your confirmation",
+            )
+            notifications.send()
+    except InvalidHold as e:
+        return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+    except OutOfStock as e:
         return Response(
             {
-                "error": f"Not enough stock for this tour day. Available stock: {tourday.stock}"
+                "error": f"Not enough stock for this tour day. Available stock: {e.available}"
             },
             status=status.HTTP_400_BAD_REQUEST,
         )
-
-    tourday.stock -= quantity
-    tourday.save()
-
-    booking = TourBooking(
-        tourday=tourday,
-        customer=customer,
-        quantity=quantity,
-        price=quantity * tourday.price,
-    )
-    booking.save()
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
     serializer = TourBookingSerializer(booking)
-    Notification.objects.create(
-        user=request.user,
-        message=f"Booking {tourday.tour_offer.title} created waiting for confirmation from {tourday.tour_offer.tour.supplier.user.username}",
-    )
-    Notification.objects.create(
-        user=tourday.tour_offer.tour.supplier.user,
-        message=f"New booking for {tourday.tour_offer.title} created waiting for your confirmation",
-    )
-
     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
+@idempotent
 def package_booking_create(request):
     customer = request.user.customer
     package_offer_id = request.data.get("package_offer_id")
@@ -132,7 +197,9 @@ def package_booking_create(request):
         )
 
     try:
-        package_offer = PackageOffer.objects.get(id=package_offer_id)
+        package_offer = PackageOffer.objects.select_related("package").get(
+            id=package_offer_id
+        )
     except PackageOffer.DoesNotExist:
         return Response(
             {"error": "Package offer not found."}, status=status.HTTP_404_NOT_FOUND
@@ -169,36 +236,354 @@ def package_booking_create(request):
     package_days = PackageDay.objects.filter(
         package_offer=package_offer, day__range=(start_date, end_date)
     )
-    if package_days.count() != package_offer.package.period:
+    period = package_offer.package.period
+    hold_token = request.data.get("hold_token")
+    try:
+        with transaction.atomic():
+            if hold_token:
+                convert(
+                    hold_token,
+                    customer,
+                    PackageDay,
+                    package_days.values("pk"),
+                    expected=period,
+                )
+            booking = PackageBooking.objects.create(
+                package_offer=package_offer,
+                customer=customer,
+                start_date=start_date,
+                end_date=end_date,
+                quantity=quantity,
+                price=0,
+            )
+            # same number of queries for a weekend or a month long package,
+            # the price is the days' average
+            summary = decrement_range(package_days, quantity, period, booking)
+            medium_price = summary["price"] / summary["days"] or 1
+            booking.price = medium_price * quantity
+            booking.save(update_fields=["price"])
+            stats.record(booking, package_offer.package.supplier_id, created=True)
+    except InvalidHold as e:
+        return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+    except OutOfStock as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = PackageBookingSerializer(booking)
+    return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+HOLD_MODELS = {"period": Period, "tourday": TourDay, "packageday": PackageDay}
+
+
+# sets stock aside while the customer fills the booking form, the booking
+# endpoints take the returned token as hold_token
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def create_hold(request):
+    customer = get_object_or_404(Customer, user=request.user)
+    slot_type = request.data.get("slot_type")
+    model = HOLD_MODELS.get(slot_type)
+    if model is None:
         return Response(
-            {"error": "Package days not fully available."},
+            {"error": f"slot_type must be one of {', '.join(HOLD_MODELS)}."},
             status=status.HTTP_400_BAD_REQUEST,
         )
 
-    for day in package_days:
-        if day.stock < quantity:
-            return Response(
-                {
-                    "error": f"Not enough stock for {day.day}. Available stock: {day.stock}"
-                },
-                status=status.HTTP_400_BAD_REQUEST,
+    try:
+        quantity = int(request.data.get("quantity", 1))
+        if slot_type == "period" and request.data.get("slot"):
+            # virtual slots are held by key, it creates their row
+            slot_ids = [slots.resolve_period(slot=request.data["slot"]).pk]
+        else:
+            slot_ids = [
+                int(slot_id)
+                for slot_id in request.data.get("slot_ids")
+                or [request.data.get("slot_id")]
+            ]
+    except slots.InvalidSlot as e:
+        return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+    except (TypeError, ValueError):
+        return Response(
+            {"error": "slot_id (or slot_ids) and quantity must be integers."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if quantity < 1:
+        return Response(
+            {"error": "Quantity must be at least 1."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        holds = inventory.hold(customer, model, slot_ids, quantity)
+    except model.DoesNotExist:
+        return Response({"error": "Slot not found."}, status=status.HTTP_404_NOT_FOUND)
+    except OutOfStock:
+        return Response(
+            {"error": "Not enough stock available to hold."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return Response(
+        {
+            "token": holds[0].token,
+            "expires_at": holds[0].expires_at,
+            "slot_type": slot_type,
+            "slot_ids": [hold.slot_id for hold in holds],
+            "quantity": quantity,
+        },
+        status=status.HTTP_201_CREATED,
+    )
+
+
+@api_view(["DELETE"])
+@permission_classes([IsAuthenticated])
+def release_hold(request, token):
+    customer = get_object_or_404(Customer, user=request.user)
+    if not inventory.release(token, customer):
+        return Response({"error": "Hold not found."}, status=status.HTTP_404_NOT_FOUND)
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+BATCH_MODELS = {"activity": Period, "tour": TourDay}
+# items a single batch booking may hold
+BATCH_BOOKING_LIMIT = 20
+# the batch response's prices, as the booking serializers render them
+PRICE = serializers.DecimalField(max_digits=None, decimal_places=2)
+
+
+def parse_batch_item(item):
+    """
+    A batch item with its integer slot_id, or for an activity the slot
+    key of a virtual slot (slot, resolved once the transaction is open).
+    """
+    slot = item.get("slot") if item["type"] == "activity" else None
+    if slot:
+        slots.parse_slot_key(slot)
+    return {
+        "type": item["type"],
+        "slot_id": None if slot else int(item["slot_id"]),
+        "slot": slot,
+        "quantity": int(item.get("quantity", 1)),
+        "hold_token": item.get("hold_token"),
+    }
+
+
+# books a whole trip (activity periods and tour days) in one call, all or
+# nothing: activity items may name a virtual slot by key like
+# activity_booking_create, the slots are fetched in one query per type, bookings are bulk
+# inserted and their stock taken inside a single transaction,
+# notifications once it commits
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+@idempotent
+def batch_booking_create(request):
+    customer = get_object_or_404(Customer, user=request.user)
+    items = request.data.get("items")
+    if not isinstance(items, list) or not items:
+        return Response(
+            {"error": "items must be a non empty list."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if len(items) > BATCH_BOOKING_LIMIT:
+        return Response(
+            {"error": f"At most {BATCH_BOOKING_LIMIT} items can be booked at once."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    try:
+        items = [parse_batch_item(item) for item in items]
+    except (KeyError, TypeError, ValueError, slots.InvalidSlot):
+        return Response(
+            {
+                "error": "Each item needs a type, an integer slot_id (or an "
+                "activity slot key) and quantity."
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if any(item["type"] not in BATCH_MODELS or item["quantity"] < 1 for item in items):
+        return Response(
+            {
+                "error": f"type must be one of {', '.join(BATCH_MODELS)} "
+                "and quantity at least 1."
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    def slot_ids(item_type):
+        return [
+            item["slot_id"]
+            for item in items
+            if item["type"] == item_type and item["slot_id"] is not None
+        ]
+
+    slots_by_type = {
+        "activity": Period.objects.select_related(
+            "activity_offer__activity__supplier__user"
+        ).in_bulk(slot_ids("activity")),
+        "tour": TourDay.objects.select_related(
+            "tour_offer__tour__supplier__user"
+        ).in_bulk(slot_ids("tour")),
+    }
+    missing = [
+        item
+        for item in items
+        if item["slot_id"] is not None
+        and item["slot_id"] not in slots_by_type[item["type"]]
+    ]
+    if missing:
+        return Response(
+            {
+                "error": "Slots not found.",
+                "items": [(item["type"], item["slot_id"]) for item in missing],
+            },
+            status=status.HTTP_404_NOT_FOUND,
+        )
+
+    bookings = []
+    rollup = stats.StatsBatch()
+    notifications = NotificationBatch()
+    failed = None
+    try:
+        with transaction.atomic():
+            # virtual slots get their override row here, rolled back with
+            # the rest when an item fails
+            for item in items:
+                if item["slot"]:
+                    failed = item
+                    period = slots.resolve_period(slot=item["slot"])
+                    item["slot_id"] = period.pk
+            keys = [item["slot_id"] for item in items if item["slot"]]
+            if keys:
+                slots_by_type["activity"].update(
+                    Period.objects.select_related(
+                        "activity_offer__activity__supplier__user"
+                    ).in_bulk(keys)
+                )
+
+            for item in items:
+                slot = slots_by_type[item["type"]][item["slot_id"]]
+                if item["type"] == "activity":
+                    booking = ActivityBooking(period=slot, customer=customer)
+                    title = slot.activity_offer.activity.title
+                    supplier = slot.activity_offer.activity.supplier
+                else:
+                    booking = TourBooking(tourday=slot, customer=customer)
+                    title = slot.tour_offer.title
+                    supplier = slot.tour_offer.tour.supplier
+                booking.quantity = item["quantity"]
+                booking.price = item["quantity"] * slot.price
+                bookings.append((booking, supplier.pk))
+                supplier = supplier.user
+                notifications.add(
+                    request.user,
+                    f"Booking {title} created waiting for confirmation from {supplier.username}",
+                )
+                notifications.add(
+                    supplier,
+                    f"New booking for {title} created waiting for your confirmation",
+                )
+
+            for item in items:
+                if item["hold_token"]:
+                    failed = item
+                    convert(
+                        item["hold_token"],
+                        customer,
+                        BATCH_MODELS[item["type"]],
+                        [item["slot_id"]],
+                    )
+            ActivityBooking.objects.bulk_create(
+                [b for b, _ in bookings if isinstance(b, ActivityBooking)]
+            )
+            TourBooking.objects.bulk_create(
+                [b for b, _ in bookings if isinstance(b, TourBooking)]
             )
+            # taken per booking so each movement refers to its booking,
+            # the movements are written together
+            movements = ledger.MovementBatch()
+            for item, (booking, supplier_id) in zip(items, bookings):
+                failed = item
+                decrement(
+                    BATCH_MODELS[item["type"]],
+                    item["slot_id"],
+                    booking.quantity,
+                    booking=booking,
+                    movements=movements,
+                )
+                rollup.add(booking, supplier_id, created=True)
+            movements.write()
+            rollup.write()
+            notifications.send()
+    except slots.InvalidSlot as e:
+        return Response(
+            {"error": str(e), "item": (failed["type"], failed["slot"])},
+            status=status.HTTP_404_NOT_FOUND,
+        )
+    except InvalidHold as e:
+        return Response(
+            {"error": str(e), "item": (failed["type"], failed["slot_id"])},
+            status=status.HTTP_409_CONFLICT,
+        )
+    except OutOfStock as e:
+        return Response(
+            {
+                "error": f"Not enough stock for {failed['type']} {failed['slot_id']}. "
+                f"Available stock: {e.available}",
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
-    totaldays_price = 0
-    for day in package_days:
-        day.stock -= quantity
-        day.save()
-        totaldays_price += day.price
-    medium_price = totaldays_price / len(package_days) or 1
-
-    booking = PackageBooking.objects.create(
-        package_offer=package_offer,
-        customer=customer,
-        start_date=start_date,
-        end_date=end_date,
-        quantity=quantity,
-        price=medium_price * quantity,
+    return Response(
+        {
+            "bookings": [
+                {
+                    "type": item["type"],
+                    "id": booking.id,
+                    "slot_id": item["slot_id"],
+                    "quantity": booking.quantity,
+                    "price": PRICE.to_representation(booking.price),
+                }
+                for item, (booking, _) in zip(items, bookings)
+            ],
+            "total": PRICE.to_representation(
+                sum(booking.price for booking, _ in bookings)
+            ),
+        },
+        status=status.HTTP_201_CREATED,
     )
 
-    serializer = PackageBookingSerializer(booking)
-    return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+# who may see a booking's QR code: its customer and the item's supplier
+QR_CODE_OWNERS = {
+    "activity": "period__activity_offer__activity__supplier__user",
+    "tour": "tourday__tour_offer__tour__supplier__user",
+    "package": "package_offer__package__supplier__user",
+}
+
+
+# renders a confirmed booking's QR code on request, the image never
+# changes so browsers are told to keep it for good
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def booking_qr_code(request, booking_type, booking_id, image_format):
+    model = jobs.BOOKING_MODELS.get(booking_type)
+    if model is None or image_format not in qr.FORMATS:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    owners = (
+        model.objects.filter(pk=booking_id, confirmed=True)
+        .values_list("customer__user", QR_CODE_OWNERS[booking_type])
+        .first()
+    )
+    if owners is None:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    if request.user.pk not in owners:
+        return Response(status=status.HTTP_403_FORBIDDEN)
+
+    etag = quote_etag(f"qr-{booking_type}-{booking_id}-{image_format}")
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(
+            model(pk=booking_id).get_qr_code_image(image_format),
+            content_type=qr.FORMATS[image_format],
+        )
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, max-age=31536000, immutable"
+    return response
@@ -0,0 +1,158 @@
+from datetime import datetime, time, timedelta
+
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from booking.jobs import BOOKING_MODELS
+from .models import SupplierDailyStats
+from .stats import SUPPLIER_PATHS, monthly_sketches
+
+
+GRANULARITIES = ("day", "week", "month")
+# the rollup's counters, customers are counted from the bookings
+METRICS = ("bookings", "confirmed", "units", "revenue", "customers")
+# most periods a single request may return
+MAX_PERIODS = 1000
+
+
+class InvalidQuery(Exception):
+    pass
+
+
+def truncate(day, granularity):
+    # weeks start on monday, like the database's
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def periods(day_from, day_to, granularity):
+    """
+    The start of every period from day_from's to day_to's, MAX_PERIODS + 1
+    at most.
+    """
+    period = truncate(day_from, granularity)
+    result = []
+    while period <= day_to and len(result) <= MAX_PERIODS:
+        result.append(period)
+        if granularity == "month":
+            period = (period + timedelta(days=32)).replace(day=1)
+        else:
+            period += timedelta(days=7 if granularity == "week" else 1)
+    return result
+
+
+def parse_query(request):
+    """
+    Reads ?from=YYYY-MM-DD&to=YYYY-MM-DD&granularity=&metric=&approximate=,
+    the window defaulting to the current year until today.
+    """
+    params = request.query_params
+    granularity = params.get("granularity", "month")
+    if granularity not in GRANULARITIES:
+        raise InvalidQuery(f"granularity is one of {', '.join(GRANULARITIES)}.")
+    metric = params.get("metric", "bookings")
+    if metric not in METRICS:
+        raise InvalidQuery(f"metric is one of {', '.join(METRICS)}.")
+    approximate = params.get("approximate") in ("1", "true")
+    if approximate and (metric, granularity) != ("customers", "month"):
+        raise InvalidQuery("approximate counts monthly customers only.")
+    try:
+        day_to = params.get("to")
+        day_to = (
+            datetime.strptime(day_to, "%Y-%m-%d").date()
+            if day_to
+            else timezone.localdate()
+        )
+        day_from = params.get("from")
+        day_from = (
+            datetime.strptime(day_from, "%Y-%m-%d").date()
+            if day_from
+            else day_to.replace(month=1, day=1)
+        )
+    except ValueError:
+        raise InvalidQuery("Invalid date format. Use YYYY-MM-DD.")
+    if day_to < day_from:
+        raise InvalidQuery("The window ends before it starts.")
+    if len(periods(day_from, day_to, granularity)) > MAX_PERIODS:
+        raise InvalidQuery(
+            f"The window can't exceed {MAX_PERIODS} periods, use a coarser granularity."
+        )
+    return day_from, day_to, granularity, metric, approximate
+
+
+def _rollup_rows(supplier, day_from, day_to, granularity, metric):
+    # a single grouped query over the daily rollup, a few rows per day of
+    # history whatever the number of bookings
+    return (
+        SupplierDailyStats.objects.filter(
+            supplier=supplier, date__gte=day_from, date__lte=day_to
+        )
+        .annotate(bucket=Trunc("date", granularity, output_field=DateField()))
+        .values("item_type", "bucket")
+        .annotate(value=Sum(metric))
+        .order_by()
+        .values_list("item_type", "bucket", "value")
+    )
+
+
+def _customer_rows(supplier, day_from, day_to, granularity):
+    # distinct customers don't add up across days, one grouped query per
+    # booking table (ActivityBooking has a period field, hence bucket)
+    start = timezone.make_aware(datetime.combine(day_from, time.min))
+    end = timezone.make_aware(datetime.combine(day_to + timedelta(days=1), time.min))
+    for item_type, model in BOOKING_MODELS.items():
+        rows = (
+            model.objects.filter(
+                **{SUPPLIER_PATHS[item_type]: supplier},
+                confirmed=True,
+                created_at__gte=start,
+                created_at__lt=end,
+            )
+            .annotate(
+                bucket=Trunc("created_at", granularity, output_field=DateField())
+            )
+            .values("bucket")
+            .annotate(value=Count("customer", distinct=True))
+            .order_by()
+            .values_list("bucket", "value")
+        )
+        for period, value in rows:
+            yield item_type, period, value
+
+
+def _sketch_rows(supplier, day_from, day_to):
+    # the monthly sketches, a row per month and type however many bookings
+    for month, item_type, sketch in monthly_sketches(supplier, day_from, day_to):
+        yield item_type, month, sketch.count()
+
+
+def series(supplier, day_from, day_to, granularity, metric, approximate=False):
+    """
+    The metric of the supplier's bookings made from day_from to day_to,
+    per period and booking type, every period of the window present.
+    Monthly customers are estimated from the sketches when approximate.
+    """
+    buckets = periods(day_from, day_to, granularity)
+    values = {item_type: dict.fromkeys(buckets, 0) for item_type in BOOKING_MODELS}
+    if approximate:
+        rows = _sketch_rows(supplier, day_from, day_to)
+    elif metric == "customers":
+        rows = _customer_rows(supplier, day_from, day_to, granularity)
+    else:
+        rows = _rollup_rows(supplier, day_from, day_to, granularity, metric)
+    for item_type, period, value in rows:
+        values[item_type][period] += value
+    return {
+        "from": day_from,
+        "to": day_to,
+        "granularity": granularity,
+        "metric": metric,
+        "periods": buckets,
+        "series": {
+            item_type: list(counts.values()) for item_type, counts in values.items()
+        },
+    }
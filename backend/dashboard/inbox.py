@@ -0,0 +1,179 @@
+from datetime import datetime
+
+from django.db.models import F, IntegerField, Q
+
+from api.pagination import KeysetPagination, decode_cursor, encode_cursor
+from booking.jobs import BOOKING_MODELS
+from .stats import SUPPLIER_PATHS
+
+
+# The supplier's booking inbox: the bookings of the three tables as compact
+# rows, newest first. Each table is filtered through the catalog joins and
+# read with values(), no model or nested serializer per booking.
+
+# output name -> lookup, per booking type
+ROW_FIELDS = {
+    "activity": {
+        "title": "period__activity_offer__activity__title",
+        "offer_id": "period__activity_offer_id",
+        "offer": "period__activity_offer__title",
+        "day": "period__day",
+        "end_day": "period__day",
+    },
+    "tour": {
+        "title": "tourday__tour_offer__tour__title",
+        "offer_id": "tourday__tour_offer_id",
+        "offer": "tourday__tour_offer__title",
+        "day": "tourday__day",
+        "end_day": "tourday__day",
+    },
+    "package": {
+        "title": "package_offer__package__title",
+        "offer_id": "package_offer_id",
+        "offer": "package_offer__title",
+        "day": "start_date",
+        "end_day": "end_date",
+    },
+}
+BOOKING_FIELDS = (
+    "id",
+    "created_at",
+    "quantity",
+    "price",
+    "confirmed",
+    "paid",
+    "customer_id",
+)
+CUSTOMER_FIELDS = {
+    "username": "customer__user__username",
+    "first_name": "customer__user__first_name",
+    "last_name": "customer__user__last_name",
+}
+BOOLEANS = {"1": True, "true": True, "0": False, "false": False}
+
+
+class InvalidFilter(Exception):
+    pass
+
+
+def _boolean(params, name):
+    value = params.get(name)
+    if value is None:
+        return None
+    if value.lower() not in BOOLEANS:
+        raise InvalidFilter(f"{name} is true or false.")
+    return BOOLEANS[value.lower()]
+
+
+def _date(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise InvalidFilter("Invalid date format. Use YYYY-MM-DD.")
+
+
+def inbox(supplier, params):
+    """
+    A queryset of compact rows per booking type, filtered by ?type=,
+    ?confirmed=, ?paid=, ?from= and ?to= (the days booked), ?offer= (with
+    a type) and ?customer= (part of the customer's username or name).
+    """
+    item_type = params.get("type")
+    if item_type and item_type not in BOOKING_MODELS:
+        raise InvalidFilter(f"type is one of {', '.join(BOOKING_MODELS)}.")
+    offer = params.get("offer")
+    if offer and not item_type:
+        raise InvalidFilter("offer needs a type.")
+    if offer and not offer.isdigit():
+        raise InvalidFilter("offer is an offer id.")
+    filters = Q()
+    for name in ("confirmed", "paid"):
+        value = _boolean(params, name)
+        if value is not None:
+            filters &= Q(**{name: value})
+    customer = params.get("customer")
+    if customer:
+        filters &= (
+            Q(customer__user__username__icontains=customer)
+            | Q(customer__user__first_name__icontains=customer)
+            | Q(customer__user__last_name__icontains=customer)
+        )
+    day_from, day_to = _date(params, "from"), _date(params, "to")
+
+    querysets = {}
+    for name, model in BOOKING_MODELS.items():
+        if item_type and name != item_type:
+            continue
+        fields = ROW_FIELDS[name]
+        queryset = model.objects.filter(filters, **{SUPPLIER_PATHS[name]: supplier})
+        # a package is in the window if any of its days are
+        if day_from:
+            queryset = queryset.filter(**{f"{fields['end_day']}__gte": day_from})
+        if day_to:
+            queryset = queryset.filter(**{f"{fields['day']}__lte": day_to})
+        if offer:
+            queryset = queryset.filter(**{fields["offer_id"]: offer})
+        querysets[name] = queryset.values(
+            *BOOKING_FIELDS,
+            **{key: F(lookup) for key, lookup in {**fields, **CUSTOMER_FIELDS}.items()},
+        )
+    return querysets
+
+
+class InboxPagination(KeysetPagination):
+    """
+    Keyset pagination over several tables merged newest first. The cursor
+    is (created_at, type rank, id) of the last row: every table is read
+    past it with its own range scan, page_size + 1 rows at most, and the
+    rows are merged, so a page costs one query per table at any depth.
+    """
+
+    def sort_key(self, row):
+        return row["created_at"], self.ranks[row["type"]], row["id"]
+
+    def get_table_seek_filter(self, values, rank):
+        created_at, last_rank, last_id = values
+        # at the same created_at, higher ranks come first
+        if rank < last_rank:
+            return Q(created_at__lte=created_at)
+        if rank > last_rank:
+            return Q(created_at__lt=created_at)
+        return self.get_seek_filter([created_at, last_id])
+
+    def paginate_querysets(self, querysets, request):
+        self.page_size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        values = None
+        if cursor:
+            model = next(iter(BOOKING_MODELS.values()))
+            values = decode_cursor(
+                cursor,
+                3,
+                [
+                    model._meta.get_field("created_at"),
+                    IntegerField(),
+                    model._meta.get_field("id"),
+                ],
+            )
+        self.ranks = {item_type: rank for rank, item_type in enumerate(BOOKING_MODELS)}
+        rows = []
+        for item_type, queryset in querysets.items():
+            queryset = queryset.order_by(*self.ordering)
+            if values:
+                queryset = queryset.filter(
+                    self.get_table_seek_filter(values, self.ranks[item_type])
+                )
+            rows += [
+                {"type": item_type, **row} for row in queryset[: self.page_size + 1]
+            ]
+        rows.sort(key=self.sort_key, reverse=True)
+
+        self.has_next = len(rows) > self.page_size
+        page = rows[: self.page_size]
+        self.next_cursor = None
+        if self.has_next:
+            self.next_cursor = encode_cursor(list(self.sort_key(page[-1])))
+        return page
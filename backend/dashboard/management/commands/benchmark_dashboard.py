@@ -0,0 +1,84 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from booking import benchmark
+from dashboard import stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the supplier dashboard endpoints against a seeded supplier "
+        "with --bookings bookings and print the latencies and query counts "
+        "as JSON. Seeds the configured database and deletes it afterwards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bookings", type=int, default=50_000)
+        parser.add_argument("--customers", type=int, default=200)
+        parser.add_argument(
+            "--repeat", type=int, default=20, help="Requests per endpoint"
+        )
+        parser.add_argument("--output", help="Write the JSON report to this file")
+
+    def endpoints(self):
+        return {
+            "supplier_dashboard": reverse("supplier_dashboard"),
+            "supplier_offer_list": reverse("supplier_offer_list", args=["activity"]),
+            "bookings_per_month": reverse("bookings-per-month"),
+            "sales_per_month": reverse("sales-per-month"),
+            "supplier_booking_inbox": reverse("supplier-booking-inbox"),
+            "customers_per_month": reverse("customers-per-month"),
+            "customers_per_month_approximate": (
+                reverse("customers-per-month") + "?approximate=1"
+            ),
+        }
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        catalog = benchmark.Catalog(options["customers"], slots=30, stock=10)
+        try:
+            seeded = catalog.fill(options["bookings"])
+            # the seeded bookings skipped the views that keep the rollup
+            stats.rebuild()
+            report = {
+                "database": connection.vendor,
+                "bookings": seeded,
+                "seed_seconds": round(time.perf_counter() - started, 1),
+                "endpoints": {},
+            }
+            client = APIClient()
+            client.force_authenticate(catalog.supplier.user)
+            with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]
+            ):
+                for name, url in self.endpoints().items():
+                    latencies = []
+                    for _ in range(options["repeat"]):
+                        with CaptureQueriesContext(connection) as queries:
+                            began = time.perf_counter()
+                            response = client.get(url)
+                            latencies.append(time.perf_counter() - began)
+                    latencies.sort()
+                    report["endpoints"][name] = {
+                        "status": response.status_code,
+                        "queries": len(queries),
+                        "latency_ms": {
+                            label: round(benchmark.percentile(latencies, p) * 1000, 2)
+                            for label, p in (("p50", 50), ("p95", 95), ("max", 100))
+                        },
+                    }
+        finally:
+            catalog.delete()
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        self.stdout.write(output)
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from dashboard import stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the supplier daily statistics rollup from the bookings, "
+        "one grouped aggregate per booking table"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        rows = stats.rebuild(batch_size=options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {rows} daily rows in {time.monotonic() - started:.2f}s"
+            )
+        )
@@ -0,0 +1,60 @@
+from django.db import models
+
+from booking.models import BOOKING_TYPES
+from users.models import Supplier
+
+
+# a supplier's bookings of one type created on one day, kept up to date
+# by the booking, confirm and payment views (see dashboard.stats) so the
+# dashboard reads a few rows instead of scanning every booking through
+# the catalog joins. Rebuilt with the rebuild_supplier_stats command
+class SupplierDailyStats(models.Model):
+    supplier = models.ForeignKey(
+        Supplier, on_delete=models.CASCADE, related_name="daily_stats"
+    )
+    date = models.DateField()
+    item_type = models.CharField(max_length=20, choices=BOOKING_TYPES)
+    bookings = models.PositiveIntegerField(default=0)
+    confirmed = models.PositiveIntegerField(default=0)
+    paid = models.PositiveIntegerField(default=0)
+    # quantity and price of the confirmed bookings
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = "supplier daily stats"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["supplier", "date", "item_type"],
+                name="unique_supplier_daily_stats",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.supplier} {self.date} {self.item_type}"
+
+
+# a HyperLogLog sketch (see dashboard.hll) of the customers of a supplier's
+# bookings of one type confirmed in one month, by the month they were made
+# in. Updated with the daily rollup, the types' sketches are merged for the
+# approximate customers of all bookings
+class SupplierMonthlyCustomers(models.Model):
+    supplier = models.ForeignKey(
+        Supplier, on_delete=models.CASCADE, related_name="monthly_customers"
+    )
+    # the first day of the month
+    month = models.DateField()
+    item_type = models.CharField(max_length=20, choices=BOOKING_TYPES)
+    sketch = models.BinaryField()
+
+    class Meta:
+        verbose_name_plural = "supplier monthly customers"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["supplier", "month", "item_type"],
+                name="unique_supplier_monthly_customers",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.supplier} {self.month:%Y-%m} {self.item_type}"
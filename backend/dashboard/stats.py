@@ -0,0 +1,229 @@
+from collections import Counter, defaultdict
+from datetime import datetime, time
+
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, ExtractMonth, TruncDate
+from django.utils import timezone
+
+from booking.jobs import BOOKING_MODELS, BOOKING_TYPES
+from .hll import HyperLogLog
+from .models import SupplierDailyStats, SupplierMonthlyCustomers
+
+
+# The SupplierDailyStats rollup and the SupplierMonthlyCustomers sketches.
+# The views add their booking's counts in the transaction that creates,
+# confirms or pays it, rebuild() recomputes every row from the bookings.
+
+# the supplier of each booking model, through the catalog
+SUPPLIER_PATHS = {
+    "activity": "period__activity_offer__activity__supplier",
+    "tour": "tourday__tour_offer__tour__supplier",
+    "package": "package_offer__package__supplier",
+}
+COUNTERS = ("bookings", "confirmed", "paid", "units", "revenue")
+
+
+class StatsBatch:
+    """
+    Collects the counts of several bookings and adds them with one
+    UPDATE per supplier, day and booking type.
+    """
+
+    def __init__(self):
+        self.rows = defaultdict(Counter)
+        self.customers = defaultdict(set)
+
+    def add(self, booking, supplier_id, created=False, confirmed=False, paid=False):
+        item_type = BOOKING_TYPES[type(booking)]
+        counts = self.rows[
+            supplier_id, timezone.localdate(booking.created_at), item_type
+        ]
+        counts["bookings"] += created
+        counts["paid"] += paid
+        if confirmed:
+            counts["confirmed"] += 1
+            counts["units"] += int(booking.quantity)
+            counts["revenue"] += booking.price
+            month = timezone.localdate(booking.created_at).replace(day=1)
+            self.customers[supplier_id, month, item_type].add(booking.customer_id)
+
+    def write(self):
+        """
+        Call inside the transaction of the bookings' changes. The missing
+        rows are inserted empty first, so every row is then incremented by
+        an UPDATE whether or not a concurrent request inserted it.
+        """
+        rows, self.rows = self.rows, defaultdict(Counter)
+        SupplierDailyStats.objects.bulk_create(
+            [
+                SupplierDailyStats(supplier_id=supplier_id, date=day, item_type=item_type)
+                for supplier_id, day, item_type in rows
+            ],
+            ignore_conflicts=True,
+        )
+        for (supplier_id, day, item_type), counts in rows.items():
+            SupplierDailyStats.objects.filter(
+                supplier_id=supplier_id, date=day, item_type=item_type
+            ).update(**{name: F(name) + value for name, value in counts.items()})
+        self.write_customers()
+        return len(rows)
+
+    def write_customers(self):
+        customers, self.customers = self.customers, defaultdict(set)
+        if not customers:
+            return
+        SupplierMonthlyCustomers.objects.bulk_create(
+            [
+                SupplierMonthlyCustomers(
+                    supplier_id=supplier_id,
+                    month=month,
+                    item_type=item_type,
+                    sketch=HyperLogLog().to_bytes(),
+                )
+                for supplier_id, month, item_type in customers
+            ],
+            ignore_conflicts=True,
+        )
+        query = Q()
+        for supplier_id, month, item_type in customers:
+            query |= Q(supplier_id=supplier_id, month=month, item_type=item_type)
+        # locked, a concurrent confirmation would lose its registers
+        rows = SupplierMonthlyCustomers.objects.select_for_update().filter(query)
+        for row in rows:
+            sketch = HyperLogLog.from_bytes(row.sketch)
+            for customer_id in customers[row.supplier_id, row.month, row.item_type]:
+                sketch.add(customer_id)
+            row.sketch = sketch.to_bytes()
+        SupplierMonthlyCustomers.objects.bulk_update(rows, ["sketch"])
+
+
+def record(booking, supplier_id, **changes):
+    batch = StatsBatch()
+    batch.add(booking, supplier_id, **changes)
+    return batch.write()
+
+
+def rebuild(batch_size=1000):
+    """
+    Recomputes the whole rollup with one grouped aggregate per booking
+    model. Returns the number of rows written.
+    """
+    confirmed = Q(confirmed=True)
+    rows = []
+    for item_type, model in BOOKING_MODELS.items():
+        # the totals are prefixed, an annotation named like a field would
+        # shadow it in the filters
+        totals = (
+            model.objects.annotate(
+                supplier_id=F(SUPPLIER_PATHS[item_type]), day=TruncDate("created_at")
+            )
+            .values("supplier_id", "day")
+            .annotate(
+                total_bookings=Count("id"),
+                total_confirmed=Count("id", filter=confirmed),
+                total_paid=Count("id", filter=Q(paid=True)),
+                total_units=Coalesce(Sum("quantity", filter=confirmed), 0),
+                total_revenue=Coalesce(
+                    Sum("price", filter=confirmed),
+                    Value(0),
+                    output_field=DecimalField(max_digits=12, decimal_places=2),
+                ),
+            )
+            .order_by()
+        )
+        rows += [
+            SupplierDailyStats(
+                supplier_id=row["supplier_id"],
+                date=row["day"],
+                item_type=item_type,
+                **{name: row[f"total_{name}"] for name in COUNTERS},
+            )
+            for row in totals
+        ]
+    sketches = defaultdict(HyperLogLog)
+    for item_type, model in BOOKING_MODELS.items():
+        confirmed_bookings = model.objects.filter(confirmed=True).values_list(
+            SUPPLIER_PATHS[item_type], "created_at", "customer_id"
+        )
+        for supplier_id, created_at, customer_id in confirmed_bookings.iterator():
+            month = timezone.localdate(created_at).replace(day=1)
+            sketches[supplier_id, month, item_type].add(customer_id)
+    with transaction.atomic():
+        SupplierDailyStats.objects.all().delete()
+        SupplierDailyStats.objects.bulk_create(rows, batch_size=batch_size)
+        SupplierMonthlyCustomers.objects.all().delete()
+        SupplierMonthlyCustomers.objects.bulk_create(
+            [
+                SupplierMonthlyCustomers(
+                    supplier_id=supplier_id,
+                    month=month,
+                    item_type=item_type,
+                    sketch=sketch.to_bytes(),
+                )
+                for (supplier_id, month, item_type), sketch in sketches.items()
+            ],
+            batch_size=batch_size,
+        )
+    return len(rows)
+
+
+def customers_per_month(supplier, start):
+    """
+    The distinct customers of the supplier's bookings confirmed since
+    start, per month, counted by the database over the union of the three
+    booking tables in one query.
+    """
+    start = timezone.make_aware(datetime.combine(start, time.min))
+    selects, params = [], []
+    for item_type, model in BOOKING_MODELS.items():
+        sql, select_params = (
+            model.objects.filter(
+                **{SUPPLIER_PATHS[item_type]: supplier},
+                confirmed=True,
+                created_at__gte=start,
+            )
+            .annotate(month=ExtractMonth("created_at"))
+            .values("customer_id", "month")
+            .order_by()
+            .query.sql_with_params()
+        )
+        selects.append(sql)
+        params += select_params
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT month, COUNT(DISTINCT customer_id)
+            FROM ({" UNION ALL ".join(selects)}) AS bookings
+            GROUP BY month
+            """,
+            params,
+        )
+        return dict(cursor.fetchall())
+
+
+def monthly_sketches(supplier, start, end=None):
+    """
+    The (month, item_type, HyperLogLog) of the supplier's months from
+    start's to end's, one small row per month and type.
+    """
+    sketches = SupplierMonthlyCustomers.objects.filter(
+        supplier=supplier, month__gte=start.replace(day=1)
+    )
+    if end is not None:
+        sketches = sketches.filter(month__lte=end)
+    for month, item_type, sketch in sketches.values_list(
+        "month", "item_type", "sketch"
+    ):
+        yield month, item_type, HyperLogLog.from_bytes(sketch)
+
+
+def approximate_customers_per_month(supplier, start):
+    """
+    customers_per_month() estimated from the monthly sketches, the booking
+    types' sketches of a month merged so a customer is counted once.
+    """
+    merged = defaultdict(HyperLogLog)
+    for month, _, sketch in monthly_sketches(supplier, start):
+        merged[month.month].merge(sketch)
+    return {month: sketch.count() for month, sketch in merged.items()}
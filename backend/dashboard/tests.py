@@ -1,3 +1,421 @@
+import json
+from datetime import date, datetime, time, timedelta
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.tests import CatalogFixtureMixin
+from booking.models import PackageBooking, TourBooking
+from . import stats
+from .hll import HyperLogLog
+from .models import SupplierDailyStats
+from tours.models import TourDay
+from users.models import CustomUser, Customer
+
+
+class SupplierDashboardTests(CatalogFixtureMixin, TestCase):
+    def setUp(self):
+        self.tourday = TourDay.objects.create(
+            tour_offer=self.create_tour().tour_offer.first(),
+            day=date.today(),
+            stock=10,
+            price=50,
+        )
+        self.package_offer = self.create_package().offers.first()
+        user = CustomUser.objects.create_user(username="customer", is_customer=True)
+        self.customer = Customer.objects.create(user=user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.supplier.user)
+
+    def book_tour(self, quantity, confirmed, **kwargs):
+        booking = TourBooking.objects.create(
+            tourday=self.tourday,
+            customer=self.customer,
+            quantity=quantity,
+            price=quantity * 50,
+            confirmed=confirmed,
+        )
+        if kwargs:
+            TourBooking.objects.filter(pk=booking.pk).update(**kwargs)
+
+    def test_statistics_from_the_rollup(self):
+        self.book_tour(2, True)
+        self.book_tour(3, True, created_at=timezone.now() - timedelta(days=40))
+        self.book_tour(1, False)
+        PackageBooking.objects.create(
+            package_offer=self.package_offer,
+            customer=self.customer,
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=1),
+            quantity=4,
+            price=360,
+            confirmed=True,
+        )
+        call_command("rebuild_supplier_stats", stdout=StringIO())
+        # the rollup's aggregate and three lists of today's customers, the
+        # supplier comes with the user
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("supplier_dashboard"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["total_sales"], 9)
+        self.assertEqual(response.data["confirmed_bookings"], 3)
+        self.assertEqual(response.data["confirmed_bookings_this_month"], 2)
+        self.assertEqual(response.data["unconfirmed_bookings"], 1)
+        self.assertEqual(response.data["unconfirmed_bookings_this_month"], 1)
+        self.assertEqual(len(response.data["todays_customers"]), 4)
+        self.assertNotIn("my_offers", response.data)
+
+    def test_offer_list_is_paginated(self):
+        for i in range(3):
+            self.create_activity(title=f"Activity {i}")
+        url = reverse("supplier_offer_list", args=["activity"])
+        response = self.client.get(url, {"page_size": 2})
+        self.assertEqual(
+            [offer["title"] for offer in response.data["results"]],
+            ["Activity 2", "Activity 1"],
+        )
+        response = self.client.get(
+            url, {"page_size": 2, "cursor": response.data["next"]}
+        )
+        self.assertEqual(
+            [offer["title"] for offer in response.data["results"]], ["Activity 0"]
+        )
+        self.assertIsNone(response.data["next"])
+        url = reverse("supplier_offer_list", args=["cruise"])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class SupplierDailyStatsTests(CatalogFixtureMixin, TestCase):
+    def setUp(self):
+        self.tourday = TourDay.objects.create(
+            tour_offer=self.create_tour().tour_offer.first(),
+            day=date.today(),
+            stock=10,
+            price=50,
+        )
+        user = CustomUser.objects.create_user(username="customer", is_customer=True)
+        Customer.objects.create(user=user)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def rows(self):
+        return list(
+            SupplierDailyStats.objects.values_list(
+                "item_type", "bookings", "confirmed", "paid", "units", "revenue"
+            )
+        )
+
+    def test_views_keep_the_rollup_current(self):
+        ids = [
+            self.client.post(
+                reverse("create_tour_booking"),
+                {"tourday_id": self.tourday.id, "quantity": quantity},
+                format="json",
+            ).data["id"]
+            for quantity in (2, 3)
+        ]
+        self.client.force_authenticate(self.supplier.user)
+        for booking_id in ids[:1]:
+            self.client.post(reverse("confirm_tour_booking", args=[booking_id]))
+            self.client.post(reverse("confirm_tour_booking", args=[booking_id]))
+            self.client.post(reverse("confirm_tour_payment", args=[booking_id]))
+            self.client.post(reverse("confirm_tour_payment", args=[booking_id]))
+        self.assertEqual(self.rows(), [("tour", 2, 1, 1, 2, 100)])
+        # the backfill agrees
+        call_command("rebuild_supplier_stats", stdout=StringIO())
+        self.assertEqual(self.rows(), [("tour", 2, 1, 1, 2, 100)])
+
+        month = timezone.localdate().month
+        response = self.client.get(reverse("bookings-per-month"))
+        self.assertEqual(dict(response.data)[month], 1)
+        response = self.client.get(reverse("sales-per-month"))
+        self.assertEqual(dict(response.data)[month], 100)
+
+
+class CustomersPerMonthTests(CatalogFixtureMixin, TestCase):
+    def setUp(self):
+        tour_offer = self.create_tour().tour_offer.first()
+        self.tourday = TourDay.objects.create(
+            tour_offer=tour_offer, day=date.today(), stock=100, price=50
+        )
+        self.package_offer = self.create_package().offers.first()
+        self.customers = [
+            Customer.objects.create(
+                user=CustomUser.objects.create_user(
+                    username=f"customer{i}", is_customer=True
+                )
+            )
+            for i in range(3)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.supplier.user)
+
+    def book(self, customer, confirmed=True, package=False):
+        if package:
+            return PackageBooking.objects.create(
+                package_offer=self.package_offer,
+                customer=customer,
+                start_date=date.today(),
+                end_date=date.today(),
+                quantity=1,
+                price=90,
+                confirmed=confirmed,
+            )
+        return TourBooking.objects.create(
+            tourday=self.tourday,
+            customer=customer,
+            quantity=1,
+            price=50,
+            confirmed=confirmed,
+        )
+
+    def test_distinct_customers_across_booking_types(self):
+        first, second, third = self.customers
+        self.book(first)
+        self.book(first, package=True)
+        self.book(second, package=True)
+        self.book(third, confirmed=False)
+        month = timezone.localdate().month
+        # one query over the union of the booking tables
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("customers-per-month"))
+        self.assertEqual(dict(response.data)[month], 2)
+        self.assertEqual(len(response.data), 12)
+
+        call_command("rebuild_supplier_stats", stdout=StringIO())
+        response = self.client.get(
+            reverse("customers-per-month"), {"approximate": "1"}
+        )
+        self.assertEqual(dict(response.data)[month], 2)
+
+        # confirming adds the customer to the month's sketch
+        booking = TourBooking.objects.get(confirmed=False)
+        self.client.post(reverse("confirm_tour_booking", args=[booking.id]))
+        response = self.client.get(
+            reverse("customers-per-month"), {"approximate": "1"}
+        )
+        self.assertEqual(dict(response.data)[month], 3)
+
+
+class SupplierAnalyticsTests(CatalogFixtureMixin, TestCase):
+    def setUp(self):
+        self.tourday = TourDay.objects.create(
+            tour_offer=self.create_tour().tour_offer.first(),
+            day=date.today(),
+            stock=100,
+            price=50,
+        )
+        self.customers = [
+            Customer.objects.create(
+                user=CustomUser.objects.create_user(
+                    username=f"customer{i}", is_customer=True
+                )
+            )
+            for i in range(2)
+        ]
+        # across new year, which the per month endpoints mix up
+        for day, customer, quantity in [
+            (date(2025, 12, 30), 0, 1),
+            (date(2025, 12, 31), 0, 2),
+            (date(2026, 1, 2), 1, 3),
+            (date(2026, 3, 1), 0, 1),
+        ]:
+            booking = TourBooking.objects.create(
+                tourday=self.tourday,
+                customer=self.customers[customer],
+                quantity=quantity,
+                price=quantity * 50,
+                confirmed=True,
+            )
+            created_at = timezone.make_aware(datetime.combine(day, time(12)))
+            TourBooking.objects.filter(pk=booking.pk).update(created_at=created_at)
+        stats.rebuild()
+        self.client = APIClient()
+        self.client.force_authenticate(self.supplier.user)
+
+    def get(self, **params):
+        return self.client.get(reverse("supplier-analytics"), params)
+
+    def test_series_are_gap_filled_per_type(self):
+        with self.assertNumQueries(1):
+            response = self.get(
+                **{"from": "2025-12-01", "to": "2026-03-31"}, metric="revenue"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data["periods"],
+            [date(2025, 12, 1), date(2026, 1, 1), date(2026, 2, 1), date(2026, 3, 1)],
+        )
+        self.assertEqual(response.data["series"]["tour"], [150, 150, 0, 50])
+        self.assertEqual(response.data["series"]["activity"], [0, 0, 0, 0])
+
+        response = self.get(
+            **{"from": "2025-12-29", "to": "2026-01-11"},
+            granularity="week",
+            metric="units",
+        )
+        self.assertEqual(
+            response.data["periods"], [date(2025, 12, 29), date(2026, 1, 5)]
+        )
+        self.assertEqual(response.data["series"]["tour"], [6, 0])
+
+    def test_unique_customers(self):
+        # one grouped query per booking table
+        with self.assertNumQueries(3):
+            response = self.get(
+                **{"from": "2025-12-29", "to": "2026-01-04"},
+                granularity="week",
+                metric="customers",
+            )
+        self.assertEqual(response.data["series"]["tour"], [2])
+
+    def test_approximate_monthly_customers(self):
+        # one row per month and type from the sketches
+        with self.assertNumQueries(1):
+            response = self.get(
+                **{"from": "2025-12-01", "to": "2026-03-31"},
+                metric="customers",
+                approximate="1",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["series"]["tour"], [1, 1, 0, 1])
+        self.assertEqual(response.data["series"]["package"], [0, 0, 0, 0])
+
+    def test_invalid_queries(self):
+        for params in [
+            {"metric": "profit"},
+            {"granularity": "year"},
+            {"from": "2026-13-01"},
+            {"from": "2026-02-01", "to": "2026-01-01"},
+            {"from": "2020-01-01", "to": "2026-01-01", "granularity": "day"},
+            {"metric": "customers", "granularity": "week", "approximate": "1"},
+            {"metric": "revenue", "approximate": "1"},
+        ]:
+            self.assertEqual(self.get(**params).status_code, 400, params)
+
+
+class BookingInboxTests(CatalogFixtureMixin, TestCase):
+    def setUp(self):
+        self.tourday = TourDay.objects.create(
+            tour_offer=self.create_tour().tour_offer.first(),
+            day=date.today(),
+            stock=100,
+            price=50,
+        )
+        self.package_offer = self.create_package().offers.first()
+        self.alice = Customer.objects.create(
+            user=CustomUser.objects.create_user(
+                username="alice", first_name="Alice", is_customer=True
+            )
+        )
+        self.bob = Customer.objects.create(
+            user=CustomUser.objects.create_user(
+                username="bob", first_name="Bob", is_customer=True
+            )
+        )
+        # two bookings of each type at the same instant, then one more tour
+        now = timezone.now()
+        for customer in (self.alice, self.bob):
+            TourBooking.objects.create(
+                tourday=self.tourday, customer=customer, quantity=1, price=50
+            )
+            PackageBooking.objects.create(
+                package_offer=self.package_offer,
+                customer=customer,
+                start_date=date.today() + timedelta(days=5),
+                end_date=date.today() + timedelta(days=7),
+                quantity=1,
+                price=90,
+                confirmed=True,
+            )
+        TourBooking.objects.update(created_at=now)
+        PackageBooking.objects.update(created_at=now)
+        self.latest = TourBooking.objects.create(
+            tourday=self.tourday, customer=self.bob, quantity=2, price=100, paid=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.supplier.user)
+
+    def get(self, **params):
+        return self.client.get(reverse("supplier-booking-inbox"), params)
+
+    def test_pages_merge_the_booking_tables(self):
+        seen, cursor = [], None
+        while True:
+            params = {"page_size": 2, **({"cursor": cursor} if cursor else {})}
+            # the supplier and one query per booking table
+            with self.assertNumQueries(4):
+                response = self.get(**params)
+            self.assertEqual(response.status_code, 200)
+            seen += [(row["type"], row["id"]) for row in response.data["results"]]
+            cursor = response.data["next"]
+            if cursor is None:
+                break
+        tours = sorted(TourBooking.objects.values_list("id", flat=True))
+        packages = sorted(PackageBooking.objects.values_list("id", flat=True))
+        self.assertEqual(
+            seen,
+            [
+                ("tour", self.latest.id),
+                ("package", packages[1]),
+                ("package", packages[0]),
+                ("tour", tours[1]),
+                ("tour", tours[0]),
+            ],
+        )
+        row = self.get(page_size=1).data["results"][0]
+        self.assertEqual(row["username"], "bob")
+        self.assertEqual(row["title"], "Cedars day trip")
+        self.assertEqual(row["day"], date.today())
+
+    def test_filters(self):
+        def ids(**params):
+            return [
+                (row["type"], row["id"]) for row in self.get(**params).data["results"]
+            ]
+
+        self.assertEqual(ids(paid="true"), [("tour", self.latest.id)])
+        self.assertEqual({t for t, _ in ids(confirmed="1")}, {"package"})
+        self.assertEqual(len(ids(customer="ALI")), 2)
+        self.assertEqual(len(ids(type="tour", offer=self.tourday.tour_offer_id)), 3)
+        # packages overlapping the window
+        after = date.today() + timedelta(days=6)
+        self.assertEqual({t for t, _ in ids(**{"from": str(after)})}, {"package"})
+        for params in [
+            {"type": "cruise"},
+            {"offer": "1"},
+            {"paid": "maybe"},
+            {"from": "tomorrow"},
+            {"cursor": "bm90IGEgY3Vyc29y"},
+        ]:
+            self.assertEqual(self.get(**params).status_code, 400, params)
+
+
+class HyperLogLogTests(TestCase):
+    def test_estimate_and_merge(self):
+        left, right = HyperLogLog(), HyperLogLog()
+        for i in range(20000):
+            left.add(i)
+            right.add(i + 10000)
+        self.assertAlmostEqual(left.count() / 20000, 1, delta=0.05)
+        merged = HyperLogLog.from_bytes(left.to_bytes()).merge(right)
+        self.assertAlmostEqual(merged.count() / 30000, 1, delta=0.05)
+        # adding again changes nothing
+        left.add(1)
+        self.assertEqual(left.count(), HyperLogLog(left.to_bytes()).count())
+
 
-# Create your tests here.
+class DashboardBenchmarkTests(TestCase):
+    def test_reports_the_endpoints(self):
+        out = StringIO()
+        call_command(
+            "benchmark_dashboard", bookings=60, customers=3, repeat=2, stdout=out
+        )
+        report = json.loads(out.getvalue())
+        self.assertEqual(report["bookings"], 60)
+        self.assertEqual(report["endpoints"]["supplier_dashboard"]["status"], 200)
+        self.assertFalse(TourBooking.objects.exists())
@@ -3,24 +3,29 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
-from notifications.models import Notification
+from django.db import transaction
+from notifications.dispatch import NotificationBatch
+from booking import jobs
 from booking.models import ActivityBooking, PackageBooking, TourBooking
-from activities.models import Period, Activity
-from packages.models import Package, PackageDay, PackageOffer
-from tours.models import Tour, TourDay, TourOffer
+from . import analytics, stats
+from .inbox import InboxPagination, InvalidFilter, inbox
+from .models import SupplierDailyStats
+from activities.models import Activity
+from packages.models import Package, PackageOffer
+from tours.models import Tour, TourOffer
 from users.models import Supplier, Customer
 from booking.serializers import (
     ActivityBookingSerializer,
     PackageBookingSerializer,
     TourBookingSerializer,
 )
-from datetime import timedelta
 from django.utils import timezone
-from django.db.models import Sum, Count, F
+from django.db.models import Sum, F, Q
 from django.db.models.functions import ExtractMonth  # Import ExtractMonth
-from activities.serializers import ActivitySerializer
-from tours.serializers import TourSerializer
-from packages.serializers import PackageSerializer
+from activities.serializers import ActivitySerializer, ActivityCardSerializer
+from tours.serializers import TourSerializer, TourCardSerializer
+from packages.serializers import PackageSerializer, PackageCardSerializer
+from api.pagination import KeysetPagination, InvalidCursor
 from collections import defaultdict
 
 
@@ -36,9 +41,15 @@ def supplier_offers(request):
         )
 
     # Fetching the offers related to the supplier
-    activity_offers = Activity.objects.filter(supplier=supplier)
-    tour_offers = Tour.objects.filter(supplier=supplier)
-    package_offers = Package.objects.filter(supplier=supplier)
+    activity_offers = ActivitySerializer.setup_eager_loading(
+        Activity.objects.filter(supplier=supplier)
+    )
+    tour_offers = TourSerializer.setup_eager_loading(
+        Tour.objects.filter(supplier=supplier)
+    )
+    package_offers = PackageSerializer.setup_eager_loading(
+        Package.objects.filter(supplier=supplier)
+    )
 
     activity_serialized = ActivitySerializer(activity_offers, many=True)
     tour_serialized = TourSerializer(tour_offers, many=True)
@@ -64,124 +75,17 @@ def supplier_dashboard(request):
             {"detail": "You are not authorized to view this information."}, status=403
         )
 
-    # My offers
-    activities = supplier.activity_set.all()
-    tours = supplier.tour_set.all()
-    packages = supplier.package_set.all()
-
-    activity_serialized = ActivitySerializer(activities, many=True)
-    tour_serialized = TourSerializer(tours, many=True)
-    package_serialized = PackageSerializer(packages, many=True)
-
-    # Total sales
-    total_sales = (
-        (
-            ActivityBooking.objects.filter(
-                period__activity_offer__activity__supplier=supplier, confirmed=True
-            ).aggregate(total_sales=Sum("quantity"))["total_sales"]
-            or 0
-        )
-        + (
-            TourBooking.objects.filter(
-                tourday__tour_offer__tour__supplier=supplier, confirmed=True
-            ).aggregate(total_sales=Sum("quantity"))["total_sales"]
-            or 0
-        )
-        + (
-            PackageBooking.objects.filter(
-                package_offer__package__supplier=supplier, confirmed=True
-            ).aggregate(total_sales=Sum("quantity"))["total_sales"]
-            or 0
-        )
-    )
-
-    # Confirmed bookings combined
-    confirmed_bookings = (
-        (
-            ActivityBooking.objects.filter(
-                period__activity_offer__activity__supplier=supplier, confirmed=True
-            ).count()
-        )
-        + (
-            TourBooking.objects.filter(
-                tourday__tour_offer__tour__supplier=supplier, confirmed=True
-            ).count()
-        )
-        + (
-            PackageBooking.objects.filter(
-                package_offer__package__supplier=supplier, confirmed=True
-            ).count()
-        )
-    )
-
-    # Confirmed bookings this month
-    start_of_month = timezone.now().replace(day=1)
-    confirmed_bookings_this_month = (
-        (
-            ActivityBooking.objects.filter(
-                period__activity_offer__activity__supplier=supplier,
-                confirmed=True,
-                created_at__gte=start_of_month,
-            ).count()
-        )
-        + (
-            TourBooking.objects.filter(
-                tourday__tour_offer__tour__supplier=supplier,
-                confirmed=True,
-                created_at__gte=start_of_month,
-            ).count()
-        )
-        + (
-            PackageBooking.objects.filter(
-                package_offer__package__supplier=supplier,
-                confirmed=True,
-                created_at__gte=start_of_month,
-            ).count()
-        )
-    )
-
-    # Unconfirmed bookings
-    unconfirmed_bookings = (
-        (
-            ActivityBooking.objects.filter(
-                period__activity_offer__activity__supplier=supplier, confirmed=False
-            ).count()
-        )
-        + (
-            TourBooking.objects.filter(
-                tourday__tour_offer__tour__supplier=supplier, confirmed=False
-            ).count()
-        )
-        + (
-            PackageBooking.objects.filter(
-                package_offer__package__supplier=supplier, confirmed=False
-            ).count()
-        )
-    )
-
-    # Unconfirmed bookings this month
-    unconfirmed_bookings_this_month = (
-        (
-            ActivityBooking.objects.filter(
-                period__activity_offer__activity__supplier=supplier,
-                confirmed=False,
-                created_at__gte=start_of_month,
-            ).count()
-        )
-        + (
-            TourBooking.objects.filter(
-                tourday__tour_offer__tour__supplier=supplier,
-                confirmed=False,
-                created_at__gte=start_of_month,
-            ).count()
-        )
-        + (
-            PackageBooking.objects.filter(
-                package_offer__package__supplier=supplier,
-                confirmed=False,
-                created_at__gte=start_of_month,
-            ).count()
-        )
+    # the statistics add up the supplier's daily rollup rows
+    start_of_month = timezone.localdate().replace(day=1)
+    this_month = Q(date__gte=start_of_month)
+    data = SupplierDailyStats.objects.filter(supplier=supplier).aggregate(
+        total_sales=Sum("units", default=0),
+        confirmed_bookings=Sum("confirmed", default=0),
+        confirmed_bookings_this_month=Sum("confirmed", filter=this_month, default=0),
+        unconfirmed_bookings=Sum(F("bookings") - F("confirmed"), default=0),
+        unconfirmed_bookings_this_month=Sum(
+            F("bookings") - F("confirmed"), filter=this_month, default=0
+        ),
     )
 
     # Today's customers
@@ -219,29 +123,64 @@ def supplier_dashboard(request):
         )
     )
 
-    data = {
-        "my_offers": {
-            "activities": activity_serialized.data,
-            "tours": tour_serialized.data,
-            "packages": package_serialized.data,
-        },
-        "total_sales": total_sales,
-        "confirmed_bookings": confirmed_bookings,
-        "confirmed_bookings_this_month": confirmed_bookings_this_month,
-        "unconfirmed_bookings": unconfirmed_bookings,
-        "unconfirmed_bookings_this_month": unconfirmed_bookings_this_month,
-        "todays_customers": todays_customers,
-    }
-
+    # the offers are listed by supplier_offers, a page at a time
+    data["todays_customers"] = todays_customers
     return Response(data)
 
 
+SUPPLIER_OFFERS = {
+    "activity": (ActivityCardSerializer, "activity_set"),
+    "tour": (TourCardSerializer, "tour_set"),
+    "package": (PackageCardSerializer, "package_set"),
+}
+
+
+# the supplier's offers of one type as lean cards, newest first and keyset
+# paginated like the catalog listings, for suppliers with many offers
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def supplier_offer_list(request, offer_type):
+    supplier = get_object_or_404(Supplier, user=request.user)
+    if offer_type not in SUPPLIER_OFFERS:
+        return Response(
+            {"error": f"Offer type must be one of {', '.join(SUPPLIER_OFFERS)}."},
+            status=status.HTTP_404_NOT_FOUND,
+        )
+    serializer_class, related = SUPPLIER_OFFERS[offer_type]
+    offers = serializer_class.setup_eager_loading(getattr(supplier, related).all())
+    paginator = KeysetPagination()
+    try:
+        page = paginator.paginate_queryset(offers, request)
+    except InvalidCursor as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = serializer_class(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+
+# every booking of the supplier as compact rows, newest first, filtered
+# and keyset paginated across the three booking tables
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def supplier_booking_inbox(request):
+    supplier = get_object_or_404(Supplier, user=request.user)
+    paginator = InboxPagination()
+    try:
+        page = paginator.paginate_querysets(
+            inbox(supplier, request.query_params), request
+        )
+    except (InvalidFilter, InvalidCursor) as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return paginator.get_paginated_response(page)
+
+
 # Customer views for activity bookings
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def customer_activity_bookings(request):
     customer = get_object_or_404(Customer, user=request.user)
-    bookings = ActivityBooking.objects.filter(customer=customer)
+    bookings = ActivityBookingSerializer.setup_eager_loading(
+        ActivityBooking.objects.filter(customer=customer)
+    )
     serializer = ActivityBookingSerializer(bookings, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -251,9 +190,9 @@ def customer_activity_bookings(request):
 @permission_classes([IsAuthenticated])
 def supplier_activity_bookings(request):
     supplier = get_object_or_404(Supplier, user=request.user)
-    activities = Activity.objects.filter(supplier=supplier)
-    periods = Period.objects.filter(activity_offer__activity__in=activities)
-    bookings = ActivityBooking.objects.filter(period__in=periods)
+    bookings = ActivityBookingSerializer.setup_eager_loading(
+        ActivityBooking.objects.filter(period__activity_offer__activity__supplier=supplier)
+    )
     serializer = ActivityBookingSerializer(bookings, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -262,24 +201,42 @@ def supplier_activity_bookings(request):
 @permission_classes([IsAuthenticated])
 def confirm_activity_booking(request, booking_id):
     supplier = get_object_or_404(Supplier, user=request.user)
-    booking = get_object_or_404(ActivityBooking, id=booking_id)
-    period = get_object_or_404(Period, pk=booking.period_id)
-    if booking.period.activity_offer.activity.supplier != supplier:
+    # what the checks, the notification and the response need in one go
+    booking = get_object_or_404(
+        ActivityBookingSerializer.setup_eager_loading(ActivityBooking.objects),
+        id=booking_id,
+    )
+    period = booking.period
+    if period.activity_offer.activity.supplier_id != supplier.id:
         return Response(
             {"detail": "Not authorized to confirm this booking."},
             status=status.HTTP_403_FORBIDDEN,
         )
 
+    # the stock was taken when the booking was created, the bookings made
+    # before that are taken by the take_pending_activity_stock deploy step
+    with transaction.atomic():
+        # claiming the confirmation first means a double submit can't
+        # confirm twice
+        claimed = ActivityBooking.objects.filter(
+            pk=booking.pk, confirmed=False
+        ).update(confirmed=True)
+        if not claimed:
+            return Response(
+                {"detail": "Booking is already confirmed."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        stats.record(booking, supplier.id, confirmed=True)
+        # rendered by the qr_worker command, not while the supplier waits
+        jobs.enqueue(booking)
+        notifications = NotificationBatch()
+        notifications.add(
+            booking.customer.user_id,
+            f"Activity {period.activity_offer.activity.title} got confirmed",
+        )
+        notifications.send()
+
     booking.confirmed = True
-    booking.generate_qr_code()
-    period.stock -= booking.quantity
-    period.save()
-    booking.save()
-
-    Notification.objects.create(
-        user=booking.customer.user,
-        message=f"Activity {period.activity_offer.activity.title} got confirmed",
-    )
     serializer = ActivityBookingSerializer(booking)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -288,24 +245,26 @@ def confirm_activity_booking(request, booking_id):
 @permission_classes([IsAuthenticated])
 def confirm_payment(request, booking_id):
     supplier = get_object_or_404(Supplier, user=request.user)
-    booking = get_object_or_404(ActivityBooking, id=booking_id)
-    if booking.period.activity_offer.activity.supplier != supplier:
+    booking = get_object_or_404(
+        ActivityBookingSerializer.setup_eager_loading(ActivityBooking.objects),
+        id=booking_id,
+    )
+    if booking.period.activity_offer.activity.supplier_id != supplier.id:
         return Response(
             {"detail": "Not authorized to confirm payment for this booking."},
             status=status.HTTP_403_FORBIDDEN,
         )
 
-    booking.paid = True
-    booking.save()
+    with transaction.atomic():
+        # counted once however often the payment is confirmed
+        if ActivityBooking.objects.filter(pk=booking.pk, paid=False).update(paid=True):
+            stats.record(booking, supplier.id, paid=True)
+        booking.paid = True
+        notifications = NotificationBatch()
+        notifications.add(booking.customer.user_id, "Activity Booking got paid")
+        notifications.add(supplier.user_id, "Activity Booking got paid")
+        notifications.send()
     serializer = ActivityBookingSerializer(booking)
-
-    Notification.objects.create(
-        user=booking.customer.user, message="Activity Booking got paid"
-    )
-    Notification.objects.create(
-        user=booking.period.activity_offer.activity.supplier.user,
-        message="Activity Booking got paid",
-    )
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
@@ -314,7 +273,9 @@ def confirm_payment(request, booking_id):
 @permission_classes([IsAuthenticated])
 def customer_package_bookings(request):
     customer = get_object_or_404(Customer, user=request.user)
-    bookings = PackageBooking.objects.filter(customer=customer)
+    bookings = PackageBookingSerializer.setup_eager_loading(
+        PackageBooking.objects.filter(customer=customer)
+    )
     serializer = PackageBookingSerializer(bookings, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -324,8 +285,9 @@ def customer_package_bookings(request):
 @permission_classes([IsAuthenticated])
 def supplier_packages_bookings(request):
     supplier = get_object_or_404(Supplier, user=request.user)
-    packages = Package.objects.filter(supplier=supplier)
-    bookings = PackageBooking.objects.filter(package_offer__package__in=packages)
+    bookings = PackageBookingSerializer.setup_eager_loading(
+        PackageBooking.objects.filter(package_offer__package__supplier=supplier)
+    )
     serializer = PackageBookingSerializer(bookings, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -334,9 +296,12 @@ def supplier_packages_bookings(request):
 @permission_classes([IsAuthenticated])
 def confirm_package_booking(request, booking_id):
     supplier = get_object_or_404(Supplier, user=request.user)
-    booking = get_object_or_404(PackageBooking, id=booking_id)
+    booking = get_object_or_404(
+        PackageBookingSerializer.setup_eager_loading(PackageBooking.objects),
+        id=booking_id,
+    )
 
-    if booking.package_offer.package.supplier != supplier:
+    if booking.package_offer.package.supplier_id != supplier.id:
         return Response(
             {"detail": "Not authorized to confirm this booking."},
             status=status.HTTP_403_FORBIDDEN,
@@ -349,30 +314,26 @@ def confirm_package_booking(request, booking_id):
         )
 
     package = booking.package_offer.package
-    start_date = booking.start_date
-    end_date = start_date + timedelta(days=package.period - 1)
-    package_days = PackageDay.objects.filter(
-        package_offer=booking.package_offer, day__range=(start_date, end_date)
-    )
-
-    for day in package_days:
-        if day.stock < 1:
+    # the days' stock was taken when the booking was created
+    with transaction.atomic():
+        claimed = PackageBooking.objects.filter(
+            pk=booking.pk, confirmed=False
+        ).update(confirmed=True)
+        if not claimed:
             return Response(
-                {"error": f"No available stock for {day.day}."},
+                {"detail": "Booking is already confirmed."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-
-    for day in package_days:
-        day.stock -= booking.quantity
-        day.save()
+        stats.record(booking, supplier.id, confirmed=True)
+        jobs.enqueue(booking)
+        notifications = NotificationBatch()
+        notifications.add(
+            booking.customer.user_id,
+            f"Package {package.title} got confirmed, enjoy your time",
+        )
+        notifications.send()
 
     booking.confirmed = True
-    booking.generate_qr_code()
-    booking.save()
-    Notification.objects.create(
-        user=booking.customer.user,
-        message=f"Package {package.title} got confirmed, enjoy your time",
-    )
     serializer = PackageBookingSerializer(booking)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -381,24 +342,26 @@ def confirm_package_booking(request, booking_id):
 @permission_classes([IsAuthenticated])
 def confirm_package_payment(request, booking_id):
     supplier = get_object_or_404(Supplier, user=request.user)
-    booking = get_object_or_404(PackageBooking, id=booking_id)
-    if booking.package_offer.package.supplier != supplier:
+    booking = get_object_or_404(
+        PackageBookingSerializer.setup_eager_loading(PackageBooking.objects),
+        id=booking_id,
+    )
+    if booking.package_offer.package.supplier_id != supplier.id:
         return Response(
             {"detail": "Not authorized to confirm payment for this booking."},
             status=status.HTTP_403_FORBIDDEN,
         )
 
-    booking.paid = True
-    booking.save()
+    with transaction.atomic():
+        # counted once however often the payment is confirmed
+        if PackageBooking.objects.filter(pk=booking.pk, paid=False).update(paid=True):
+            stats.record(booking, supplier.id, paid=True)
+        booking.paid = True
+        notifications = NotificationBatch()
+        notifications.add(booking.customer.user_id, "Package Booking got paid")
+        notifications.add(supplier.user_id, "Package Booking got paid")
+        notifications.send()
     serializer = PackageBookingSerializer(booking)
-
-    Notification.objects.create(
-        user=booking.customer.user, message="Package Booking got paid"
-    )
-    Notification.objects.create(
-        user=booking.package_offer.package.supplier.user,
-        message="Package Booking got paid",
-    )
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
@@ -407,7 +370,9 @@ def confirm_package_payment(request, booking_id):
 @permission_classes([IsAuthenticated])
 def customer_tour_bookings(request):
     customer = get_object_or_404(Customer, user=request.user)
-    bookings = TourBooking.objects.filter(customer=customer)
+    bookings = TourBookingSerializer.setup_eager_loading(
+        TourBooking.objects.filter(customer=customer)
+    )
     serializer = TourBookingSerializer(bookings, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -417,9 +382,9 @@ def customer_tour_bookings(request):
 @permission_classes([IsAuthenticated])
 def supplier_tours_bookings(request):
     supplier = get_object_or_404(Supplier, user=request.user)
-    tours = Tour.objects.filter(supplier=supplier)
-    days = TourDay.objects.filter(tour_offer__tour__in=tours)
-    bookings = TourBooking.objects.filter(tourday__in=days)
+    bookings = TourBookingSerializer.setup_eager_loading(
+        TourBooking.objects.filter(tourday__tour_offer__tour__supplier=supplier)
+    )
     serializer = TourBookingSerializer(bookings, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -428,8 +393,11 @@ def supplier_tours_bookings(request):
 @permission_classes([IsAuthenticated])
 def confirm_tour_booking(request, booking_id):
     supplier = get_object_or_404(Supplier, user=request.user)
-    booking = get_object_or_404(TourBooking, id=booking_id)
-    if booking.tourday.tour_offer.tour.supplier != supplier:
+    booking = get_object_or_404(
+        TourBookingSerializer.setup_eager_loading(TourBooking.objects),
+        id=booking_id,
+    )
+    if booking.tourday.tour_offer.tour.supplier_id != supplier.id:
         return Response(
             {"detail": "Not authorized to confirm this booking."},
             status=status.HTTP_403_FORBIDDEN,
@@ -441,23 +409,25 @@ def confirm_tour_booking(request, booking_id):
             status=status.HTTP_400_BAD_REQUEST,
         )
 
-    tourday = booking.tourday
-    if tourday.stock < 1:
-        return Response(
-            {"error": "No available stock for this tour day."},
-            status=status.HTTP_400_BAD_REQUEST,
+    # the stock was taken when the booking was created
+    with transaction.atomic():
+        claimed = TourBooking.objects.filter(
+            pk=booking.pk, confirmed=False
+        ).update(confirmed=True)
+        if not claimed:
+            return Response(
+                {"detail": "Booking is already confirmed."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        stats.record(booking, supplier.id, confirmed=True)
+        jobs.enqueue(booking)
+        notifications = NotificationBatch()
+        notifications.add(
+            booking.customer.user_id, "Tour got confirmed, enjoy your time"
         )
-
-    tourday.stock -= booking.quantity
-    tourday.save()
+        notifications.send()
 
     booking.confirmed = True
-    booking.generate_qr_code()
-    booking.save()
-
-    Notification.objects.create(
-        user=booking.customer.user, message="Tour got confirmed, enjoy your time"
-    )
     serializer = TourBookingSerializer(booking)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -466,23 +436,26 @@ def confirm_tour_booking(request, booking_id):
 @permission_classes([IsAuthenticated])
 def confirm_tour_payment(request, booking_id):
     supplier = get_object_or_404(Supplier, user=request.user)
-    booking = get_object_or_404(TourBooking, id=booking_id)
-    if booking.tourday.tour_offer.tour.supplier != supplier:
+    booking = get_object_or_404(
+        TourBookingSerializer.setup_eager_loading(TourBooking.objects),
+        id=booking_id,
+    )
+    if booking.tourday.tour_offer.tour.supplier_id != supplier.id:
         return Response(
             {"detail": "Not authorized to confirm payment for this booking."},
             status=status.HTTP_403_FORBIDDEN,
         )
 
-    booking.paid = True
-    booking.save()
+    with transaction.atomic():
+        # counted once however often the payment is confirmed
+        if TourBooking.objects.filter(pk=booking.pk, paid=False).update(paid=True):
+            stats.record(booking, supplier.id, paid=True)
+        booking.paid = True
+        notifications = NotificationBatch()
+        notifications.add(booking.customer.user_id, "Tour Booking got paid")
+        notifications.add(supplier.user_id, "Tour Booking got paid")
+        notifications.send()
     serializer = TourBookingSerializer(booking)
-    Notification.objects.create(
-        user=booking.customer.user, message="Tour Booking got paid"
-    )
-    Notification.objects.create(
-        user=booking.tourday.tour_offer.tour.supplier.user,
-        message="Tour Booking got paid",
-    )
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
@@ -494,186 +467,77 @@ def fill_missing_months(data, value_key):
     return result
 
 
-@api_view(["GET"])
-@permission_classes([IsAuthenticated])
-def bookings_per_month(request):
-    supplier = request.user.supplier
-    start_of_year = timezone.now().replace(month=1, day=1)
-
-    # Aggregating bookings per month for activities
-    activity_bookings = (
-        ActivityBooking.objects.filter(
-            period__activity_offer__activity__supplier=supplier,
-            confirmed=True,
-            created_at__gte=start_of_year,
-        )
-        .annotate(month=ExtractMonth("created_at"))
+def monthly_stats(supplier, value):
+    """
+    The supplier's rollup rows of the year summed per month, twelve rows
+    at most.
+    """
+    start_of_year = timezone.localdate().replace(month=1, day=1)
+    return (
+        SupplierDailyStats.objects.filter(supplier=supplier, date__gte=start_of_year)
+        .annotate(month=ExtractMonth("date"))
         .values("month")
-        .annotate(count=Count("id"))
+        .annotate(value=Sum(value))
         .order_by("month")
     )
 
-    # Aggregating bookings per month for packages
-    package_bookings = (
-        PackageBooking.objects.filter(
-            package_offer__package__supplier=supplier,
-            confirmed=True,
-            created_at__gte=start_of_year,
-        )
-        .annotate(month=ExtractMonth("created_at"))
-        .values("month")
-        .annotate(count=Count("id"))
-        .order_by("month")
-    )
-
-    # Aggregating bookings per month for tours
-    tour_bookings = (
-        TourBooking.objects.filter(
-            tourday__tour_offer__tour__supplier=supplier,
-            confirmed=True,
-            created_at__gte=start_of_year,
-        )
-        .annotate(month=ExtractMonth("created_at"))
-        .values("month")
-        .annotate(count=Count("id"))
-        .order_by("month")
-    )
 
-    # Combine all bookings data and fill in missing months
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def bookings_per_month(request):
+    supplier = request.user.supplier
+    # confirmed bookings by the month they were made in
     combined_data = fill_missing_months(
-        list(activity_bookings) + list(package_bookings) + list(tour_bookings),
-        value_key="count",
+        monthly_stats(supplier, "confirmed"), value_key="value"
     )
-
-    # Convert dictionary to list of tuples sorted by month
-    combined_data_sorted = sorted(combined_data.items())
-
-    return Response(combined_data_sorted)
+    return Response(sorted(combined_data.items()))
 
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def customers_per_month(request):
     supplier = request.user.supplier
-    start_of_year = timezone.now().replace(month=1, day=1)
-
-    # Aggregating customer IDs per month for activities
-    activity_customers = (
-        ActivityBooking.objects.filter(
-            period__activity_offer__activity__supplier=supplier,
-            confirmed=True,
-            created_at__gte=start_of_year,
-        )
-        .annotate(month=ExtractMonth("created_at"))
-        .values("month", "customer__user__id")
-        .order_by("month")
-    )
-
-    # Aggregating customer IDs per month for packages
-    package_customers = (
-        PackageBooking.objects.filter(
-            package_offer__package__supplier=supplier,
-            confirmed=True,
-            created_at__gte=start_of_year,
-        )
-        .annotate(month=ExtractMonth("created_at"))
-        .values("month", "customer__user__id")
-        .order_by("month")
-    )
-
-    # Aggregating customer IDs per month for tours
-    tour_customers = (
-        TourBooking.objects.filter(
-            tourday__tour_offer__tour__supplier=supplier,
-            confirmed=True,
-            created_at__gte=start_of_year,
-        )
-        .annotate(month=ExtractMonth("created_at"))
-        .values("month", "customer__user__id")
-        .order_by("month")
-    )
-
-    # Combine all customer data
-    combined_customers = (
-        list(activity_customers) + list(package_customers) + list(tour_customers)
-    )
-
-    # Use a dictionary to count unique customers per month
-    monthly_customers = {}
-    for item in combined_customers:
-        month = item["month"]
-        customer_id = item["customer__user__id"]
-        if month not in monthly_customers:
-            monthly_customers[month] = set()
-        monthly_customers[month].add(customer_id)
-
-    # Convert the set of customer IDs to counts
-    monthly_customer_counts = {
-        month: len(customer_set) for month, customer_set in monthly_customers.items()
-    }
-
-    # Fill in missing months with 0
-    full_monthly_counts = {
-        month: monthly_customer_counts.get(month, 0) for month in range(1, 13)
-    }
-
-    # Convert to list of tuples sorted by month
-    combined_data_sorted = sorted(full_monthly_counts.items())
-
-    return Response(combined_data_sorted)
+    start_of_year = timezone.localdate().replace(month=1, day=1)
+    # distinct customers of the confirmed bookings, counted by the database
+    # or, with ?approximate=1, estimated from the monthly sketches
+    if request.query_params.get("approximate") in ("1", "true"):
+        counts = stats.approximate_customers_per_month(supplier, start_of_year)
+    else:
+        counts = stats.customers_per_month(supplier, start_of_year)
+    return Response([(month, counts.get(month, 0)) for month in range(1, 13)])
 
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def sales_per_month(request):
     supplier = request.user.supplier
-    start_of_year = timezone.now().replace(month=1, day=1)
-
-    # Aggregating sales per month for activities
-    activity_sales = (
-        ActivityBooking.objects.filter(
-            period__activity_offer__activity__supplier=supplier,
-            confirmed=True,
-            created_at__gte=start_of_year,
-        )
-        .annotate(month=ExtractMonth("created_at"))
-        .annotate(sales=Sum(F("quantity") * F("period__activity_offer__price")))
-        .values("month", "sales")
-        .order_by("month")
+    # what the confirmed bookings of each month were sold for
+    combined_sales = fill_missing_months(
+        monthly_stats(supplier, "revenue"), value_key="value"
     )
+    return Response(sorted(combined_sales.items()))
 
-    # Aggregating sales per month for packages
-    package_sales = (
-        PackageBooking.objects.filter(
-            package_offer__package__supplier=supplier,
-            confirmed=True,
-            created_at__gte=start_of_year,
-        )
-        .annotate(month=ExtractMonth("created_at"))
-        .annotate(sales=Sum(F("quantity") * F("package_offer__price")))
-        .values("month", "sales")
-        .order_by("month")
-    )
 
-    # Aggregating sales per month for tours
-    tour_sales = (
-        TourBooking.objects.filter(
-            tourday__tour_offer__tour__supplier=supplier,
-            confirmed=True,
-            created_at__gte=start_of_year,
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def supplier_analytics(request):
+    """
+    ?metric= of the supplier's bookings per ?granularity= period from
+    ?from= to ?to=, a series per booking type. ?approximate=1 estimates
+    monthly customers from the sketches.
+    """
+    try:
+        supplier = request.user.supplier
+    except Supplier.DoesNotExist:
+        return Response(
+            {"detail": "You are not authorized to view this information."}, status=403
         )
-        .annotate(month=ExtractMonth("created_at"))
-        .annotate(sales=Sum(F("quantity") * F("tourday__tour_offer__price")))
-        .values("month", "sales")
-        .order_by("month")
-    )
-
-    # Combine all sales data and fill in missing months
-    combined_sales = fill_missing_months(
-        list(activity_sales) + list(package_sales) + list(tour_sales), value_key="sales"
+    try:
+        day_from, day_to, granularity, metric, approximate = analytics.parse_query(
+            request
+        )
+    except analytics.InvalidQuery as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(
+        analytics.series(supplier, day_from, day_to, granularity, metric, approximate)
     )
-
-    # Convert dictionary to list of tuples sorted by month
-    combined_sales_sorted = sorted(combined_sales.items())
-
-    return Response(combined_sales_sorted)
@@ -3,27 +3,34 @@ from .models import FavoriteActivity, FavoriteTour, FavoritePackage
 from activities.serializers import ActivitySerializer
 from tours.serializers import TourSerializer
 from packages.serializers import PackageSerializer
+from api.eager import EagerLoadingMixin
 
 
-class FavoriteActivitySerializer(serializers.ModelSerializer):
+class FavoriteActivitySerializer(EagerLoadingMixin, serializers.ModelSerializer):
     activity = ActivitySerializer(read_only=True)
 
+    nested_eager_loading = {'activity': ActivitySerializer}
+
     class Meta:
         model = FavoriteActivity
         fields = ['activity']
 
 
-class FavoriteTourSerializer(serializers.ModelSerializer):
+class FavoriteTourSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     tour = TourSerializer(read_only=True)
 
+    nested_eager_loading = {'tour': TourSerializer}
+
     class Meta:
         model = FavoriteTour
         fields = ['tour']
 
 
-class FavoritePackageSerializer(serializers.ModelSerializer):
+class FavoritePackageSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     package = PackageSerializer(read_only=True)
 
+    nested_eager_loading = {'package': PackageSerializer}
+
     class Meta:
         model = FavoritePackage
         fields = ['package']
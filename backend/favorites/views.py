@@ -16,9 +16,12 @@ User = get_user_model()
 def all_favorites(request):
     user = request.user
 
-    favorite_activities = FavoriteActivity.objects.filter(user=user)
-    favorite_tours = FavoriteTour.objects.filter(user=user)
-    favorite_packages = FavoritePackage.objects.filter(user=user)
+    favorite_activities = FavoriteActivitySerializer.setup_eager_loading(
+        FavoriteActivity.objects.filter(user=user))
+    favorite_tours = FavoriteTourSerializer.setup_eager_loading(
+        FavoriteTour.objects.filter(user=user))
+    favorite_packages = FavoritePackageSerializer.setup_eager_loading(
+        FavoritePackage.objects.filter(user=user))
 
     activity_serializer = FavoriteActivitySerializer(favorite_activities, many=True)
     tour_serializer = FavoriteTourSerializer(favorite_tours, many=True)
@@ -0,0 +1,31 @@
+from django.db import transaction
+
+from .models import Notification
+
+
+class NotificationBatch:
+    """
+    Collects the notifications of a request and writes them with a single
+    INSERT once the current transaction commits, so nothing is sent for a
+    booking that rolled back. Recipients are users or user ids, resolve
+    them with select_related on the query that loaded the booking.
+    """
+
+    def __init__(self):
+        self.notifications = []
+
+    def add(self, user, message):
+        user_id = getattr(user, "pk", user)
+        self.notifications.append(Notification(user_id=user_id, message=message))
+
+    def send(self):
+        """
+        Call inside the transaction the notifications belong to, outside
+        of one (autocommit) they are written right away.
+        """
+        notifications, self.notifications = self.notifications, []
+        if notifications:
+            transaction.on_commit(
+                lambda: Notification.objects.bulk_create(notifications)
+            )
+        return len(notifications)
@@ -1,3 +1,40 @@
+from django.db import transaction
 from django.test import TestCase
 
-# Create your tests here.
+from users.models import CustomUser
+from .dispatch import NotificationBatch
+from .models import Notification
+
+
+class NotificationBatchTests(TestCase):
+    def setUp(self):
+        self.users = [
+            CustomUser.objects.create_user(username=name) for name in ["a", "b"]
+        ]
+
+    def test_written_in_one_insert_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                batch = NotificationBatch()
+                batch.add(self.users[0], "Booking created")
+                batch.add(self.users[1].pk, "New booking")
+                self.assertEqual(batch.send(), 2)
+                self.assertFalse(Notification.objects.exists())
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(
+            list(Notification.objects.order_by("id").values_list("user", "message")),
+            [(self.users[0].pk, "Booking created"), (self.users[1].pk, "New booking")],
+        )
+
+    def test_nothing_written_on_rollback(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    batch = NotificationBatch()
+                    batch.add(self.users[0], "Booking created")
+                    batch.send()
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertFalse(Notification.objects.exists())
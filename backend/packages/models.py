@@ -14,6 +14,9 @@ class Package(models.Model):
     description = models.TextField()
     duration = models.CharField(max_length=50)  # e.g., "8 hours"
     created_at = models.DateTimeField(auto_now_add=True)
+    # also bumped when a child row (offers, itinerary, faqs...) changes,
+    # the detail endpoint's ETag/Last-Modified are derived from it
+    updated_at = models.DateTimeField(auto_now=True)
     available_from = models.DateField()
     available_to = models.DateField()
     categories = models.ManyToManyField(Category, related_name="packages", blank=True)
@@ -51,6 +54,9 @@ class Package(models.Model):
     def __str__(self):
         return self.title
 
+    class Meta:
+        indexes = [models.Index(fields=["created_at", "id"])]
+
 
 class PackageOffer(models.Model):
     package = models.ForeignKey(
@@ -70,6 +76,10 @@ class PackageDay(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField()
 
+    class Meta:
+        # per offer date range scans (bookings, day listings, calendar)
+        indexes = [models.Index(fields=["package_offer", "day"])]
+
     def __str__(self):
         return f"{self.package_offer.package.title} - {self.day}"
 
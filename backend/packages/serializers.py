@@ -1,3 +1,4 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 from .models import (
     Package,
@@ -10,6 +11,17 @@ from .models import (
     PackageOffer,
 )
 from location.serializers import LocationSerializer
+from api.eager import EagerLoadingMixin, SparseFieldsMixin
+from booking.inventory import AvailableField
+
+PACKAGE_PREFETCH = [
+    "categories",
+    "included_set",
+    "excluded_set",
+    "faq_set",
+    "catalog_set",
+    "itinerary_step_set",
+]
 
 
 class IncludedSerializer(serializers.ModelSerializer):
@@ -42,7 +54,7 @@ class ItineraryStepSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class OffPackageSerializer(serializers.ModelSerializer):
+class OffPackageSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     included_items = IncludedSerializer(
         many=True, read_only=True, source="included_set"
     )
@@ -56,20 +68,25 @@ class OffPackageSerializer(serializers.ModelSerializer):
         many=True, read_only=True, source="itinerary_step_set"
     )
 
+    select_related_fields = ["location"]
+    prefetch_related_fields = PACKAGE_PREFETCH
+
     class Meta:
         model = Package
         fields = "__all__"
 
 
-class PackageOfferSerializer(serializers.ModelSerializer):
+class PackageOfferSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     package = OffPackageSerializer()
 
+    nested_eager_loading = {"package": OffPackageSerializer}
+
     class Meta:
         model = PackageOffer
         fields = ["id", "title", "price", "stock", "package"]
 
 
-class PackageSerializer(serializers.ModelSerializer):
+class PackageSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     included_items = IncludedSerializer(
         many=True, read_only=True, source="included_set"
     )
@@ -84,14 +101,46 @@ class PackageSerializer(serializers.ModelSerializer):
     )
     offers = PackageOfferSerializer(many=True, read_only=True)
 
+    select_related_fields = ["location"]
+    prefetch_related_fields = PACKAGE_PREFETCH + [
+        Prefetch("offers", queryset=PackageOffer.objects.order_by("id"))
+    ]
+    full_row_fields = ["offers"]
+
     class Meta:
         model = Package
         fields = "__all__"
 
 
-class PackageDaySerializer(serializers.ModelSerializer):
+class PackageDaySerializer(EagerLoadingMixin, serializers.ModelSerializer):
     package_offer = PackageOfferSerializer()
+    # stock minus the active checkout holds
+    available = AvailableField()
+
+    nested_eager_loading = {"package_offer": PackageOfferSerializer}
 
     class Meta:
         model = PackageDay
         fields = "__all__"
+
+
+# the listing / homepage card, the ?fields= and ?expand= parameters switch
+# listings to PackageSerializer narrowed to the requested fields
+class PackageCardSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    location = LocationSerializer()
+
+    select_related_fields = ["location"]
+
+    class Meta:
+        model = Package
+        fields = [
+            "id",
+            "title",
+            "image",
+            "duration",
+            "location",
+            "featured",
+            "available_from",
+            "available_to",
+            "created_at",
+        ]
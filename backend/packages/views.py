@@ -1,5 +1,9 @@
 from .models import Package, PackageDay, PackageOffer
-from .serializers import PackageSerializer, PackageDaySerializer
+from .serializers import (
+    PackageSerializer,
+    PackageCardSerializer,
+    PackageDaySerializer,
+)
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
@@ -7,6 +11,12 @@ from rest_framework import status
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from django.utils import timezone
 from datetime import datetime
+from api.pagination import KeysetPagination, InvalidCursor
+from api.eager import get_listing_serializer, serialize_listing
+from api.conditional import conditional_detail
+from api.calendar import daily_summary, offer_calendar
+from booking.inventory import block, decrement, with_available, OutOfStock
+from booking.models import StockMovement
 
 
 @api_view(["POST"])
@@ -38,15 +48,13 @@ def block_package_day(request):
     # Fetch all package days on the specified day for this package
     package_days = PackageDay.objects.filter(package_offer__package=package, day=day)
 
-    if not package_days.exists():
+    # Set the stock of all of them to 0, the ledger records what each had
+    if not block(package_days):
         return Response(
             {"error": "No package days found for the specified day."},
             status=status.HTTP_404_NOT_FOUND,
         )
 
-    # Set the stock of all package days on this day to 0
-    package_days.update(stock=0)
-
     return Response(
         {"success": f"All package days on {day_str} have been blocked."},
         status=status.HTTP_200_OK,
@@ -59,7 +67,7 @@ def reserve_package(request):
     supplier = request.user.supplier
     package_offer_id = request.data.get("package_offer")
     package_day_id = request.data.get("package_day")
-    number_of_reservations = int(request.data.get("number_of_reservations", 0))
+    number_of_reservations = request.data.get("number_of_reservations", 0)
 
     # Fetch the package offer
     package_offer = get_object_or_404(PackageOffer, id=package_offer_id)
@@ -72,18 +80,28 @@ def reserve_package(request):
         )
 
     # Fetch the package day
-    package_day = get_object_or_404(PackageDay, id=package_day_id)
+    package_day = get_object_or_404(
+        PackageDay, id=package_day_id, package_offer=package_offer
+    )
 
-    # Check if there is enough stock
-    if package_day.stock < number_of_reservations:
+    # Deduct the number of reservations from the stock if there is enough
+    try:
+        decrement(
+            PackageDay,
+            package_day.pk,
+            number_of_reservations,
+            reason=StockMovement.RESERVE,
+        )
+    except OutOfStock:
         return Response(
             {"error": "Not enough stock available for this package day."},
             status=status.HTTP_400_BAD_REQUEST,
         )
-
-    # Deduct the number of reservations from the stock
-    package_day.stock -= number_of_reservations
-    package_day.save()
+    except (TypeError, ValueError):
+        return Response(
+            {"error": "number_of_reservations must be a number of at least 1."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
     return Response(
         {"success": "Reservation completed successfully."}, status=status.HTTP_200_OK
@@ -94,24 +112,39 @@ def reserve_package(request):
 @permission_classes([AllowAny])
 def get_packages(request):
     current_time = timezone.now()
-    packages = Package.objects.filter(available_to__gte=current_time)[:20]
-    serializer = PackageSerializer(packages, many=True)
-    return Response(serializer.data)
+    packages = Package.objects.filter(available_to__gte=current_time)
+    return Response(
+        serialize_listing(
+            request, PackageCardSerializer, PackageSerializer, packages, limit=20
+        )
+    )
 
 
 @api_view(["GET"])
 @permission_classes([AllowAny])
 def get_all_packages(request):
     current_time = timezone.now()
-    packages = Package.objects.filter(available_to__gte=current_time)
-    serializer = PackageSerializer(packages, many=True)
-    return Response(serializer.data)
+    serializer_class, fields = get_listing_serializer(
+        request, PackageCardSerializer, PackageSerializer
+    )
+    packages = serializer_class.plan_queryset(
+        Package.objects.filter(available_to__gte=current_time), fields
+    )
+    # paginated by (created_at, id) so deep pages cost the same as the first
+    paginator = KeysetPagination()
+    try:
+        page = paginator.paginate_queryset(packages, request)
+    except InvalidCursor as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = serializer_class(page, many=True, fields=fields)
+    return paginator.get_paginated_response(serializer.data)
 
 
+@conditional_detail(Package)
 @api_view(["GET"])
 @permission_classes([AllowAny])
 def get_package(request, pk):
-    package = Package.objects.get(pk=pk)
+    package = PackageSerializer.setup_eager_loading(Package.objects).get(pk=pk)
     serializer = PackageSerializer(package)
     return Response(serializer.data)
 
@@ -121,10 +154,27 @@ def get_package(request, pk):
 def get_package_days(request, package_offer_id):
     try:
         package_offer = PackageOffer.objects.get(pk=package_offer_id)
-        package_days = PackageDay.objects.filter(package_offer=package_offer)
+        package_days = PackageDaySerializer.setup_eager_loading(
+            with_available(PackageDay.objects.filter(package_offer=package_offer))
+        )
         serializer = PackageDaySerializer(package_days, many=True)
         return Response(serializer.data)
     except PackageOffer.DoesNotExist:
         return Response(
             {"error": "Package offer not found."}, status=status.HTTP_404_NOT_FOUND
         )
+
+
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def get_package_offer_calendar(request, offer_id):
+    return offer_calendar(
+        request,
+        PackageOffer.objects.all(),
+        offer_id,
+        lambda offer, day_from, day_to: daily_summary(
+            PackageDay.objects.filter(
+                package_offer=offer, day__range=(day_from, day_to)
+            )
+        ),
+    )
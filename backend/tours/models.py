@@ -15,6 +15,9 @@ class Tour(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     requests = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # also bumped when a child row (offers, itinerary, faqs...) changes,
+    # the detail endpoint's ETag/Last-Modified are derived from it
+    updated_at = models.DateTimeField(auto_now=True)
     available_from = models.DateField()
     available_to = models.DateField()
     categories = models.ManyToManyField(Category, related_name="tours", blank=True)
@@ -55,6 +58,7 @@ class Tour(models.Model):
 
     class Meta:
         verbose_name_plural = "tours"
+        indexes = [models.Index(fields=["created_at", "id"])]
 
 
 class TourOffer(models.Model):
@@ -73,6 +77,10 @@ class TourDay(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     tour_offer = models.ForeignKey(TourOffer, on_delete=models.CASCADE)
 
+    class Meta:
+        # per offer date range scans (day listings, calendar)
+        indexes = [models.Index(fields=["tour_offer", "day"])]
+
     def __str__(self):
         return f"{self.tour_offer.tour.title} - {self.day}"
 
@@ -1,3 +1,4 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 from .models import (
     Tour,
@@ -10,6 +11,17 @@ from .models import (
     TourOffer,
 )
 from location.serializers import LocationSerializer
+from api.eager import EagerLoadingMixin, SparseFieldsMixin
+from booking.inventory import AvailableField
+
+TOUR_PREFETCH = [
+    "categories",
+    "included_set",
+    "excluded_set",
+    "faq_set",
+    "catalog_set",
+    "itinerary_steps",
+]
 
 
 class IncludedSerializer(serializers.ModelSerializer):
@@ -42,7 +54,7 @@ class ItineraryStepSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class OffTourSerializer(serializers.ModelSerializer):
+class OffTourSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     included_items = IncludedSerializer(
         many=True, read_only=True, source="included_set"
     )
@@ -57,20 +69,25 @@ class OffTourSerializer(serializers.ModelSerializer):
         many=True, read_only=True, source="itinerary_steps"
     )
 
+    select_related_fields = ["location"]
+    prefetch_related_fields = TOUR_PREFETCH
+
     class Meta:
         model = Tour
         fields = "__all__"
 
 
-class TourOfferSerializer(serializers.ModelSerializer):
+class TourOfferSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     tour = OffTourSerializer()
 
+    nested_eager_loading = {"tour": OffTourSerializer}
+
     class Meta:
         model = TourOffer
         fields = ["id", "title", "price", "stock", "tour"]
 
 
-class TourSerializer(serializers.ModelSerializer):
+class TourSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     included_items = IncludedSerializer(
         many=True, read_only=True, source="included_set"
     )
@@ -86,14 +103,46 @@ class TourSerializer(serializers.ModelSerializer):
     )
     offers = TourOfferSerializer(many=True, read_only=True, source="tour_offer")
 
+    select_related_fields = ["location"]
+    prefetch_related_fields = TOUR_PREFETCH + [
+        Prefetch("tour_offer", queryset=TourOffer.objects.order_by("id"))
+    ]
+    full_row_fields = ["tour_offer"]
+
     class Meta:
         model = Tour
         fields = "__all__"
 
 
-class TourDaySerializer(serializers.ModelSerializer):
+class TourDaySerializer(EagerLoadingMixin, serializers.ModelSerializer):
     tour_offer = TourOfferSerializer()
+    # stock minus the active checkout holds
+    available = AvailableField()
+
+    nested_eager_loading = {"tour_offer": TourOfferSerializer}
 
     class Meta:
         model = TourDay
         fields = "__all__"
+
+
+# the listing / homepage card, the ?fields= and ?expand= parameters switch
+# listings to TourSerializer narrowed to the requested fields
+class TourCardSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    location = LocationSerializer()
+
+    select_related_fields = ["location"]
+
+    class Meta:
+        model = Tour
+        fields = [
+            "id",
+            "title",
+            "image",
+            "price",
+            "location",
+            "featured",
+            "available_from",
+            "available_to",
+            "created_at",
+        ]
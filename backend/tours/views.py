@@ -1,5 +1,5 @@
 from .models import Tour, TourDay, TourOffer
-from .serializers import TourSerializer, TourDaySerializer
+from .serializers import TourSerializer, TourCardSerializer, TourDaySerializer
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
@@ -7,6 +7,12 @@ from rest_framework import status
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from datetime import datetime
+from api.pagination import KeysetPagination, InvalidCursor
+from api.eager import get_listing_serializer, serialize_listing
+from api.conditional import conditional_detail
+from api.calendar import daily_summary, offer_calendar
+from booking.inventory import block, decrement, with_available, OutOfStock
+from booking.models import StockMovement
 
 
 @api_view(["POST"])
@@ -15,7 +21,7 @@ def reserve_tour(request):
     supplier = request.user.supplier
     tour_offer_id = request.data.get("tour_offer")
     tour_day_id = request.data.get("tour_day")
-    number_of_reservations = int(request.data.get("number_of_reservations", 0))
+    number_of_reservations = request.data.get("number_of_reservations", 0)
 
     # Fetch the tour offer
     tour_offer = get_object_or_404(TourOffer, id=tour_offer_id)
@@ -28,18 +34,26 @@ def reserve_tour(request):
         )
 
     # Fetch the tour day
-    tour_day = get_object_or_404(TourDay, id=tour_day_id)
+    tour_day = get_object_or_404(TourDay, id=tour_day_id, tour_offer=tour_offer)
 
-    # Check if there is enough stock
-    if tour_day.stock < number_of_reservations:
+    # Deduct the number of reservations from the stock if there is enough
+    try:
+        decrement(
+            TourDay,
+            tour_day.pk,
+            number_of_reservations,
+            reason=StockMovement.RESERVE,
+        )
+    except OutOfStock:
         return Response(
             {"error": "Not enough stock available for this tour day."},
             status=status.HTTP_400_BAD_REQUEST,
         )
-
-    # Deduct the number of reservations from the stock
-    tour_day.stock -= number_of_reservations
-    tour_day.save()
+    except (TypeError, ValueError):
+        return Response(
+            {"error": "number_of_reservations must be a number of at least 1."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
     return Response(
         {"success": "Reservation completed successfully."}, status=status.HTTP_200_OK
@@ -75,15 +89,13 @@ def block_tourday(request):
     # Fetch all tour days on the specified day for this tour
     tour_days = TourDay.objects.filter(tour_offer__tour=tour, day=day)
 
-    if not tour_days.exists():
+    # Set the stock of all of them to 0, the ledger records what each had
+    if not block(tour_days):
         return Response(
             {"error": "No tour days found for the specified day."},
             status=status.HTTP_404_NOT_FOUND,
         )
 
-    # Set the stock of all tour days on this day to 0
-    tour_days.update(stock=0)
-
     return Response(
         {"success": f"All tour days on {day_str} have been blocked."},
         status=status.HTTP_200_OK,
@@ -94,24 +106,39 @@ def block_tourday(request):
 @permission_classes([AllowAny])
 def get_tours(request):
     current_time = timezone.now()
-    packages = Tour.objects.filter(available_to__gte=current_time)[:20]
-    serializer = TourSerializer(packages, many=True)
-    return Response(serializer.data)
+    packages = Tour.objects.filter(available_to__gte=current_time)
+    return Response(
+        serialize_listing(
+            request, TourCardSerializer, TourSerializer, packages, limit=20
+        )
+    )
 
 
 @api_view(["GET"])
 @permission_classes([AllowAny])
 def get_all_tours(request):
     current_time = timezone.now()
-    packages = Tour.objects.filter(available_to__gte=current_time)
-    serializer = TourSerializer(packages, many=True)
-    return Response(serializer.data)
+    serializer_class, fields = get_listing_serializer(
+        request, TourCardSerializer, TourSerializer
+    )
+    packages = serializer_class.plan_queryset(
+        Tour.objects.filter(available_to__gte=current_time), fields
+    )
+    # paginated by (created_at, id) so deep pages cost the same as the first
+    paginator = KeysetPagination()
+    try:
+        page = paginator.paginate_queryset(packages, request)
+    except InvalidCursor as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = serializer_class(page, many=True, fields=fields)
+    return paginator.get_paginated_response(serializer.data)
 
 
+@conditional_detail(Tour)
 @api_view(["GET"])
 @permission_classes([AllowAny])
 def get_tour(request, pk):
-    package = Tour.objects.get(pk=pk)
+    package = TourSerializer.setup_eager_loading(Tour.objects).get(pk=pk)
     serializer = TourSerializer(package)
     return Response(serializer.data)
 
@@ -121,10 +148,25 @@ def get_tour(request, pk):
 def get_tour_days(request, tour_offer_id):
     try:
         tour_offer = TourOffer.objects.get(pk=tour_offer_id)
-        tour_days = TourDay.objects.filter(tour_offer=tour_offer)
+        tour_days = TourDaySerializer.setup_eager_loading(
+            with_available(TourDay.objects.filter(tour_offer=tour_offer))
+        )
         serializer = TourDaySerializer(tour_days, many=True)
         return Response(serializer.data)
     except TourOffer.DoesNotExist:
         return Response(
             {"error": "Tour offer not found."}, status=status.HTTP_404_NOT_FOUND
         )
+
+
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def get_tour_offer_calendar(request, offer_id):
+    return offer_calendar(
+        request,
+        TourOffer.objects.all(),
+        offer_id,
+        lambda offer, day_from, day_to: daily_summary(
+            TourDay.objects.filter(tour_offer=offer, day__range=(day_from, day_to))
+        ),
+    )
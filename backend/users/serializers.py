@@ -5,6 +5,8 @@ from location.serializers import LocationSerializer
 from location.models import Location
 from categories.serializers import CategorySerializer
 from categories.models import Category
+from api.eager import EagerLoadingMixin
+from api.recommendations import rebuild_for_customer
 
 User = get_user_model()
 
@@ -19,6 +21,7 @@ class UpdateCustomerPreferencesSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         instance.preferences.set(validated_data['preferences'])
         instance.save()
+        rebuild_for_customer(instance)
         return instance
 
 
@@ -32,6 +35,7 @@ class UpdateCustomerLocationsSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         instance.location.set(validated_data['location'])
         instance.save()
+        rebuild_for_customer(instance)
         return instance
 
 
@@ -103,10 +107,14 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ('id', 'phone', 'username', 'email', 'is_supplier', 'is_customer')
 
 
-class CustomerSerializer(serializers.ModelSerializer):
+class CustomerSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     location = LocationSerializer(many=True)
     preferences = CategorySerializer(many=True)
     user = UserSerializer()
+
+    select_related_fields = ['user']
+    prefetch_related_fields = ['location', 'preferences']
+
     class Meta:
         model = Customer
         fields = ('id', 'location', 'preferences', 'user')